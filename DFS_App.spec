@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('config.py', '.')],
-    hiddenimports=['master', 'node'],
+    hiddenimports=['master', 'node', 'follower'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
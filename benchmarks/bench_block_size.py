@@ -0,0 +1,56 @@
+"""
+Metadata cost of large files: fixed 1 MB blocks vs the size-based block size policy.
+
+Usage: python -m benchmarks.bench_block_size [files] [file_gb]
+  Plans and commits `files` (default 20) uploads of file_gb GB each (default 4)
+  on an in-process master with NUM_NODES registered (fake) nodes, once with
+  BLOCK_SIZE for every file and once with the block size BLOCK_SIZE_POLICY picks.
+  No chunk data moves; reports chunk count, UPLOAD_INIT + commit time, the size
+  of one file's DOWNLOAD_REQ plan and of the metadata snapshot.
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from config import BLOCK_SIZE, BLOCK_SIZE_POLICY
+from utils import block_size_for
+
+NUM_NODES = 12
+
+def run(files, filesize, block_size):
+    from master import MasterService
+    os.chdir(tempfile.mkdtemp()) # A fresh namespace
+    master = MasterService(port=0)
+    for i in range(NUM_NODES):
+        master.nodes[f"node_{i}"] = {'address': ('localhost', 7000 + i), 'last_heartbeat': time.time(),
+                                     'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+    start = time.perf_counter()
+    for f in range(files):
+        filename = f"video_{f:04d}.mkv"
+        plan = master._plan_upload({'filename': filename, 'filesize': filesize, 'block_size': block_size})
+        placed = [{'chunk_id': c['chunk_id'], 'nodes': c['nodes']} for c in plan['chunks']]
+        with master.lock:
+            reply = master._commit_upload({'filename': filename, 'filesize': filesize, 'block_size': block_size,
+                                           'chunks_placed': placed}, [], [])
+        assert reply['status'] == 'OK', reply
+    elapsed = time.perf_counter() - start
+    with master.lock:
+        plan_bytes = len(json.dumps(master._download_plan("video_0000.mkv")))
+        chunks = sum(len(meta['chunks']) for meta in master.files.values())
+    master.save_metadata()
+    return chunks, elapsed, plan_bytes, os.path.getsize(master.metadata_file)
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    filesize = int(float(sys.argv[2]) * 2**30) if len(sys.argv) > 2 else 4 * 2**30
+    logging.disable(logging.INFO)
+    print(f"{files} files of {filesize / 2**30:g} GB, {NUM_NODES} nodes")
+    print(f"{'block size':>12} {'chunks':>8} {'plan+commit s':>14} {'plan KB':>8} {'snapshot KB':>12}")
+    for block_size in (BLOCK_SIZE, block_size_for(filesize, BLOCK_SIZE_POLICY, BLOCK_SIZE)):
+        chunks, elapsed, plan_bytes, snapshot_bytes = run(files, filesize, block_size)
+        print(f"{block_size >> 20:>9} MB {chunks:>8} {elapsed:>14.2f} {plan_bytes / 1024:>8.1f} {snapshot_bytes / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Chunking throughput: fixed-size blocks vs content-defined (CDC) chunks.
+
+Usage: python -m benchmarks.bench_chunking [MB]
+  Splits `MB` (default 64) of random bytes held in memory, so only the
+  chunker is timed. CDC averages BLOCK_SIZE, as upload_file uses it.
+"""
+import io
+import random
+import sys
+import time
+from config import BLOCK_SIZE
+from utils import iter_cdc_chunks, iter_fixed_chunks
+
+def bench(name, chunker, data):
+    start = time.perf_counter()
+    sizes = [len(chunk) for chunk in chunker(io.BytesIO(data), BLOCK_SIZE)]
+    seconds = time.perf_counter() - start
+    mb = len(data) / 1024**2
+    print(f"{name:>6} {len(sizes):>7} {sum(sizes) / len(sizes) / 1024:>10.0f} {seconds:>8.3f} {mb / seconds:>8.1f}")
+
+def main():
+    mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    data = random.Random(0).randbytes(mb * 1024**2)
+    print(f"{mb} MB of random bytes, {BLOCK_SIZE // 1024} KB blocks")
+    print(f"{'mode':>6} {'chunks':>7} {'avg KB':>10} {'seconds':>8} {'MB/s':>8}")
+    bench('fixed', iter_fixed_chunks, data)
+    bench('cdc', iter_cdc_chunks, data)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compression ratio vs throughput for each chunk codec.
+
+Usage: python -m benchmarks.bench_compression [file ...]
+Without arguments a synthetic log + CSV corpus is used.
+"""
+import sys
+import time
+import random
+from config import BLOCK_SIZE
+from utils import available_codecs, compress_data, decompress_data
+
+def synthetic_corpus(size=8 * BLOCK_SIZE):
+    """Build log and CSV style text, roughly as compressible as real logs."""
+    rng = random.Random(42)
+    levels = ['INFO', 'WARNING', 'ERROR', 'DEBUG']
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        if i % 2 == 0:
+            line = (f"2024-01-{rng.randint(1, 28):02d} 12:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} - "
+                    f"Node-{rng.randint(1000, 9999)} - {rng.choice(levels)} - Served chunk "
+                    f"file_{rng.randint(0, 500)}.csv_chunk_{rng.randint(0, 64)}\n")
+        else:
+            line = f"{i},{rng.randint(0, 10**6)},{rng.random():.6f},user_{rng.randint(0, 1000)},OK\n"
+        parts.append(line)
+        total += len(line)
+        i += 1
+    return ''.join(parts).encode('utf-8')[:size]
+
+def split_chunks(data):
+    return [data[i:i + BLOCK_SIZE] for i in range(0, len(data), BLOCK_SIZE)]
+
+def bench_codec(codec, chunks):
+    raw_bytes = sum(len(c) for c in chunks)
+
+    start = time.perf_counter()
+    compressed = [compress_data(c, codec) for c in chunks]
+    compress_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored = [decompress_data(c, codec) for c in compressed]
+    decompress_secs = time.perf_counter() - start
+
+    assert restored == chunks, f"{codec} round trip mismatch"
+    stored_bytes = sum(len(c) for c in compressed)
+    mb = raw_bytes / (1024 * 1024)
+    return {
+        'codec': codec,
+        'ratio': raw_bytes / stored_bytes if stored_bytes else 0.0,
+        'compress_mbps': mb / compress_secs if compress_secs else float('inf'),
+        'decompress_mbps': mb / decompress_secs if decompress_secs else float('inf')
+    }
+
+def main():
+    if len(sys.argv) > 1:
+        data = b''
+        for path in sys.argv[1:]:
+            with open(path, 'rb') as f:
+                data += f.read()
+    else:
+        data = synthetic_corpus()
+
+    chunks = split_chunks(data)
+    print(f"Corpus: {len(data)} bytes in {len(chunks)} chunks of {BLOCK_SIZE} bytes")
+    print(f"{'codec':<8}{'ratio':>8}{'comp MB/s':>12}{'decomp MB/s':>14}")
+    for codec in available_codecs():
+        r = bench_codec(codec, chunks)
+        print(f"{r['codec']:<8}{r['ratio']:>8.2f}{r['compress_mbps']:>12.1f}{r['decompress_mbps']:>14.1f}")
+
+if __name__ == "__main__":
+    main()
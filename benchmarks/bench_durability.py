@@ -0,0 +1,61 @@
+"""
+Chunk write throughput and ack latency per durability mode (none, fsync, group).
+
+Usage: python -m benchmarks.bench_durability [writers] [chunks_per_writer] [chunk_kb]
+  writers (default 16) threads store chunks concurrently through a node's write
+  path (_save_chunk, as STORE_CHUNK does after receiving the data), each
+  chunks_per_writer (default 50) chunks of chunk_kb KB (default 256). Runs in
+  a temp directory, which should be on the disk under test.
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+MODES = ('none', 'fsync', 'group')
+
+def run(mode, writers, per_writer, data):
+    from node import NodeServer
+    node = NodeServer(f"bench_{mode}", 0, durability=mode)
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(w):
+        mine = []
+        for i in range(per_writer):
+            start = time.perf_counter()
+            node._save_chunk(f"w{w}_chunk_{i}", data, 'foreground')
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed, node.committers[0].get_stats()
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_writer = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    chunk_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.INFO)
+    data = os.urandom(chunk_kb * 1024)
+    print(f"{writers} writers x {per_writer} chunks of {chunk_kb} KB")
+    print(f"{'mode':>6} {'chunks/s':>9} {'MB/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'fsync batches':>14}")
+    for mode in MODES:
+        latencies, elapsed, commits = run(mode, writers, per_writer, data)
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+        batches = f"{commits['commit_batches']} (avg {commits['commit_batch_avg']})" if mode == 'group' else '-'
+        print(f"{mode:>6} {len(latencies) / elapsed:>9.0f} {len(latencies) * len(data) / elapsed / 2**20:>7.1f} "
+              f"{pct(0.5):>8.2f} {pct(0.99):>8.2f} {batches:>14}")
+
+if __name__ == "__main__":
+    main()
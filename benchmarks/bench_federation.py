@@ -0,0 +1,102 @@
+"""
+Metadata throughput of a federated namespace with 1, 2 and 4 master shards.
+
+Usage: python -m benchmarks.bench_federation [seconds] [clients]
+  seconds (default 5) is the length of each phase, clients (default 8) the number
+  of client processes. Clients create tiny inline files (UPLOAD_INLINE, a metadata
+  write) and then look them up (DOWNLOAD_REQ, a metadata read), routing each
+  filename to its shard with shard_of(). No storage nodes are involved.
+  Shards are separate processes, so they only scale with free CPU cores.
+"""
+import base64
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from utils import send_json, receive_json, shard_of
+
+SHARD_COUNTS = (1, 2, 4)
+PAYLOAD = base64.b64encode(b"x" * 64).decode('ascii')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def start_shards(count, workdir):
+    """One master process per shard; returns (processes, addresses) once all accept connections."""
+    shards = [('localhost', free_port()) for _ in range(count)]
+    procs = []
+    for index, (_, port) in enumerate(shards):
+        code = (f"import sys, logging; sys.path.insert(0, {ROOT!r}); logging.disable(logging.INFO); "
+                f"from master import MasterService; MasterService(port={port}, shard=({index}, {count})).start()")
+        procs.append(subprocess.Popen([sys.executable, '-c', code], cwd=workdir,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    for address in shards:
+        deadline = time.time() + 30
+        while True:
+            try:
+                socket.create_connection(address, timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+    return procs, shards
+
+def call(shards, filename, request):
+    with socket.create_connection(shards[shard_of(filename, len(shards))]) as sock:
+        send_json(sock, request)
+        return receive_json(sock)
+
+def create_worker(args):
+    """UPLOAD_INLINE new files for `seconds`; returns how many were committed."""
+    shards, worker, seconds = args
+    done = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        filename = f"w{worker}_{done}.txt"
+        reply = call(shards, filename, {'type': 'UPLOAD_INLINE', 'filename': filename,
+                                        'filesize': 64, 'data': PAYLOAD})
+        assert reply['status'] == 'OK', reply
+        done += 1
+    return done
+
+def lookup_worker(args):
+    """DOWNLOAD_REQ random files this worker created, for `seconds`; returns the count."""
+    shards, worker, seconds, created = args
+    rng = random.Random(worker)
+    done = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        filename = f"w{worker}_{rng.randrange(created)}.txt"
+        reply = call(shards, filename, {'type': 'DOWNLOAD_REQ', 'filename': filename})
+        assert reply['status'] == 'OK', reply
+        done += 1
+    return done
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{clients} client processes, {seconds:g}s per phase, {os.cpu_count()} CPU cores")
+    print(f"{'shards':>6} {'creates/s':>10} {'lookups/s':>10}")
+    for count in SHARD_COUNTS:
+        workdir = tempfile.mkdtemp()
+        procs, shards = start_shards(count, workdir)
+        try:
+            with Pool(clients) as pool:
+                created = pool.map(create_worker, [(shards, w, seconds) for w in range(clients)])
+                looked_up = pool.map(lookup_worker, [(shards, w, seconds, max(1, n)) for w, n in enumerate(created)])
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait()
+        print(f"{count:>6} {sum(created) / seconds:>10.0f} {sum(looked_up) / seconds:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Small-file commit cost: UPLOAD_INLINE commits, each saved like the master does.
+
+Usage: python -m benchmarks.bench_inline [files ...]
+  For each count (default 1000 2000 3000) commits that many inline files of
+  INLINE_THRESHOLD bytes on an in-process master in a fresh directory, saving
+  the metadata after every commit as handle_upload_inline does. Reports the
+  total time, the time of the last 100 commits and the snapshot size.
+"""
+import base64
+import logging
+import os
+import sys
+import tempfile
+import time
+from config import INLINE_THRESHOLD
+
+def run(files):
+    from master import MasterService
+    os.chdir(tempfile.mkdtemp()) # A fresh namespace
+    master = MasterService(port=0)
+    body = base64.b64encode(os.urandom(INLINE_THRESHOLD)).decode('ascii')
+    start = time.perf_counter()
+    tail_start = start
+    for i in range(files):
+        if i == files - 100:
+            tail_start = time.perf_counter()
+        with master.lock:
+            reply = master._commit_inline({'filename': f"small_{i:06d}.txt", 'filesize': INLINE_THRESHOLD,
+                                           'data': body}, [])
+            assert reply['status'] == 'OK', reply
+            master.save_metadata()
+    end = time.perf_counter()
+    return end - start, end - tail_start, os.path.getsize(master.metadata_file)
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 2000, 3000]
+    logging.disable(logging.INFO)
+    print(f"{'files':>7} {'total s':>8} {'last 100 ms/file':>17} {'snapshot KB':>12}")
+    for files in counts:
+        total, tail, snapshot = run(files)
+        print(f"{files:>7} {total:>8.2f} {tail / min(100, files) * 1000:>17.2f} {snapshot / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Master RAM per chunk: plain dict/list/str metadata (as json.load returns it)
+versus the compact ChunkTable the master now keeps.
+
+Usage: python -m benchmarks.bench_metadata_memory [num_chunks]
+"""
+import hashlib
+import json
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from metastore import ChunkTable
+
+CHUNKS_PER_FILE = 64
+NUM_NODES = 50
+
+def synthetic_metadata(num_chunks):
+    """A saved namespace as the master writes it: files, chunk_locations, chunk_checksums."""
+    rng = random.Random(0)
+    nodes = [f"node_{i}" for i in range(NUM_NODES)]
+    files, locations, checksums = {}, {}, {}
+    for f in range(-(-num_chunks // CHUNKS_PER_FILE)):
+        filename = f"dataset/part-{f:06d}.parquet"
+        chunk_ids = []
+        for i in range(min(CHUNKS_PER_FILE, num_chunks - f * CHUNKS_PER_FILE)):
+            cid = f"{filename}_chunk_{i}_{uuid.UUID(int=rng.getrandbits(128)).hex[:8]}"
+            chunk_ids.append(cid)
+            locations[cid] = rng.sample(nodes, 2)
+            checksums[cid] = hashlib.sha256(cid.encode()).hexdigest()
+        files[filename] = {'size': len(chunk_ids) << 20, 'chunks': chunk_ids, 'codec': 'none', 'chunking': 'fixed', 'version': 1}
+    return json.dumps({'files': files, 'chunk_locations': locations, 'chunk_checksums': checksums})
+
+def load_plain(raw):
+    """The previous layout: json.load output plus str-keyed refcount and dedup dicts."""
+    data = json.loads(raw)
+    refs, hash_index = {}, {}
+    for meta in data['files'].values():
+        for cid in meta['chunks']:
+            refs[cid] = refs.get(cid, 0) + 1
+            hash_index.setdefault(f"none:{data['chunk_checksums'][cid]}", cid)
+    return data, refs, hash_index
+
+def load_compact(raw):
+    """The master's load path: chunk records into a ChunkTable, files as ChunkLists."""
+    data = json.loads(raw)
+    table = ChunkTable()
+    table.locations.update(data.pop('chunk_locations'))
+    table.checksums.update(data.pop('chunk_checksums'))
+    hash_index = {}
+    for meta in data['files'].values():
+        meta['chunks'] = table.chunk_list(meta['chunks'])
+        table.add_refs(meta['chunks'])
+        for h in meta['chunks'].handles():
+            hash_index.setdefault(b'none:' + table.digest(h), h)
+    return data, table, hash_index
+
+def measure(loader, raw):
+    start = time.perf_counter()
+    loader(raw)
+    secs = time.perf_counter() - start # Timed without tracemalloc, which slows allocation
+    tracemalloc.start()
+    result = loader(raw)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, secs
+
+def main():
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    raw = synthetic_metadata(num_chunks)
+    print(f"{num_chunks} chunks in {-(-num_chunks // CHUNKS_PER_FILE)} files, 2 replicas over {NUM_NODES} nodes")
+    print(f"{'layout':8} {'bytes/chunk':>12} {'peak bytes/chunk':>17} {'load s':>8}")
+    for name, loader in (('plain', load_plain), ('compact', load_compact)):
+        result, current, peak, secs = measure(loader, raw)
+        print(f"{name:8} {current / num_chunks:12.0f} {peak / num_chunks:17.0f} {secs:8.2f}")
+        del result
+
+if __name__ == "__main__":
+    main()
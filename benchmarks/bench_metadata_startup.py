@@ -0,0 +1,92 @@
+"""
+Master startup time on a synthetic namespace: binary snapshot vs the old JSON file.
+
+Usage: python -m benchmarks.bench_metadata_startup [num_chunks] [--json]
+  num_chunks defaults to 10M. --json also times json.load of the equivalent
+  dfs_metadata.json (needs several GB of RAM above ~2M chunks).
+"""
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from metastore import ChunkTable, ChunkList, save_snapshot
+
+CHUNKS_PER_FILE = 64
+NUM_NODES = 50
+
+def synthetic_table(num_chunks):
+    """Fill a ChunkTable's columns directly; going through the views would dominate the run."""
+    rng = random.Random(0)
+    table = ChunkTable()
+    for i in range(NUM_NODES):
+        table.node_ids.intern(f"node_{i}")
+    num_files = -(-num_chunks // CHUNKS_PER_FILE)
+    for f in range(num_files):
+        table.names.intern(f"dataset/part-{f:07d}.parquet")
+    table._prefix = array('I', (h // CHUNKS_PER_FILE for h in range(num_chunks)))
+    table._number = array('I', (h % CHUNKS_PER_FILE for h in range(num_chunks)))
+    table._suffix = array('I', (rng.getrandbits(32) for _ in range(num_chunks)))
+    table._refs = array('I', bytes(4 * num_chunks))
+    table._digests = bytearray(os.urandom(32 * num_chunks))
+    pairs = [array('H', (a, b)).tobytes() for a in range(NUM_NODES) for b in range(NUM_NODES) if a != b]
+    table._locs = [rng.choice(pairs) for _ in range(num_chunks)]
+    table.locations.count = table.checksums.count = num_chunks
+    table._handles = None
+
+    files = {}
+    for f in range(num_files):
+        start = f * CHUNKS_PER_FILE
+        count = min(CHUNKS_PER_FILE, num_chunks - start)
+        files[table.names.strings[f]] = {'size': count << 20, 'chunks': ChunkList.from_runs(table, [start, count]),
+                                         'codec': 'none', 'chunking': 'fixed', 'version': 1}
+    return table, files
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    num_chunks = int(args[0]) if args else 10_000_000
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    logging.disable(logging.INFO)
+
+    start = time.perf_counter()
+    table, files = synthetic_table(num_chunks)
+    print(f"{num_chunks} chunks in {len(files)} files, generated in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    save_snapshot('dfs_metadata.bin', table, files, {})
+    print(f"binary snapshot: {os.path.getsize('dfs_metadata.bin') / num_chunks:6.1f} bytes/chunk, "
+          f"written in {time.perf_counter() - start:.1f}s")
+
+    if '--json' in sys.argv:
+        with open('legacy.json', 'w') as f:
+            json.dump({
+                'files': {name: dict(meta, chunks=list(meta['chunks'])) for name, meta in files.items()},
+                'chunk_locations': dict(table.locations.items()),
+                'chunk_checksums': dict(table.checksums)
+            }, f)
+    del table, files
+
+    from master import MasterService
+    start = time.perf_counter()
+    master = MasterService()
+    startup = time.perf_counter() - start
+    print(f"master startup from binary snapshot: {startup:.2f}s")
+
+    start = time.perf_counter()
+    master.chunk_locations.get(f"dataset/part-{0:07d}.parquet_chunk_0_00000000")
+    print(f"first lookup by chunk ID (builds the ID index): {time.perf_counter() - start:.2f}s")
+
+    if '--json' in sys.argv:
+        del master
+        start = time.perf_counter()
+        with open('legacy.json') as f:
+            json.load(f)
+        print(f"json.load of dfs_metadata.json alone: {time.perf_counter() - start:.2f}s "
+              f"({os.path.getsize('legacy.json') / num_chunks:.0f} bytes/chunk)")
+
+if __name__ == "__main__":
+    main()
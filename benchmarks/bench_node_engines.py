@@ -0,0 +1,100 @@
+"""
+Threaded vs asyncio storage node under many concurrent clients.
+
+Usage: python -m benchmarks.bench_node_engines [clients] [requests_per_client]
+  clients (default 1000) connect at once, each doing requests_per_client
+  (default 5) RETRIEVE_CHUNK round trips of a 64 KB chunk, a new connection
+  per request as in the real protocol. The node runs in its own process with
+  the configured NODE_BACKLOG and no master (its heartbeats just fail).
+  Reports throughput, latency percentiles, failed requests and the node's
+  peak thread count.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import psutil
+from utils import pack_json, read_json
+
+CHUNK_SIZE = 64 * 1024
+NUM_CHUNKS = 100
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def start_node(engine, workdir):
+    port = free_port()
+    storage = os.path.join(workdir, 'dfs_storage', 'node_bench')
+    os.makedirs(storage, exist_ok=True)
+    for i in range(NUM_CHUNKS):
+        with open(os.path.join(storage, f"chunk_{i}"), 'wb') as f:
+            f.write(os.urandom(CHUNK_SIZE))
+    code = (f"import sys, logging; sys.path.insert(0, {ROOT!r}); logging.disable(logging.WARNING); "
+            f"import node; node.{engine}('bench', {port}, master_port={free_port()}).start()")
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return proc, port
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+async def client(port, index, requests, latencies, failures):
+    for r in range(requests):
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection('localhost', port)
+            writer.write(pack_json({'type': 'RETRIEVE_CHUNK', 'chunk_id': f"chunk_{(index + r) % NUM_CHUNKS}"}))
+            header = await read_json(reader)
+            await reader.readexactly(header['size'])
+            writer.close()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures.append(time.perf_counter() - start)
+
+async def sample_threads(proc, peak, done):
+    process = psutil.Process(proc.pid)
+    while not done.is_set():
+        peak[0] = max(peak[0], process.num_threads())
+        await asyncio.sleep(0.05)
+
+async def run(port, proc, clients, requests):
+    latencies, failures, peak = [], [], [0]
+    done = asyncio.Event()
+    sampler = asyncio.create_task(sample_threads(proc, peak, done))
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, i, requests, latencies, failures) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampler
+    return latencies, failures, elapsed, peak[0]
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{clients} concurrent clients x {requests} requests of {CHUNK_SIZE >> 10} KB, {os.cpu_count()} CPU cores")
+    print(f"{'engine':>16} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7} {'threads':>8}")
+    for engine in ('NodeServer', 'AsyncNodeServer'):
+        proc, port = start_node(engine, tempfile.mkdtemp())
+        try:
+            latencies, failures, elapsed, threads = asyncio.run(run(port, proc, clients, requests))
+        finally:
+            proc.terminate()
+            proc.wait()
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else float('nan')
+        print(f"{engine:>16} {len(latencies) / elapsed:>8.0f} {pct(0.5):>8.1f} {pct(0.99):>8.1f} "
+              f"{pct(1.0):>8.1f} {len(failures):>7} {threads:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Per-node read balance: replicas in stored order vs load-aware ordering.
+
+Usage: python -m benchmarks.bench_read_balance [downloads] [readers]
+  Starts a master and NUM_NODES storage nodes in-process, stores one file with
+  REPLICATION_FACTOR replicas per chunk, then runs `downloads` (default 500)
+  downloads from `readers` (default 8) threads, each download a fresh client
+  as an independent reader would be. Reports the bytes every node served and
+  max/mean over the nodes holding replicas of the file (1.00 = perfectly even).
+  Load reports are HEARTBEAT_INTERVAL old, so short runs balance less evenly.
+"""
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+NUM_NODES = 6
+FILE_SIZE = 8 * 1024 * 1024
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def run(ordered, downloads, readers):
+    from master import MasterService
+    from node import NodeServer
+    from dfs_client import DFSClient
+
+    master = MasterService(port=free_port())
+    if not ordered:
+        master._read_order = lambda node_ids: node_ids # Stored order, as before
+    threading.Thread(target=master.start, daemon=True).start()
+    nodes = [NodeServer(f"bench_{ordered}_{i}", free_port(), master_port=master.port) for i in range(NUM_NODES)]
+    for node in nodes:
+        node.cache.max_bytes = 0 # Measure placement, not the chunk cache
+        threading.Thread(target=node.start, daemon=True).start()
+    while sum(1 for info in master.nodes.values() if info['status'] == 'ONLINE') < NUM_NODES:
+        time.sleep(0.1)
+
+    with open('bench.bin', 'wb') as f:
+        f.write(os.urandom(FILE_SIZE))
+    assert DFSClient(master_port=master.port).upload_file('bench.bin')
+    baseline = {node.node_id: node.served_bytes for node in nodes}
+    holders = {nid for cid in master.files['bench.bin']['chunks'] for nid in master.chunk_locations[cid]}
+
+    def read(i):
+        return DFSClient(master_port=master.port).download_file('bench.bin', f'out_{i % readers}.bin')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=readers) as pool:
+        assert all(pool.map(read, range(downloads)))
+    elapsed = time.perf_counter() - start
+    served = {node.node_id: node.served_bytes - baseline[node.node_id] for node in nodes}
+    master.running = False
+    for node in nodes:
+        node.running = False
+    return served, holders, elapsed
+
+def main():
+    downloads = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.WARNING)
+    print(f"{downloads} downloads of {FILE_SIZE >> 20} MB by {readers} readers, {NUM_NODES} nodes")
+    for ordered in (False, True):
+        served, holders, elapsed = run(ordered, downloads, readers)
+        loads = [served[node_id] for node_id in holders]
+        mean = sum(loads) / len(loads)
+        print(f"\n{'load-aware order' if ordered else 'stored order'}: {elapsed:.1f}s, "
+              f"{sum(1 for b in loads if b)} of {len(holders)} replica holders served reads, "
+              f"max/mean {max(loads) / mean:.2f}")
+        for node_id, size in sorted(served.items()):
+            print(f"  {node_id:>14} {size / 2**20:9.1f} MB")
+
+if __name__ == "__main__":
+    main()
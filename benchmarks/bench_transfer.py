@@ -0,0 +1,53 @@
+"""
+Chunk transfer throughput over a real socket, per chunk size.
+
+Usage: python -m benchmarks.bench_transfer [rounds]
+  Stores and retrieves chunks of 1, 8 and 64 MB (the block sizes
+  BLOCK_SIZE_POLICY can pick) on a threaded storage node in its own process,
+  through the client's STORE_CHUNK / RETRIEVE_CHUNK calls, `rounds` times each
+  (default 5). Both sides receive the chunk bytes with utils.recv_all.
+  Reports the median seconds and MB/s per direction.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from benchmarks.bench_node_engines import free_port, start_node
+from dfs_client import DFSClient
+
+CHUNK_SIZES = (1024**2, 8 * 1024**2, 64 * 1024**2)
+
+def timed(call, *args):
+    start = time.perf_counter()
+    result = call(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    proc, port = start_node('NodeServer', tempfile.mkdtemp())
+    client = DFSClient(master_port=free_port())
+    address = ('localhost', port)
+    print(f"{rounds} rounds per chunk size, threaded node on localhost")
+    print(f"{'chunk':>8} {'store s':>8} {'store MB/s':>11} {'fetch s':>8} {'fetch MB/s':>11}")
+    try:
+        for size in CHUNK_SIZES:
+            data = os.urandom(size)
+            stores, fetches = [], []
+            for r in range(rounds):
+                chunk_id = f"bench_{size}_{r}"
+                ok, seconds = timed(client._send_chunk, address, chunk_id, data)
+                assert ok, f"STORE_CHUNK {chunk_id} failed"
+                stores.append(seconds)
+                fetched, seconds = timed(client._fetch_chunk, address, chunk_id)
+                assert fetched == data, f"RETRIEVE_CHUNK {chunk_id} returned other bytes"
+                fetches.append(seconds)
+            store, fetch = statistics.median(stores), statistics.median(fetches)
+            mb = size / 1024**2
+            print(f"{mb:>5.0f} MB {store:>8.3f} {mb / store:>11.0f} {fetch:>8.3f} {mb / fetch:>11.0f}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
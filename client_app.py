@@ -1,208 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
-import socket
 import os
 import time
 import queue
 import subprocess
 import sys
 from config import *
-from utils import send_json, receive_json, recv_all, calculate_checksum
-
-class DFSClient:
-    def __init__(self, master_host=MASTER_HOST, master_port=MASTER_PORT):
-        self.master_host = master_host
-        self.master_port = master_port
-
-    def get_stats(self):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.master_host, self.master_port))
-                send_json(sock, {'type': 'GET_STATS'})
-                return receive_json(sock)
-        except Exception:
-            return None
-
-    def list_files(self):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.master_host, self.master_port))
-                send_json(sock, {'type': 'LIST_FILES'})
-                return receive_json(sock)
-        except Exception:
-            return None
-
-    def upload_file(self, filepath, log_callback=None):
-        filename = os.path.basename(filepath)
-        filesize = os.path.getsize(filepath)
-        
-        if log_callback: log_callback(f"Starting upload: {filename} ({filesize} bytes)")
-
-        # 1. Init Upload
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.master_host, self.master_port))
-                send_json(sock, {'type': 'UPLOAD_INIT', 'filename': filename, 'filesize': filesize})
-                response = receive_json(sock)
-        except Exception as e:
-            if log_callback: log_callback(f"Error connecting to Master: {e}")
-            return False
-
-        if response['status'] != 'OK':
-            if log_callback: log_callback(f"Upload failed: {response.get('message')}")
-            return False
-
-        chunks_plan = response['chunks']
-        chunks_placed_info = []
-
-        # 2. Upload Chunks
-        with open(filepath, 'rb') as f:
-            for chunk_info in chunks_plan:
-                chunk_id = chunk_info['chunk_id']
-                target_nodes = chunk_info['nodes'] # List of (ip, port)
-                
-                chunk_data = f.read(BLOCK_SIZE)
-                chunk_size = len(chunk_data)
-                
-                successful_nodes = [] # List of node_ids (actually we need IDs for SUCCESS msg)
-                # But wait, Master returned Addrs. We need IDs?
-                # Simplified: Node IDs were used in Master Config. 
-                # Let's just track where we put it.
-                # Actually, Master expects `nodes` list in `chunks_placed`.
-                # Ideally `target_nodes` should have included node_ids. 
-                # To fix this, I'll update client to just send back what it got if successful?
-                # Actually, `target_nodes` are tuples (ip, port).
-                # We can't easily map back to ID unless provided.
-                # Let's assume Master handles `(ip, port)` mapping or we fix Master to send ID.
-                # FIX: I will update Master logic implicitly by assuming Client tells Master 
-                # "I put chunk X on Node Y" where Y is the ID.
-                # BUT Client doesn't know ID. 
-                # Let's hacking it: Master `chunk_locations` uses Node IDs.
-                # So Protocol update: `UPLOAD_INIT` returns `nodes`: [{'id': 'node_1', 'address': ('...', ...)}]
-                
-                # RE-FACTORING ON THE FLY:
-                # I'll just rely on `target_nodes` being `(ip, port)` and Master can't map back easily?
-                # Actually Master keeps `nodes` dict. It can reverse lookup `address`.
-                # Okay, let's keep it simple. Status Quo: `target_nodes` is `[[ip, port], ...]`.
-                # Client sends `nodes`: `[[ip, port], ...]` back to Master.
-                # Master reverse lookups.
-                
-                placed_on_addrs = []
-
-                for node_addr in target_nodes:
-                    node_ip, node_port = node_addr
-                    try:
-                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ns:
-                            ns.connect((node_ip, node_port))
-                            send_json(ns, {'type': 'STORE_CHUNK', 'chunk_id': chunk_id, 'size': chunk_size})
-                            ns.sendall(chunk_data)
-                            ack = receive_json(ns)
-                            if ack['status'] == 'OK':
-                                placed_on_addrs.append(node_addr) # Store address to send back to Master
-                                if log_callback: log_callback(f"Chunk {chunk_id} -> Node {node_port}")
-                    except Exception as e:
-                        if log_callback: log_callback(f"Failed to send to Node {node_port}: {e}")
-
-                if not placed_on_addrs:
-                    if log_callback: log_callback(f"Failed to store chunk {chunk_id} on any node!")
-                    return False
-                
-                # We need to covert addresses back to IDs for Master? 
-                # Or Master does it. Let's make Master do it.
-                chunks_placed_info.append({
-                    'chunk_id': chunk_id,
-                    'nodes': placed_on_addrs # Client sends back addresses, Master resolves.
-                })
-
-        # 3. Confirm Success
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.master_host, self.master_port))
-                # We need to teach Master to handle address->id mapping. 
-                # Actually, I'll update Master code next turn to be robust. 
-                # OR I can update Master now? No, I'm writing Client now.
-                # Solution: Master `nodes` registry key is `node_id`. Value has address.
-                # I will change Master to accept addresses in `UPLOAD_SUCCESS` and resolve them.
-                send_json(sock, {
-                    'type': 'UPLOAD_SUCCESS',
-                    'filename': filename,
-                    'filesize': filesize,
-                    'chunks_placed': chunks_placed_info
-                })
-        except Exception as e:
-            if log_callback: log_callback(f"Error finalizing upload: {e}")
-            return False
-
-        if log_callback: log_callback("Upload Complete!")
-        return True
-
-    def download_file(self, filename, save_path, log_callback=None):
-        if log_callback: log_callback(f"Starting download: {filename}")
-        
-        # 1. Get Plan
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.master_host, self.master_port))
-                send_json(sock, {'type': 'DOWNLOAD_REQ', 'filename': filename})
-                resp = receive_json(sock)
-        except Exception as e:
-            if log_callback: log_callback(f"Error connecting to Master: {e}")
-            return False
-            
-        if resp['status'] != 'OK':
-            if log_callback: log_callback(f"Download error: {resp.get('message')}")
-            return False
-            
-        chunks = resp['chunks']
-        file_size = resp['filesize']
-        
-        # 2. Fetch Chunks
-        with open(save_path, 'wb') as f:
-            for chunk_data_item in chunks:
-                chunk_id = chunk_data_item['chunk_id']
-                nodes = chunk_data_item['nodes']
-                
-                fetched = False
-                for node_addr in nodes:
-                    try:
-                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ns:
-                            ns.connect(tuple(node_addr))
-                            send_json(ns, {'type': 'RETRIEVE_CHUNK', 'chunk_id': chunk_id})
-                            header = receive_json(ns)
-                            if header['status'] == 'OK':
-                                raw = recv_all(ns, header['size'])
-                                f.write(raw)
-                                fetched = True
-                                if log_callback: log_callback(f"Retrieved {chunk_id} from {node_addr[1]}")
-                                break
-                    except Exception as e:
-                         if log_callback: log_callback(f"Failed to fetch {chunk_id} from {node_addr}: {e}")
-                
-                if not fetched:
-                    if log_callback: log_callback(f"Detailed Error: Could not retrieve chunk {chunk_id} from any node")
-                    return False
-                    
-        if log_callback: log_callback("Download Complete!")
-        return True
-
-    def delete_file(self, filename, log_callback=None):
-        if log_callback: log_callback(f"Deleting file: {filename}")
-        try:
-             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.master_host, self.master_port))
-                send_json(sock, {'type': 'DELETE_FILE', 'filename': filename})
-                resp = receive_json(sock)
-                if resp['status'] == 'OK':
-                    if log_callback: log_callback("File deleted successfully.")
-                    return True
-                else:
-                    if log_callback: log_callback(f"Deletion failed: {resp.get('message')}")
-                    return False
-        except Exception as e:
-            if log_callback: log_callback(f"Deletion error: {e}")
-            return False
-
+from dfs_client import DFSClient
 
 class DFSGUI:
     def __init__(self, root):
@@ -339,6 +144,9 @@ class DFSGUI:
         
         ttk.Label(perf_controls, text="Storage Nodes Status", font=("Segoe UI", 12)).pack(side="left")
         ttk.Button(perf_controls, text="+ Add Node", command=self.add_dynamic_node).pack(side="right")
+        self.rebalance_btn = ttk.Button(perf_controls, text="Pause Rebalancer", command=self.toggle_rebalancer)
+        self.rebalance_btn.pack(side="right", padx=5)
+        ttk.Button(perf_controls, text="Decommission Node", command=self.decommission_selected).pack(side="right", padx=5)
 
         # Node Grid
         columns = ("ID", "Status", "Port", "CPU", "RAM", "Disk")
@@ -437,6 +245,20 @@ class DFSGUI:
              messagebox.showerror("Error", str(e))
 
 
+    def decommission_selected(self):
+        selected = self.node_tree.selection()
+        if not selected:
+            return
+        node_id = str(self.node_tree.item(selected[0])['values'][0])
+        if messagebox.askyesno("Confirm", f"Decommission {node_id}? Its chunks are copied to other nodes first."):
+            threading.Thread(target=self.client.decommission_node, args=(node_id, self.log), daemon=True).start()
+
+    def toggle_rebalancer(self):
+        action = 'resume' if self.rebalance_btn['text'] == "Resume Rebalancer" else 'pause'
+        state = self.client.rebalance(action, log_callback=self.log)
+        if state:
+            self.rebalance_btn.config(text="Resume Rebalancer" if state['paused'] else "Pause Rebalancer")
+
     def setup_files_tab(self):
         paned = ttk.PanedWindow(self.files_frame, orient="horizontal")
         paned.pack(fill="both", expand=True, padx=5, pady=5)
@@ -553,13 +375,22 @@ class DFSGUI:
     def upload_selected(self):
         sel = self.local_tree.selection()
         if not sel: return
-        filename = self.local_tree.item(sel[0])['text']
-        filepath = os.path.join(self.local_cwd, filename) # Correctly join with current nav dir
-        threading.Thread(target=self.client.upload_file, args=(filepath, self.log), daemon=True).start()
+        filepaths = [os.path.join(self.local_cwd, self.local_tree.item(item)['text']) for item in sel] # Correctly join with current nav dir
+        filepaths = [path for path in filepaths if os.path.isfile(path)]
+        if len(filepaths) > 1:
+            threading.Thread(target=self.client.upload_many, args=(filepaths, self.log), daemon=True).start()
+        elif filepaths:
+            threading.Thread(target=self.client.upload_file, args=(filepaths[0], self.log), daemon=True).start()
 
     def download_selected(self):
         sel = self.dfs_tree.selection()
         if not sel: return
+        if len(sel) > 1:
+            filenames = [str(self.dfs_tree.item(item)['values'][0]) for item in sel]
+            dest_dir = filedialog.askdirectory()
+            if dest_dir:
+                threading.Thread(target=self.client.download_many, args=(filenames, dest_dir, self.log), daemon=True).start()
+            return
         filename = self.dfs_tree.item(sel[0])['values'][0] # Assuming Col 0 is Filename now
         save_path = filedialog.asksaveasfilename(initialfile=filename)
         if save_path:
@@ -614,6 +445,8 @@ class DFSGUI:
             status = info['status']
             
             tag = 'online' if status == 'ONLINE' else 'offline'
+            if status == 'ONLINE' and info.get('draining'):
+                status = 'DRAINING'
             
             self.node_tree.insert("", "end", values=(
                 nid, status, info['address'][1],
@@ -7,10 +7,83 @@ NODE_PORTS_START = 6000
 NUM_NODES = 3  # Default number of nodes to start for demo
 
 # DFS Constants
-BLOCK_SIZE = 1024 * 1024  # 1 MB chunk size
+BLOCK_SIZE = 1024 * 1024  # 1 MB chunk size, unless the file's upload chose another
+BLOCK_SIZE_POLICY = [(256 * 1024**2, 8 * 1024**2), (4 * 1024**3, 64 * 1024**2)]  # (min file size, block size), ascending
+MIN_BLOCK_SIZE = 64 * 1024          # Bounds on a block size an upload may ask for
+MAX_BLOCK_SIZE = 256 * 1024 * 1024
 REPLICATION_FACTOR = 2    # Number of replicas per chunk
+DEFAULT_CODEC = 'none'    # Chunk compression: none, zlib, lzma, zstd, lz4
+DEDUP_UPLOADS = False     # Skip transferring chunks whose content the cluster already holds
+INLINE_THRESHOLD = 4096   # Files up to this many bytes are stored in master metadata
+INLINE_COMPACT_BYTES = 4 * 1024 * 1024 # Dead inline bodies tolerated (beyond the live ones) before compaction
+TRANSFER_CONCURRENCY = 16 # Chunk transfers in flight for batched uploads/downloads
+CLI_JOBS = 4              # dfs command-line transfers in flight (chunks when several files are batched)
+EC_SCHEME = (4, 2)        # (data, parity) fragments for erasure-coded uploads
+DEFAULT_CHUNKING = 'fixed'  # 'fixed' (BLOCK_SIZE) or 'cdc' (content-defined, averaging BLOCK_SIZE)
+                            # cdc hashes every byte (~70 MB/s, benchmarks/bench_chunking.py); fixed is I/O-bound
 HEARTBEAT_INTERVAL = 2    # Seconds
-NODE_TIMEOUT = 6          # Seconds (3 missed heartbeats)
+NODE_TIMEOUT = 6          # Seconds after a Master restart before unregistered nodes count as failed
+PHI_SUSPECT_THRESHOLD = 3.0  # Failure detector suspicion at which a node becomes SUSPECT (no new work)
+PHI_FAIL_THRESHOLD = 8.0     # Suspicion at which a node is declared OFFLINE and re-replicated
+PHI_WINDOW = 100             # Heartbeat intervals kept per node
+PHI_MIN_STD = 0.5            # Seconds; floor on the interval deviation so regular nodes are not failed on one late heartbeat
+BLOCK_REPORT_INTERVAL = 300  # Seconds between full chunk inventory reports from a node
+ORPHAN_GRACE_PERIOD = 3600   # Seconds an unreferenced chunk may sit on a node before deletion (longer than any upload)
+GC_INTERVAL = 2              # Seconds between garbage collector passes
+GC_BATCH_SIZE = 1000         # Chunk IDs per DELETE_CHUNKS request
+GC_RPC_TIMEOUT = 30          # Seconds the garbage collector waits on a node before retrying its batch later
+REBALANCE_INTERVAL = 30      # Seconds between rebalancer passes
+REBALANCE_THRESHOLD = 0.10   # Nodes within 10% of the average utilization count as balanced
+REBALANCE_BANDWIDTH = 10 * 1024 * 1024  # Bytes/s the rebalancer may move (0 = unlimited)
+DECOMMISSION_CONCURRENCY = 8   # Parallel chunk copies while draining a decommissioned node
+DECOMMISSION_RETRY_INTERVAL = 10  # Seconds before retrying chunks a drain pass could not copy
+
+# Read-replica followers of the master (python main.py follower <port>)
+MASTER_FOLLOWERS = []          # [(host, port), ...] DFSClient spreads metadata reads over
+FOLLOWER_SYNC_WAIT = 1.0       # Seconds a follower's change-feed request waits for new changes
+FOLLOWER_MAX_STALENESS = 3.0   # Seconds behind the leader after which a follower forwards reads
+JOURNAL_SIZE = 100000          # Changes the leader keeps for followers; one further behind resyncs in full
+
+# Federated namespace (python main.py master <index>): each master shard owns the
+# filenames with crc32(name) % len(MASTER_SHARDS) == index; nodes report to all of them
+MASTER_SHARDS = []             # [(host, port), ...]; empty = single master at MASTER_HOST:MASTER_PORT
+
+# Read load balancing: a node's load for replica ordering is cpu/100
+# + served bytes/s / READ_LOAD_BYTES + in-flight requests / READ_LOAD_REQUESTS
+READ_LOAD_BYTES = 50 * 1024 * 1024
+READ_LOAD_REQUESTS = 8
+
+# Node traffic classes: client I/O is 'foreground'; Master's re-replication, rebalancing,
+# drains and GC are 'background'. Limits in bytes/s (0 = unlimited), changeable at runtime (SET_QOS)
+QOS_LIMITS = {'foreground': 0, 'background': 20 * 1024 * 1024}
+QOS_MAX_DEFER = 0.5  # Seconds background disk I/O waits for in-flight foreground I/O before going ahead
+
+# Client Metadata Cache
+METADATA_LEASE = 5  # Seconds a client may reuse a download plan or listing without asking Master
+
+# Storage node server engine
+NODE_ENGINE = 'threaded'     # 'threaded' (a thread per connection) or 'asyncio' (event loop + disk I/O pool)
+NODE_BACKLOG = 128           # Pending connections the listening socket queues
+NODE_MAX_CONNECTIONS = 1024  # asyncio engine: connections served at once; later ones wait their turn
+NODE_IO_WORKERS = 8          # asyncio engine: threads for disk reads and writes
+NODE_SHUTDOWN_GRACE = 10     # asyncio engine: seconds a shutdown waits for in-flight writes
+
+# Chunk write durability: 'none' (page cache only), 'fsync' (every chunk before its ack)
+# or 'group' (concurrent writes share one data flush, then one directory fsync for their renames)
+NODE_DURABILITY = 'none'
+GROUP_COMMIT_WINDOW = 0  # Seconds a commit leader waits for more writers (0: batch whoever arrived meanwhile)
+
+# Storage tiers per node, fastest first: [(name, root directory, capacity in bytes, 0 = whole disk)].
+# New chunks land on the fastest tier with room; a migrator demotes cold chunks and promotes hot ones.
+# Empty = one tier under STORAGE_ROOT.
+NODE_TIERS = []                # e.g. [('nvme', '/mnt/nvme/dfs', 200 * 1024**3), ('hdd', '/mnt/hdd/dfs', 0)]
+TIER_MIGRATE_INTERVAL = 30     # Seconds between migrator passes
+TIER_HIGH_WATERMARK = 0.90     # A tier fuller than this demotes its coldest chunks...
+TIER_LOW_WATERMARK = 0.75      # ...down to this; promotions only fill a tier up to here
+TIER_PROMOTE_READS = 3         # Reads between two passes that make a chunk on a slower tier hot
+
+# Node Chunk Cache
+CHUNK_CACHE_BYTES = 64 * 1024 * 1024  # In-memory budget for hot chunks (0 disables)
 
 # Storage Paths
 STORAGE_ROOT = "dfs_storage"
@@ -0,0 +1,280 @@
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import *
+from dfs_client import DFSClient
+
+def parse_size(text):
+    """Bytes from '4096', '512K', '64M' or '1G'."""
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def human_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def local_files(paths, recursive):
+    """Expand put arguments (globs, and directories with -r) to files; returns (files, errors)."""
+    files, errors = [], []
+    for pattern in paths:
+        matches = sorted(glob_local(pattern))
+        if not matches:
+            errors.append({'name': pattern, 'ok': False, 'error': 'No such file'})
+        for path in matches:
+            if os.path.isfile(path):
+                files.append(path)
+            elif os.path.isdir(path) and recursive:
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, name) for name in sorted(names))
+            else:
+                errors.append({'name': path, 'ok': False, 'error': 'Is a directory (use -r)'})
+    return files, errors
+
+def glob_local(pattern):
+    return glob.glob(pattern) if glob.has_magic(pattern) else ([pattern] if os.path.exists(pattern) else [])
+
+def remote_names(client, patterns):
+    """DFS filenames matching the patterns (plain names pass through unchecked); None if Master is unreachable."""
+    if not any(glob_chars(p) for p in patterns):
+        return list(dict.fromkeys(patterns))
+    listing = client.list_files()
+    if not listing or listing['status'] != 'OK':
+        return None
+    names = sorted(entry['filename'] for entry in listing['files'])
+    matched = []
+    for pattern in patterns:
+        matched.extend(fnmatch.filter(names, pattern) if glob_chars(pattern) else [pattern])
+    return list(dict.fromkeys(matched))
+
+def glob_chars(pattern):
+    return any(c in pattern for c in '*?[')
+
+def run_transfers(items, transfer, jobs, log):
+    """
+    Run transfer(item) -> (ok, bytes, error) for every item, jobs at a time, and
+    time each one. Returns the per-item results and the wall-clock seconds.
+    """
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            ok, size, error = transfer(item)
+        except Exception as e:
+            ok, size, error = False, 0, str(e)
+        seconds = time.perf_counter() - start
+        result = {'name': item, 'ok': ok, 'bytes': size, 'seconds': round(seconds, 4),
+                  'throughput': round(size / seconds) if ok and seconds > 0 else 0}
+        if error:
+            result['error'] = error
+        log(result)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(timed, items))
+    return results, time.perf_counter() - start
+
+def run_batch(items, transfer, size_of, args, log):
+    """
+    Run transfer(items, log_callback) -> {item: ok} once for all items, so Master
+    plans and commits them in one round trip each. Every item reports the batch's
+    wall-clock seconds; errors are the last client message naming the item.
+    """
+    messages = []
+    start = time.perf_counter()
+    try:
+        outcome = transfer(items, verbose_log(args, messages))
+    except Exception as e:
+        outcome, messages = {}, messages + [str(e)]
+    seconds = time.perf_counter() - start
+    results = []
+    for item in items:
+        ok = outcome.get(item, False)
+        size = size_of(item) if ok else 0
+        result = {'name': item, 'ok': ok, 'bytes': size, 'seconds': round(seconds, 4),
+                  'throughput': round(size / seconds) if ok and seconds > 0 else 0}
+        if not ok:
+            result['error'] = last_error([msg for msg in messages if item in msg] or messages)
+        log(result)
+        results.append(result)
+    return results, seconds
+
+def summarize(command, results, seconds):
+    transferred = sum(r.get('bytes', 0) for r in results if r['ok'])
+    return {
+        'command': command,
+        'ok': all(r['ok'] for r in results),
+        'files': sum(1 for r in results if r['ok']),
+        'failed': sum(1 for r in results if not r['ok']),
+        'bytes': transferred,
+        'seconds': round(seconds, 4),
+        'throughput': round(transferred / seconds) if seconds > 0 else 0,
+        'results': results
+    }
+
+def print_result(result):
+    if not result['ok']:
+        print(f"FAILED {result['name']}: {result.get('error', 'see -v output')}")
+    elif 'throughput' in result and result['bytes']:
+        print(f"{result['name']}  {human_size(result['bytes'])} in {result['seconds']:.2f}s "
+              f"({human_size(result['throughput'])}/s)")
+    else:
+        print(result['name'])
+
+def cmd_put(client, args, log):
+    files, errors = local_files(args.paths, args.recursive)
+    names = {}
+    for path in files:
+        # The DFS namespace is flat: files are stored under their base name
+        names.setdefault(os.path.basename(path), []).append(path)
+    duplicates = {name for name, paths in names.items() if len(paths) > 1}
+    for name in sorted(duplicates):
+        errors.append({'name': name, 'ok': False, 'error': f"Same name for {', '.join(names[name])}"})
+    for error in errors:
+        log(error)
+    files = [path for path in files if os.path.basename(path) not in duplicates]
+    dedup = args.dedup or DEDUP_UPLOADS
+
+    if len(files) > 1:
+        # One UPLOAD_INIT_BATCH and one UPLOAD_SUCCESS_BATCH for all files; -j caps chunks in flight
+        put_many = lambda paths, log_callback: client.upload_many(
+            paths, log_callback, codec=args.codec, dedup=dedup, ec=args.ec,
+            max_in_flight=max(1, args.jobs), block_size=args.block_size)
+        results, seconds = run_batch(files, put_many, os.path.getsize, args, log)
+        return summarize('put', errors + results, seconds)
+
+    def put(path):
+        size = os.path.getsize(path)
+        messages = []
+        ok = client.upload_file(path, verbose_log(args, messages), codec=args.codec, ec=args.ec,
+                                dedup=dedup, block_size=args.block_size)
+        return ok, size, None if ok else last_error(messages)
+
+    results, seconds = run_transfers(files, put, args.jobs, log)
+    return summarize('put', errors + results, seconds)
+
+def cmd_get(client, args, log):
+    names = remote_names(client, args.names)
+    if names is None:
+        return summarize('get', [{'name': ' '.join(args.names), 'ok': False, 'error': 'Error connecting to Master'}], 0)
+    os.makedirs(args.dest, exist_ok=True)
+
+    if len(names) > 1:
+        # One DOWNLOAD_REQ_BATCH for all plans; -j caps chunks in flight
+        get_many = lambda batch, log_callback: client.download_many(batch, args.dest, log_callback,
+                                                                    max_in_flight=max(1, args.jobs))
+        size_of = lambda name: os.path.getsize(os.path.join(args.dest, name))
+        results, seconds = run_batch(names, get_many, size_of, args, log)
+        return summarize('get', results, seconds)
+
+    def get(name):
+        messages = []
+        save_path = os.path.join(args.dest, name)
+        ok = client.download_file(name, save_path, verbose_log(args, messages))
+        return ok, os.path.getsize(save_path) if ok else 0, None if ok else last_error(messages)
+
+    results, seconds = run_transfers(names, get, args.jobs, log)
+    return summarize('get', results, seconds)
+
+def cmd_rm(client, args, log):
+    names = remote_names(client, args.names)
+    if names is None:
+        return summarize('rm', [{'name': ' '.join(args.names), 'ok': False, 'error': 'Error connecting to Master'}], 0)
+
+    def rm(name):
+        messages = []
+        ok = client.delete_file(name, verbose_log(args, messages))
+        return ok, 0, None if ok else last_error(messages)
+
+    results, seconds = run_transfers(names, rm, args.jobs, log)
+    return summarize('rm', results, seconds)
+
+def cmd_ls(client, args, log):
+    listing = client.list_files()
+    if not listing or listing['status'] != 'OK':
+        error = listing.get('message') if listing else 'Error connecting to Master'
+        return {'command': 'ls', 'ok': False, 'error': error, 'files': []}
+    patterns = args.names or ['*']
+    files = sorted((entry for entry in listing['files'] if any(fnmatch.fnmatch(entry['filename'], p) for p in patterns)),
+                   key=lambda entry: entry['filename'])
+    if not args.json:
+        for entry in files:
+            print(f"{entry['size']:>14}  {entry['filename']}" if args.long else entry['filename'])
+    return {'command': 'ls', 'ok': True, 'files': files}
+
+def verbose_log(args, messages):
+    """log_callback for DFSClient: keeps the messages for error reports, echoes them with -v."""
+    def log(msg):
+        messages.append(msg)
+        if args.verbose:
+            print(msg, file=sys.stderr)
+    return log
+
+def last_error(messages):
+    return messages[-1] if messages else 'failed'
+
+def parse_ec(text):
+    """(k, m) from 'K,M' for --ec."""
+    try:
+        k, m = (int(n) for n in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected K,M (e.g. 4,2), got {text!r}")
+    return k, m
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='dfs', description='Command-line client for the DFS.')
+    parser.add_argument('--master', default=f"{MASTER_HOST}:{MASTER_PORT}", help='Master host:port')
+    parser.add_argument('--json', action='store_true', help='Print one JSON document with every result')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show client progress on stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    put = commands.add_parser('put', help='Upload local files (globs allowed)')
+    put.add_argument('paths', nargs='+')
+    put.add_argument('-r', '--recursive', action='store_true', help='Upload every file under directories')
+    put.add_argument('--codec', default=DEFAULT_CODEC)
+    put.add_argument('--ec', metavar='K,M', type=parse_ec, help='Erasure-code chunks as K data + M parity fragments')
+    put.add_argument('--dedup', action='store_true', help='Skip chunks the cluster already holds')
+    put.add_argument('--block-size', type=parse_size, help='Chunk size, e.g. 64M (default: by file size)')
+
+    get = commands.add_parser('get', help='Download files (globs match DFS names)')
+    get.add_argument('names', nargs='+')
+    get.add_argument('-d', '--dest', default='.', help='Local directory (default: current)')
+
+    rm = commands.add_parser('rm', help='Delete files (globs match DFS names)')
+    rm.add_argument('names', nargs='+')
+
+    ls = commands.add_parser('ls', help='List files, optionally matching globs')
+    ls.add_argument('names', nargs='*')
+    ls.add_argument('-l', '--long', action='store_true', help='Show sizes')
+
+    for transfer in (put, get, rm):
+        transfer.add_argument('-j', '--jobs', type=int, default=CLI_JOBS, help='Transfers in flight (chunks when several files are batched)')
+    args = parser.parse_args(argv)
+
+    host, _, port = args.master.rpartition(':')
+    client = DFSClient(master_host=host or MASTER_HOST, master_port=int(port))
+    log = (lambda result: None) if args.json or args.command == 'ls' else print_result
+    summary = {'put': cmd_put, 'get': cmd_get, 'rm': cmd_rm, 'ls': cmd_ls}[args.command](client, args, log)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    elif args.command in ('put', 'get'):
+        print(f"{summary['files']} files, {human_size(summary['bytes'])} in {summary['seconds']:.2f}s "
+              f"({human_size(summary['throughput'])}/s aggregate), {summary['failed']} failed")
+    elif args.command == 'rm':
+        print(f"{summary['files']} files deleted, {summary['failed']} failed")
+    elif not summary['ok']:
+        print(f"ls failed: {summary['error']}", file=sys.stderr)
+    return 0 if summary['ok'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
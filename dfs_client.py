@@ -0,0 +1,793 @@
+import threading
+import socket
+import os
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from config import *
+from utils import send_json, receive_json, recv_all, calculate_checksum, compress_data, decompress_data, available_codecs, shard_of, block_size_for
+from utils import iter_fixed_chunks, iter_cdc_chunks
+
+class MetadataCache:
+    """
+    Master replies (download plans, listings) the client may reuse while the
+    lease Master granted with them lasts. After that an entry is revalidated
+    by its tag: Master answers NOT_MODIFIED if nothing changed, so only
+    changed metadata is sent again. Master holds writes to a file back until
+    the leases on its plans ran out, so a cached plan is never older than the
+    file; listings can lag other clients' writes by up to METADATA_LEASE.
+    """
+    def __init__(self):
+        self.entries = {} # key -> [expires, tag, reply]
+        self.hits = 0          # Served without asking Master
+        self.revalidations = 0 # Master confirmed our copy (NOT_MODIFIED)
+        self.misses = 0        # Master sent the full reply
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        """(reply, tag): reply while the lease lasts, else None and the tag to revalidate with."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, None
+            if time.time() < entry[0]:
+                self.hits += 1
+                return entry[2], entry[1]
+            return None, entry[1]
+
+    def update(self, key, reply):
+        """Account for Master's reply to a lookup miss; returns the reply to use."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if reply and reply['status'] == 'NOT_MODIFIED' and entry:
+                self.revalidations += 1
+                entry[0] = time.time() + reply['lease']
+                return entry[2]
+            self.misses += 1
+            self.entries.pop(key, None)
+            if reply and reply['status'] == 'OK' and 'tag' in reply:
+                self.entries[key] = [time.time() + reply['lease'], reply['tag'], reply]
+            return reply
+
+    def invalidate(self, key):
+        """Drop one entry; True if there was one."""
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.revalidations + self.misses
+            return {
+                'hits': self.hits,
+                'revalidations': self.revalidations,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'entries': len(self.entries)
+            }
+
+class DFSClient:
+    def __init__(self, master_host=MASTER_HOST, master_port=MASTER_PORT, followers=MASTER_FOLLOWERS,
+                 shards=MASTER_SHARDS):
+        self.master_host = master_host
+        self.master_port = master_port
+        # Federated namespace: each filename lives on the master shard shard_of() picks
+        self.shards = [tuple(addr) for addr in shards]
+        # Read-replica followers that metadata reads are spread over, round robin (single master only)
+        self.followers = [] if self.shards else [tuple(addr) for addr in followers]
+        self.next_follower = 0
+        self.pinned_until = 0 # Reads stay on the leader until then, so we see our own writes
+        self.metadata_cache = MetadataCache()
+
+    def get_stats(self):
+        try:
+            return self._call_reader({'type': 'GET_STATS'})
+        except Exception:
+            return None
+
+    def list_files(self):
+        try:
+            replies = [self._cached_call(('LIST_FILES', i), {'type': 'LIST_FILES'}, shard=i)
+                       for i in range(max(1, len(self.shards)))]
+        except Exception:
+            return None
+        for reply in replies:
+            if not reply or reply['status'] != 'OK':
+                return reply
+        return {'status': 'OK', 'files': [entry for reply in replies for entry in reply['files']]}
+
+    def _iter_chunks(self, f, chunking, block_size=BLOCK_SIZE):
+        if chunking == 'cdc':
+            return iter_cdc_chunks(f, block_size)
+        return iter_fixed_chunks(f, block_size)
+
+    def chunk_checksums(self, filepath, chunking='fixed', block_size=BLOCK_SIZE):
+        """SHA-256 of every chunk of a local file, before compression."""
+        with open(filepath, 'rb') as f:
+            return [calculate_checksum(block) for block in self._iter_chunks(f, chunking, block_size)]
+
+    def get_checksums(self, filename):
+        """Ask Master for the version, codec, chunking, block size and per-chunk checksums of a file."""
+        try:
+            return self._call_reader({'type': 'GET_CHECKSUMS', 'filename': filename}, filename)
+        except Exception:
+            return None
+
+    def sync_file(self, filepath, log_callback=None, chunking=None):
+        """
+        Upload only the chunks of filepath that differ from the version stored
+        in the DFS, then commit the new chunk list atomically. Fails if another
+        client committed a newer version in the meantime.
+        """
+        filename = os.path.basename(filepath)
+        remote = self.get_checksums(filename)
+        if remote is None:
+            if log_callback: log_callback("Error connecting to Master")
+            return False
+
+        if remote['status'] == 'OK' and remote.get('ec'):
+            # Fragments are not content-addressed, so erasure-coded files are rewritten in full
+            return self.upload_file(filepath, log_callback, codec=remote.get('codec', 'none'),
+                                    ec=remote['ec'], base_version=remote['version'],
+                                    block_size=remote.get('block_size'))
+
+        if remote['status'] != 'OK':
+            # Nothing stored yet: a plain deduplicating upload
+            if log_callback: log_callback(f"{filename} not in DFS, uploading in full")
+            return self.upload_file(filepath, log_callback, dedup=True,
+                                    chunking=chunking or DEFAULT_CHUNKING, base_version=0)
+
+        chunking = chunking or remote.get('chunking', 'fixed')
+        codec = remote.get('codec', 'none')
+        # Keep the stored block size, or no fixed-size chunk would match
+        block_size = remote.get('block_size', BLOCK_SIZE)
+        local = self.chunk_checksums(filepath, chunking, block_size)
+        known = {c['checksum'] for c in remote['chunks'] if c.get('checksum')}
+        changed = sum(1 for c in local if c not in known)
+        if log_callback: log_callback(f"Sync {filename}: {changed} of {len(local)} chunks changed")
+
+        return self.upload_file(filepath, log_callback, codec=codec, dedup=True, chunking=chunking,
+                                base_version=remote['version'], checksums=local, block_size=block_size)
+
+    def _send_chunk(self, node_addr, chunk_id, data):
+        """STORE_CHUNK on one node; True once the node acked."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ns:
+            ns.connect(tuple(node_addr))
+            send_json(ns, {'type': 'STORE_CHUNK', 'chunk_id': chunk_id, 'size': len(data)})
+            ns.sendall(data)
+            ack = receive_json(ns)
+            return bool(ack and ack['status'] == 'OK')
+
+    def _fetch_chunk(self, node_addr, chunk_id):
+        """RETRIEVE_CHUNK from one node; the stored bytes or None."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ns:
+            ns.connect(tuple(node_addr))
+            send_json(ns, {'type': 'RETRIEVE_CHUNK', 'chunk_id': chunk_id})
+            header = receive_json(ns)
+            if header and header['status'] == 'OK':
+                return recv_all(ns, header['size'])
+        return None
+
+    def _store_fragments(self, chunk_id, chunk_data, target_nodes, rs, log_callback=None):
+        """
+        Erasure-code chunk_data and send fragment i to target_nodes[i].
+        Returns the positional placement (None where a store failed), or None
+        if fewer than k fragments landed.
+        """
+        from erasure import fragment_id
+        placed = []
+        for i, (node_addr, fragment) in enumerate(zip(target_nodes, rs.encode(chunk_data))):
+            try:
+                placed.append(node_addr if self._send_chunk(node_addr, fragment_id(chunk_id, i), fragment) else None)
+            except Exception as e:
+                placed.append(None)
+                if log_callback: log_callback(f"Failed to send fragment {i} of {chunk_id} to Node {node_addr[1]}: {e}")
+        if sum(1 for addr in placed if addr) < rs.k:
+            return None
+        if log_callback: log_callback(f"Chunk {chunk_id} -> {rs.k}+{rs.m} fragments")
+        return placed
+
+    def _fetch_fragments(self, chunk_info, log_callback=None):
+        """Read any k fragments of an erasure-coded chunk and decode it (None on failure)."""
+        from erasure import ReedSolomon, fragment_id
+        chunk_id = chunk_info['chunk_id']
+        rs = ReedSolomon(*chunk_info['ec'])
+        fragments = {}
+        # Data fragments come first, so a healthy stripe decodes without any GF math
+        for i, node_addr in enumerate(chunk_info['fragments']):
+            if len(fragments) == rs.k:
+                break
+            if not node_addr:
+                continue
+            try:
+                data = self._fetch_chunk(node_addr, fragment_id(chunk_id, i))
+                if data is not None:
+                    fragments[i] = data
+            except Exception as e:
+                if log_callback: log_callback(f"Failed to fetch fragment {i} of {chunk_id} from {node_addr}: {e}")
+        if len(fragments) < rs.k:
+            return None
+        return rs.decode(fragments)
+
+    def _place_chunk(self, chunk_info, raw_data, codec, ec=None, log_callback=None):
+        """
+        Compress one chunk and store it on the planned nodes (or as fragments).
+        Returns its chunks_placed entry for UPLOAD_SUCCESS (the nodes that took
+        it, or a dedup marker), or None if no node stored it.
+        """
+        chunk_id = chunk_info['chunk_id']
+        target_nodes = chunk_info['nodes'] # List of (ip, port)
+        
+        if chunk_info.get('dedup'):
+            if log_callback: log_callback(f"Chunk {chunk_id} already stored, skipped")
+            return {'chunk_id': chunk_id, 'nodes': [], 'dedup': True}
+        
+        # Chunks travel and are stored in compressed form
+        chunk_data = compress_data(raw_data, codec)
+        
+        if ec:
+            from erasure import ReedSolomon # Loads numpy, so only when a file is erasure-coded
+            placed = self._store_fragments(chunk_id, chunk_data, target_nodes, ReedSolomon(*ec), log_callback)
+            if placed is None:
+                if log_callback: log_callback(f"Failed to store enough fragments of chunk {chunk_id}!")
+                return None
+            return {'chunk_id': chunk_id, 'nodes': placed, 'checksum': calculate_checksum(raw_data)}
+        
+        placed_on_addrs = []
+
+        for node_addr in target_nodes:
+            node_ip, node_port = node_addr
+            try:
+                if self._send_chunk((node_ip, node_port), chunk_id, chunk_data):
+                    placed_on_addrs.append(node_addr) # Store address to send back to Master
+                    if log_callback: log_callback(f"Chunk {chunk_id} -> Node {node_port}")
+            except Exception as e:
+                if log_callback: log_callback(f"Failed to send to Node {node_port}: {e}")
+
+        if not placed_on_addrs:
+            if log_callback: log_callback(f"Failed to store chunk {chunk_id} on any node!")
+            return None
+
+        return {
+            'chunk_id': chunk_id,
+            'nodes': placed_on_addrs, # Client sends back addresses, Master resolves.
+            'checksum': calculate_checksum(raw_data)
+        }
+
+    def upload_file(self, filepath, log_callback=None, codec=DEFAULT_CODEC, dedup=DEDUP_UPLOADS,
+                    chunking=DEFAULT_CHUNKING, base_version=None, checksums=None, ec=None, block_size=None):
+        """
+        Upload a local file. base_version, when given, makes the commit fail
+        unless the DFS copy is still at that version (0 = must not exist).
+        ec=(k, m) stores every chunk as k data + m parity fragments instead of replicas.
+        block_size defaults to BLOCK_SIZE_POLICY's choice for the file's size.
+        """
+        filename = os.path.basename(filepath)
+        filesize = os.path.getsize(filepath)
+        block_size = block_size or block_size_for(filesize, BLOCK_SIZE_POLICY, BLOCK_SIZE)
+        
+        if log_callback: log_callback(f"Starting upload: {filename} ({filesize} bytes, codec {codec})")
+
+        if codec not in available_codecs():
+            if log_callback: log_callback(f"Upload failed: codec {codec} is not available")
+            return False
+
+        if filesize <= INLINE_THRESHOLD and not ec:
+            return self._upload_inline(filepath, filename, filesize, base_version, log_callback)
+
+        # 1. Init Upload
+        init_request = {'type': 'UPLOAD_INIT', 'filename': filename, 'filesize': filesize, 'codec': codec,
+                        'block_size': block_size}
+        if ec:
+            init_request['ec'] = list(ec)
+        if chunking != 'fixed':
+            # Variable-size chunks: the checksum list tells Master how many chunks to plan
+            dedup = True
+        if dedup:
+            # Master answers with the chunks it already holds so we can skip them
+            init_request['checksums'] = checksums or self.chunk_checksums(filepath, chunking, block_size)
+        try:
+            response = self._call_master(init_request, filename)
+        except Exception as e:
+            if log_callback: log_callback(f"Error connecting to Master: {e}")
+            return False
+
+        if response['status'] != 'OK':
+            if log_callback: log_callback(f"Upload failed: {response.get('message')}")
+            return False
+
+        chunks_plan = response['chunks']
+        chunks_placed_info = []
+
+        # 2. Upload Chunks
+        with open(filepath, 'rb') as f:
+            for chunk_info, raw_data in zip(chunks_plan, self._iter_chunks(f, chunking, block_size)):
+                placed = self._place_chunk(chunk_info, raw_data, codec, ec, log_callback)
+                if placed is None:
+                    return False
+                chunks_placed_info.append(placed)
+
+        # 3. Confirm Success
+        success_request = {
+            'type': 'UPLOAD_SUCCESS',
+            'filename': filename,
+            'filesize': filesize,
+            'codec': codec,
+            'chunking': chunking,
+            'block_size': block_size,
+            'chunks_placed': chunks_placed_info
+        }
+        if ec:
+            success_request['ec'] = list(ec)
+        if base_version is not None:
+            success_request['base_version'] = base_version
+        try:
+            # Master resolves the node addresses in chunks_placed to node IDs
+            resp = self._call_master(success_request, filename)
+        except Exception as e:
+            if log_callback: log_callback(f"Error finalizing upload: {e}")
+            return False
+
+        if not resp or resp['status'] != 'OK':
+            if log_callback: log_callback(f"Upload failed: {resp.get('message') if resp else 'no reply from Master'}")
+            return False
+
+        if log_callback: log_callback("Upload Complete!")
+        return True
+
+    def _upload_inline(self, filepath, filename, filesize, base_version=None, log_callback=None):
+        """Tiny files go straight into master metadata in a single round trip."""
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        request = {
+            'type': 'UPLOAD_INLINE',
+            'filename': filename,
+            'filesize': filesize,
+            'data': base64.b64encode(data).decode('ascii')
+        }
+        if base_version is not None:
+            request['base_version'] = base_version
+        try:
+            resp = self._call_master(request, filename)
+        except Exception as e:
+            if log_callback: log_callback(f"Error connecting to Master: {e}")
+            return False
+
+        if not resp or resp['status'] != 'OK':
+            if log_callback: log_callback(f"Upload failed: {resp.get('message') if resp else 'no reply from Master'}")
+            return False
+        if log_callback: log_callback("Upload Complete! (stored inline)")
+        return True
+
+    def download_file(self, filename, save_path, log_callback=None):
+        if log_callback: log_callback(f"Starting download: {filename}")
+        
+        key = ('DOWNLOAD_REQ', filename)
+        for attempt in range(2):
+            # 1. Get Plan
+            try:
+                resp = self._cached_call(key, {'type': 'DOWNLOAD_REQ', 'filename': filename}, filename)
+            except Exception as e:
+                if log_callback: log_callback(f"Error connecting to Master: {e}")
+                return False
+                
+            if resp['status'] != 'OK':
+                if log_callback: log_callback(f"Download error: {resp.get('message')}")
+                return False
+            
+            # 2. Fetch Chunks
+            if self._save_from_plan(resp, save_path, log_callback):
+                return True
+            # The file may have been overwritten, deleted or moved since we cached its plan
+            if attempt or not self.metadata_cache.invalidate(key):
+                return False
+            if log_callback: log_callback(f"Retrying {filename} with a fresh plan from Master")
+        return False
+
+    def _save_from_plan(self, plan, save_path, log_callback=None):
+        """Write a file from its DOWNLOAD_REQ plan, chunk after chunk."""
+        if 'inline' in plan:
+            with open(save_path, 'wb') as f:
+                f.write(base64.b64decode(plan['inline']))
+            if log_callback: log_callback("Download Complete! (inline)")
+            return True
+            
+        codec = plan.get('codec', 'none')
+        with open(save_path, 'wb') as f:
+            for chunk_data_item in plan['chunks']:
+                data = self._read_chunk(chunk_data_item, codec, log_callback)
+                if data is None:
+                    return False
+                f.write(data)
+                    
+        if log_callback: log_callback("Download Complete!")
+        return True
+
+    def _read_chunk(self, chunk_data_item, codec, log_callback=None):
+        """Fetch one planned chunk (replica or fragments) and decompress it; None on failure."""
+        chunk_id = chunk_data_item['chunk_id']
+        
+        if 'ec' in chunk_data_item:
+            raw = self._fetch_fragments(chunk_data_item, log_callback)
+            if raw is None:
+                if log_callback: log_callback(f"Detailed Error: Could not reconstruct chunk {chunk_id}")
+                return None
+            if log_callback: log_callback(f"Reconstructed {chunk_id} from fragments")
+            return decompress_data(raw, codec)
+        
+        for node_addr in chunk_data_item['nodes']:
+            try:
+                raw = self._fetch_chunk(node_addr, chunk_id)
+                if raw is not None:
+                    if log_callback: log_callback(f"Retrieved {chunk_id} from {node_addr[1]}")
+                    return decompress_data(raw, codec)
+            except Exception as e:
+                 if log_callback: log_callback(f"Failed to fetch {chunk_id} from {node_addr}: {e}")
+        
+        if log_callback: log_callback(f"Detailed Error: Could not retrieve chunk {chunk_id} from any node")
+        return None
+
+    def _round_trip(self, address, request):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.connect(address)
+            send_json(sock, request)
+            return receive_json(sock)
+
+    def _master_for(self, filename=None, shard=0):
+        """Address of the Master owning filename (or of the given shard, for cluster-wide requests)."""
+        if not self.shards:
+            return (self.master_host, self.master_port)
+        return self.shards[shard_of(filename, len(self.shards)) if filename is not None else shard]
+
+    def _call_master(self, request, filename=None, shard=0):
+        """One request/response round trip to the leader Master (used for anything that may write)."""
+        if self.followers:
+            self.pinned_until = time.time() + FOLLOWER_MAX_STALENESS
+        # Whatever we change, we read back fresh
+        self.metadata_cache.clear()
+        return self._round_trip(self._master_for(filename, shard), request)
+
+    def _cached_call(self, key, request, filename=None, shard=0):
+        """_call_reader through the metadata cache: no round trip while key's lease lasts."""
+        reply, tag = self.metadata_cache.lookup(key)
+        if reply is not None:
+            return reply
+        if tag is not None:
+            request = dict(request, tag=tag)
+        return self.metadata_cache.update(key, self._call_reader(request, filename, shard))
+
+    def cache_stats(self):
+        """Hit/revalidation/miss counters of the metadata cache."""
+        return self.metadata_cache.get_stats()
+
+    def _call_reader(self, request, filename=None, shard=0):
+        """
+        Read-only round trip, sent to the next follower; the leader answers
+        when there are none, right after our own writes, or if the follower
+        is unreachable.
+        """
+        if self.followers and time.time() >= self.pinned_until:
+            address = self.followers[self.next_follower % len(self.followers)]
+            self.next_follower += 1
+            try:
+                return self._round_trip(address, request)
+            except OSError:
+                pass
+        return self._round_trip(self._master_for(filename, shard), request)
+
+    def _call_all(self, request, read=False):
+        """Send a request to every master shard; their replies in shard order."""
+        call = self._call_reader if read else self._call_master
+        return [call(request, shard=i) for i in range(max(1, len(self.shards)))]
+
+    def _group_by_shard(self, items, key=lambda name: name):
+        """Split items into per-shard lists by the filename key() gives (one list without federation)."""
+        if len(self.shards) < 2:
+            return [list(items)]
+        groups = {}
+        for item in items:
+            groups.setdefault(shard_of(key(item), len(self.shards)), []).append(item)
+        return list(groups.values())
+
+    def upload_many(self, filepaths, log_callback=None, codec=DEFAULT_CODEC, dedup=DEDUP_UPLOADS,
+                    ec=None, max_in_flight=TRANSFER_CONCURRENCY, block_size=None):
+        """
+        Upload many files with one planning and one commit round trip to Master.
+        Chunks of all files are pushed to nodes concurrently (max_in_flight at a time).
+        block_size defaults to BLOCK_SIZE_POLICY's choice for each file's size.
+        Returns {filepath: True/False}.
+        """
+        results = {path: False for path in filepaths}
+        if codec not in available_codecs():
+            if log_callback: log_callback(f"Upload failed: codec {codec} is not available")
+            return results
+        groups = self._group_by_shard(filepaths, os.path.basename)
+        if len(groups) > 1:
+            # One batch per master shard
+            for group in groups:
+                results.update(self.upload_many(group, log_callback, codec, dedup, ec, max_in_flight, block_size))
+            return results
+        shard_key = os.path.basename(filepaths[0]) if filepaths else None
+        
+        commits = {} # filepath -> UPLOAD_SUCCESS / UPLOAD_INLINE body
+        init_requests = []
+        chunked = []
+        for path in filepaths:
+            filename = os.path.basename(path)
+            filesize = os.path.getsize(path)
+            if filesize <= INLINE_THRESHOLD and not ec:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                commits[path] = {'filename': filename, 'filesize': filesize,
+                                 'data': base64.b64encode(data).decode('ascii')}
+                continue
+            file_block_size = block_size or block_size_for(filesize, BLOCK_SIZE_POLICY, BLOCK_SIZE)
+            init_request = {'filename': filename, 'filesize': filesize, 'codec': codec, 'block_size': file_block_size}
+            if ec:
+                init_request['ec'] = list(ec)
+            if dedup:
+                init_request['checksums'] = self.chunk_checksums(path, block_size=file_block_size)
+            init_requests.append(init_request)
+            chunked.append(path)
+        
+        # 1. Plan every chunked file at once
+        plans = []
+        if init_requests:
+            try:
+                resp = self._call_master({'type': 'UPLOAD_INIT_BATCH', 'files': init_requests}, shard_key)
+            except Exception as e:
+                if log_callback: log_callback(f"Error connecting to Master: {e}")
+                return results
+            if not resp or resp.get('status') != 'OK':
+                if log_callback: log_callback(f"Upload failed: {resp.get('message') if resp else 'no reply from Master'}")
+                return results
+            plans = resp['files']
+        
+        # 2. Push all chunks of all files through one pool
+        block_sizes = {}
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            futures = {}
+            for path, plan in zip(chunked, plans):
+                if plan['status'] != 'OK':
+                    if log_callback: log_callback(f"Upload of {path} failed: {plan.get('message')}")
+                    continue
+                futures[path] = [pool.submit(self._upload_chunk_at, path, i, chunk_info, codec, ec,
+                                             plan['block_size'], log_callback)
+                                 for i, chunk_info in enumerate(plan['chunks'])]
+                block_sizes[path] = plan['block_size']
+            for path, chunk_futures in futures.items():
+                placed = [fut.result() for fut in chunk_futures]
+                if any(item is None for item in placed):
+                    # Some chunk could not be placed anywhere: do not commit this file
+                    if log_callback: log_callback(f"Upload of {path} failed: a chunk could not be stored")
+                    continue
+                request = {
+                    'filename': os.path.basename(path),
+                    'filesize': os.path.getsize(path),
+                    'codec': codec,
+                    'chunking': 'fixed',
+                    'block_size': block_sizes[path],
+                    'chunks_placed': placed
+                }
+                if ec:
+                    request['ec'] = list(ec)
+                commits[path] = request
+        
+        # 3. Commit everything with a single metadata write
+        if not commits:
+            return results
+        paths = list(commits)
+        try:
+            resp = self._call_master({'type': 'UPLOAD_SUCCESS_BATCH', 'files': [commits[p] for p in paths]}, shard_key)
+        except Exception as e:
+            if log_callback: log_callback(f"Error finalizing upload: {e}")
+            return results
+        if not resp or resp.get('status') != 'OK':
+            if log_callback: log_callback(f"Upload failed: {resp.get('message') if resp else 'no reply from Master'}")
+            return results
+        for path, result in zip(paths, resp['files']):
+            results[path] = result['status'] == 'OK'
+            if log_callback and not results[path]:
+                log_callback(f"Upload of {path} failed: {result.get('message')}")
+        
+        if log_callback: log_callback(f"Batch upload: {sum(results.values())} of {len(results)} files stored")
+        return results
+
+    def _upload_chunk_at(self, filepath, index, chunk_info, codec, ec, block_size, log_callback=None):
+        """Read fixed-size chunk `index` of a file and place it (worker for upload_many)."""
+        with open(filepath, 'rb') as f:
+            f.seek(index * block_size)
+            raw_data = f.read(block_size)
+        return self._place_chunk(chunk_info, raw_data, codec, ec, log_callback)
+
+    def download_many(self, filenames, dest_dir, log_callback=None, max_in_flight=TRANSFER_CONCURRENCY):
+        """
+        Download many files into dest_dir with one planning round trip to Master
+        (none if every plan is cached). Fixed-size chunks of all files are fetched
+        concurrently and written at their offsets. Returns {filename: True/False}.
+        """
+        results = {name: False for name in filenames}
+        groups = self._group_by_shard(filenames)
+        if len(groups) > 1:
+            for group in groups:
+                results.update(self.download_many(group, dest_dir, log_callback, max_in_flight))
+            return results
+        plans, tags = {}, {}
+        for filename in results:
+            plan, tag = self.metadata_cache.lookup(('DOWNLOAD_REQ', filename))
+            if plan is not None:
+                plans[filename] = plan
+            elif tag is not None:
+                tags[filename] = tag
+        missing = [filename for filename in results if filename not in plans]
+        if missing:
+            try:
+                resp = self._call_reader({'type': 'DOWNLOAD_REQ_BATCH', 'filenames': missing, 'tags': tags}, missing[0])
+            except Exception as e:
+                if log_callback: log_callback(f"Error connecting to Master: {e}")
+                return results
+            if not resp or resp.get('status') != 'OK':
+                if log_callback: log_callback(f"Download failed: {resp.get('message') if resp else 'no reply from Master'}")
+                return results
+            for filename, plan in resp['files'].items():
+                plans[filename] = self.metadata_cache.update(('DOWNLOAD_REQ', filename), plan)
+        
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            futures = {}
+            for filename, plan in plans.items():
+                save_path = os.path.join(dest_dir, filename)
+                if plan['status'] != 'OK':
+                    if log_callback: log_callback(f"Download of {filename} failed: {plan.get('message')}")
+                    continue
+                if 'inline' in plan or plan.get('chunking', 'fixed') != 'fixed':
+                    # Variable-size chunks have no known offsets, fetch them in order
+                    futures[filename] = [pool.submit(self._save_from_plan, plan, save_path, log_callback)]
+                    continue
+                with open(save_path, 'wb') as f:
+                    f.truncate(plan['filesize'])
+                futures[filename] = [pool.submit(self._download_chunk_at, save_path, i, chunk_info, plan.get('codec', 'none'),
+                                                 plan.get('block_size', BLOCK_SIZE), log_callback)
+                                     for i, chunk_info in enumerate(plan['chunks'])]
+            for filename, file_futures in futures.items():
+                results[filename] = all(fut.result() for fut in file_futures)
+                if not results[filename]:
+                    self.metadata_cache.invalidate(('DOWNLOAD_REQ', filename)) # Ask Master next time
+        
+        if log_callback: log_callback(f"Batch download: {sum(results.values())} of {len(results)} files retrieved")
+        return results
+
+    def _download_chunk_at(self, save_path, index, chunk_info, codec, block_size, log_callback=None):
+        """Fetch fixed-size chunk `index` and write it at its offset (worker for download_many)."""
+        data = self._read_chunk(chunk_info, codec, log_callback)
+        if data is None:
+            return False
+        with open(save_path, 'r+b') as f:
+            f.seek(index * block_size)
+            f.write(data)
+        return True
+
+    def delete_file(self, filename, log_callback=None):
+        if log_callback: log_callback(f"Deleting file: {filename}")
+        try:
+            resp = self._call_master({'type': 'DELETE_FILE', 'filename': filename}, filename)
+            if resp['status'] == 'OK':
+                if log_callback: log_callback("File deleted successfully.")
+                return True
+            else:
+                if log_callback: log_callback(f"Deletion failed: {resp.get('message')}")
+                return False
+        except Exception as e:
+            if log_callback: log_callback(f"Deletion error: {e}")
+            return False
+
+    def _namespace_op(self, request, done_msg, log_callback=None, filename=None):
+        """
+        Send a metadata-only request to the Master owning filename, or to every
+        master shard when filename is None; True if all of them succeeded.
+        """
+        try:
+            replies = [self._call_master(request, filename)] if filename is not None else self._call_all(request)
+        except Exception as e:
+            if log_callback: log_callback(f"Error connecting to Master: {e}")
+            return False
+        for resp in replies:
+            if not resp or resp['status'] != 'OK':
+                if log_callback: log_callback(f"Request failed: {resp.get('message') if resp else 'no reply from Master'}")
+                return False
+        if log_callback: log_callback(done_msg)
+        return True
+
+    def rename_file(self, src, dst, overwrite=False, log_callback=None):
+        return self._namespace_op({'type': 'RENAME', 'src': src, 'dst': dst, 'overwrite': overwrite},
+                                  f"Renamed {src} -> {dst}", log_callback, src)
+
+    def clone_file(self, src, dst, snapshot=None, overwrite=False, log_callback=None):
+        """Copy a file without moving data; with snapshot, copy it out of that snapshot."""
+        request = {'type': 'CLONE', 'src': src, 'dst': dst, 'overwrite': overwrite}
+        if snapshot is not None:
+            request['snapshot'] = snapshot
+        return self._namespace_op(request, f"Cloned {src} -> {dst}", log_callback, src)
+
+    def create_snapshot(self, name, log_callback=None):
+        return self._namespace_op({'type': 'SNAPSHOT_CREATE', 'name': name}, f"Snapshot {name} created", log_callback)
+
+    def restore_snapshot(self, name, log_callback=None):
+        return self._namespace_op({'type': 'SNAPSHOT_RESTORE', 'name': name}, f"Restored snapshot {name}", log_callback)
+
+    def delete_snapshot(self, name, log_callback=None):
+        return self._namespace_op({'type': 'SNAPSHOT_DELETE', 'name': name}, f"Snapshot {name} deleted", log_callback)
+
+    def list_snapshots(self):
+        """Snapshots of the whole namespace; with federation, each shard's part is merged by name."""
+        try:
+            replies = self._call_all({'type': 'SNAPSHOT_LIST'}, read=True)
+        except Exception:
+            return None
+        merged = {}
+        for reply in replies:
+            if not reply or reply['status'] != 'OK':
+                return reply
+            for snap in reply['snapshots']:
+                entry = merged.setdefault(snap['name'], dict(snap, files=0, size=0))
+                entry['created'] = min(entry['created'], snap['created'])
+                entry['files'] += snap['files']
+                entry['size'] += snap['size']
+        return {'status': 'OK', 'snapshots': list(merged.values())}
+
+    def decommission_node(self, node_id, log_callback=None):
+        """Drain node_id: Master copies its chunks elsewhere and then releases it."""
+        return self._namespace_op({'type': 'DECOMMISSION', 'node_id': node_id},
+                                  f"Decommissioning {node_id}; it is released once its chunks are copied", log_callback)
+
+    def rebalance(self, action='status', bandwidth=None, log_callback=None):
+        """
+        Pause, resume or query Master's rebalancer (every shard's, which each move
+        their own chunks); returns its state, or None on failure.
+        """
+        try:
+            replies = self._call_all({'type': 'REBALANCE', 'action': action, 'bandwidth': bandwidth})
+        except Exception as e:
+            if log_callback: log_callback(f"Error connecting to Master: {e}")
+            return None
+        for resp in replies:
+            if not resp or resp['status'] != 'OK':
+                if log_callback: log_callback(f"Request failed: {resp.get('message') if resp else 'no reply from Master'}")
+                return None
+        state = dict(replies[0]['rebalancer'])
+        for resp in replies[1:]:
+            state['active'] = state['active'] or resp['rebalancer']['active']
+            state['moved_chunks'] += resp['rebalancer']['moved_chunks']
+            state['moved_bytes'] += resp['rebalancer']['moved_bytes']
+        if log_callback and action != 'status':
+            log_callback(f"Rebalancer {'paused' if state['paused'] else 'running'}")
+        return state
+
+    def set_qos(self, limits, node_id=None, log_callback=None):
+        """
+        Change traffic class limits ({'foreground'/'background': bytes/s, 0 = unlimited})
+        on one node, or on every online node. True if all of them accepted.
+        """
+        stats = self.get_stats()
+        if not stats or stats['status'] != 'OK':
+            if log_callback: log_callback("Error connecting to Master")
+            return False
+        targets = {nid: info['address'] for nid, info in stats['nodes'].items()
+                   if (node_id is None and info['status'] == 'ONLINE') or nid == node_id}
+        if not targets:
+            if log_callback: log_callback(f"No node {node_id} online")
+            return False
+        ok = True
+        for nid, address in targets.items():
+            try:
+                resp = self._round_trip(tuple(address), {'type': 'SET_QOS', 'limits': limits})
+            except Exception as e:
+                resp = {'status': 'ERROR', 'message': str(e)}
+            if not resp or resp['status'] != 'OK':
+                ok = False
+                if log_callback: log_callback(f"QoS change on {nid} failed: {resp.get('message') if resp else 'no reply'}")
+            elif log_callback:
+                log_callback(f"QoS limits on {nid}: {resp['limits']}")
+        return ok
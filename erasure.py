@@ -0,0 +1,122 @@
+import struct
+import numpy as np
+
+# GF(2^8) arithmetic with the 0x11D polynomial (same field as most RS implementations)
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    GF_EXP[_i] = _x
+    GF_LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11D
+for _i in range(255, 512):
+    GF_EXP[_i] = GF_EXP[_i - 255]
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+def gf_inv(a):
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(2^8)")
+    return GF_EXP[255 - GF_LOG[a]]
+
+def fragment_id(chunk_id, index):
+    """Name under which a node stores fragment `index` of an erasure-coded chunk."""
+    return f"{chunk_id}_frag_{index}"
+
+def _build_mul_table():
+    """MUL_TABLE[c] maps every byte b to c*b, so a whole fragment is scaled with one fancy index."""
+    log = np.array(GF_LOG, dtype=np.int32)
+    exp = np.array(GF_EXP, dtype=np.uint8)
+    table = exp[(log[:, None] + log[None, :])]
+    table[0, :] = 0
+    table[:, 0] = 0
+    return table
+
+MUL_TABLE = _build_mul_table()
+
+def _invert_matrix(matrix):
+    """Gauss-Jordan inversion of a small square matrix over GF(2^8)."""
+    n = len(matrix)
+    aug = [list(row) + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if aug[r][col]), None)
+        if pivot is None:
+            raise ValueError("Singular matrix")
+        aug[col], aug[pivot] = aug[pivot], aug[col]
+        inv = gf_inv(aug[col][col])
+        aug[col] = [gf_mul(v, inv) for v in aug[col]]
+        for r in range(n):
+            if r != col and aug[r][col]:
+                factor = aug[r][col]
+                aug[r] = [v ^ gf_mul(factor, p) for v, p in zip(aug[r], aug[col])]
+    return [row[n:] for row in aug]
+
+class ReedSolomon:
+    """
+    Systematic Reed-Solomon code with k data and m parity fragments.
+    Fragments 0..k-1 are slices of the (length-prefixed, padded) input,
+    fragments k..k+m-1 are parity built from a Cauchy matrix, so any k
+    of the k+m fragments are enough to rebuild the data.
+    """
+    def __init__(self, k, m):
+        if k < 1 or m < 0 or k + m > 256:
+            raise ValueError(f"Invalid erasure scheme k={k}, m={m}")
+        self.k = k
+        self.m = m
+        # Rows of the full (k+m) x k encoding matrix: identity on top, Cauchy below
+        self.matrix = [[1 if i == j else 0 for j in range(k)] for i in range(k)]
+        for i in range(m):
+            self.matrix.append([gf_inv((k + i) ^ j) for j in range(k)])
+
+    def _combine(self, coefficients, fragments):
+        out = np.zeros(len(fragments[0]), dtype=np.uint8)
+        for coef, frag in zip(coefficients, fragments):
+            if coef == 1:
+                out ^= frag
+            elif coef:
+                out ^= MUL_TABLE[coef][frag]
+        return out
+
+    def encode(self, data):
+        """Split data into k+m equally sized fragments (list of bytes)."""
+        payload = struct.pack('>I', len(data)) + data
+        frag_len = max(1, -(-len(payload) // self.k))
+        buf = np.zeros(frag_len * self.k, dtype=np.uint8)
+        buf[:len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+        data_frags = buf.reshape(self.k, frag_len)
+
+        fragments = [data_frags[i].tobytes() for i in range(self.k)]
+        for row in self.matrix[self.k:]:
+            fragments.append(self._combine(row, data_frags).tobytes())
+        return fragments
+
+    def _data_fragments(self, fragments):
+        """Recover the k data fragments (numpy arrays) from any k of {index: bytes}."""
+        indices = sorted(fragments)[:self.k]
+        if len(indices) < self.k:
+            raise ValueError(f"Need {self.k} fragments, got {len(indices)}")
+        arrays = [np.frombuffer(fragments[i], dtype=np.uint8) for i in indices]
+        if indices == list(range(self.k)):
+            return arrays # Fast path: all data fragments present
+
+        decode_matrix = _invert_matrix([self.matrix[i] for i in indices])
+        return [self._combine(row, arrays) for row in decode_matrix]
+
+    def decode(self, fragments):
+        """Rebuild the original bytes from any k fragments given as {index: bytes}."""
+        payload = b''.join(frag.tobytes() for frag in self._data_fragments(fragments))
+        size = struct.unpack('>I', payload[:4])[0]
+        return payload[4:4 + size]
+
+    def reconstruct(self, fragments, wanted):
+        """Recompute only the fragment indices in wanted from any k available ones."""
+        data_frags = self._data_fragments(fragments)
+        rebuilt = {}
+        for i in wanted:
+            rebuilt[i] = self._combine(self.matrix[i], data_frags).tobytes()
+        return rebuilt
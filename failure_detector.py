@@ -0,0 +1,120 @@
+import heapq
+import math
+from collections import deque
+
+def phi(elapsed, mean, std):
+    """
+    -log10 of the probability that a heartbeat arrives more than `elapsed`
+    seconds after the previous one, with inter-arrival times ~ N(mean, std)
+    (logistic approximation of the normal CDF, as in Akka/Cassandra).
+    """
+    y = max(-20.0, min(20.0, (elapsed - mean) / std))
+    e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+    p_later = e / (1 + e) if elapsed > mean else 1 - 1 / (1 + e)
+    return -math.log10(max(p_later, 1e-300))
+
+def _deviations_for(threshold):
+    """y such that phi(mean + y * std, mean, std) == threshold, by bisection (phi grows with y)."""
+    lo, hi = 0.0, 20.0
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if phi(mid, 0.0, 1.0) < threshold:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+class PhiAccrualDetector:
+    """
+    Phi-accrual failure detector (Hayashibara et al.). Keeps a window of
+    heartbeat inter-arrival times per node; a node's suspicion phi grows the
+    longer it stays silent relative to its own history. Each node sits in a
+    heap keyed by the time its phi reaches the next threshold, so checking
+    only touches nodes that are actually expiring.
+    Not thread-safe: the master calls it under its lock.
+    """
+    def __init__(self, thresholds, window, min_std, first_interval):
+        self.thresholds = sorted(thresholds)
+        self.deviations = [_deviations_for(t) for t in self.thresholds]
+        self.window = window
+        self.min_std = min_std # Floor, so a very regular node is not failed on one late heartbeat
+        self.first_interval = first_interval # Assumed mean until a node has history
+        self.samples = {} # node_id -> [deque of intervals, sum, sum of squares]
+        self.last = {}    # node_id -> time of the last heartbeat
+        self.level = {}   # node_id -> index of the next threshold to cross
+        self.due = {}     # node_id -> deadline of its live heap entry
+        self.heap = []    # (deadline, node_id); entries not matching self.due are stale
+
+    def heartbeat(self, node_id, now):
+        """Record a heartbeat; True if the node's next deadline is now the earliest (wake the checker)."""
+        last = self.last.get(node_id)
+        if last is not None and now > last:
+            record = self.samples.setdefault(node_id, [deque(), 0.0, 0.0])
+            interval = now - last
+            record[0].append(interval)
+            record[1] += interval
+            record[2] += interval * interval
+            if len(record[0]) > self.window:
+                old = record[0].popleft()
+                record[1] -= old
+                record[2] -= old * old
+        self.last[node_id] = now
+        self.level[node_id] = 0
+        return self._schedule(node_id)
+
+    def forget(self, node_id):
+        """Drop a node's history (failed, left, or back after a failure)."""
+        for table in (self.samples, self.last, self.level, self.due):
+            table.pop(node_id, None)
+
+    def stats(self, node_id):
+        """(mean, std) of the node's heartbeat intervals."""
+        record = self.samples.get(node_id)
+        if not record or not record[0]:
+            return self.first_interval, max(self.min_std, self.first_interval / 4)
+        n = len(record[0])
+        mean = record[1] / n
+        variance = max(0.0, record[2] / n - mean * mean)
+        return mean, max(self.min_std, math.sqrt(variance))
+
+    def phi(self, node_id, now):
+        mean, std = self.stats(node_id)
+        return phi(now - self.last[node_id], mean, std)
+
+    def _schedule(self, node_id):
+        level = self.level[node_id]
+        if level >= len(self.thresholds):
+            self.due.pop(node_id, None)
+            return False
+        mean, std = self.stats(node_id)
+        due = self.last[node_id] + mean + self.deviations[level] * std
+        earliest = not self.heap or due < self.heap[0][0]
+        self.due[node_id] = due
+        heapq.heappush(self.heap, (due, node_id))
+        return earliest
+
+    def next_due(self):
+        """Earliest live deadline, or None."""
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap) # Superseded by a later heartbeat
+        return self.heap[0][0] if self.heap else None
+
+    def expired(self, now):
+        """Pop nodes whose phi crossed their next threshold by now: [(node_id, threshold index)]."""
+        crossed = []
+        while self.heap and self.heap[0][0] <= now:
+            due, node_id = heapq.heappop(self.heap)
+            if self.due.get(node_id) != due:
+                continue
+            crossed.append((node_id, self.level[node_id]))
+            self.level[node_id] += 1
+            self._schedule(node_id)
+        return crossed
+
+    def defer(self, delay):
+        """Shift every node's silence by delay: the checker itself was stalled, not the nodes."""
+        for node_id in self.last:
+            self.last[node_id] += delay
+        self.due = {node_id: due + delay for node_id, due in self.due.items()}
+        self.heap = [(due, node_id) for node_id, due in self.due.items()]
+        heapq.heapify(self.heap)
@@ -0,0 +1,163 @@
+import socket
+import threading
+import time
+import logging
+import os
+import sys
+import tempfile
+from config import *
+from utils import send_json, receive_json, recv_all
+from metastore import load_snapshot
+from master import MasterService
+
+class FollowerService(MasterService):
+    """
+    Read-only replica of the master's metadata. Tails the leader's change
+    journal with METADATA_SYNC long polls and answers read RPCs from its own
+    copy while it is at most FOLLOWER_MAX_STALENESS behind; everything else
+    (and reads while it is stale) is forwarded to the leader.
+    Runs no failure detector, GC or rebalancer: the leader owns those.
+    """
+    READ_REQUESTS = {'GET_STATS', 'LIST_FILES', 'DOWNLOAD_REQ', 'DOWNLOAD_REQ_BATCH', 'GET_CHECKSUMS', 'SNAPSHOT_LIST'}
+
+    def __init__(self, port, leader_host=MASTER_HOST, leader_port=MASTER_PORT, host=MASTER_HOST):
+        self.leader = (leader_host, leader_port)
+        self.leader_epoch = None
+        self.synced_seq = -1
+        self.last_sync = 0 # Our copy is at least as new as the leader was at this time
+        super().__init__(host, port)
+
+    def load_metadata(self):
+        pass # Everything comes from the leader
+
+    def save_metadata(self):
+        pass
+
+    def start(self):
+        threading.Thread(target=self.sync_loop, daemon=True).start()
+        self.serve()
+
+    def handle_request(self, sock, request):
+        if request.get('type') in self.READ_REQUESTS and time.time() - self.last_sync <= FOLLOWER_MAX_STALENESS:
+            super().handle_request(sock, request)
+        else:
+            self.forward(sock, request)
+
+    def _grant_lease(self, filename, plan):
+        return 0 # Writes wait on the leader's leases only; our plans must be revalidated
+
+    def forward(self, sock, request):
+        """Relay one request/response round trip to the leader."""
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ls:
+                ls.connect(self.leader)
+                send_json(ls, request)
+                reply = receive_json(ls)
+        except Exception as e:
+            reply = None
+            logging.warning(f"Could not forward {request.get('type')} to leader: {e}")
+        send_json(sock, reply or {'status': 'ERROR', 'message': 'Leader unavailable'})
+
+    def sync_loop(self):
+        while self.running:
+            try:
+                self.sync_once()
+            except Exception as e:
+                logging.warning(f"Sync with leader {self.leader} failed: {e}")
+                time.sleep(1)
+
+    def sync_once(self, wait=FOLLOWER_SYNC_WAIT):
+        """One METADATA_SYNC round trip; applies the changes (or full snapshot) it returns."""
+        asked = time.time()
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.connect(self.leader)
+            send_json(sock, {'type': 'METADATA_SYNC', 'epoch': self.leader_epoch,
+                             'since': self.synced_seq, 'wait': wait})
+            reply = receive_json(sock)
+            if not reply or reply['status'] != 'OK':
+                raise ConnectionError(reply.get('message') if reply else 'no reply')
+            snapshot = recv_all(sock, reply['size']) if reply['full'] else None
+            if reply['full'] and snapshot is None:
+                raise ConnectionError('snapshot transfer interrupted')
+
+        if snapshot is not None:
+            self._load_full(snapshot)
+        with self.lock:
+            if not reply['full']:
+                try:
+                    self._apply_changes(reply)
+                except Exception:
+                    self.leader_epoch = None # Half-applied: start over from a full snapshot
+                    raise
+            self.nodes = reply['nodes']
+            self.leader_epoch = reply['epoch']
+            self.synced_seq = reply['seq']
+            self.last_sync = asked
+
+    def _load_full(self, snapshot):
+        fd, path = tempfile.mkstemp(dir='.', suffix='.sync')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(snapshot)
+            table, files, snapshots = load_snapshot(path)
+        finally:
+            os.remove(path)
+        with self.lock:
+            self._use_chunk_table(table)
+            self.files = files
+            self.snapshots = snapshots
+            self.rebuild_chunk_refs(recount=False)
+        logging.info(f"Loaded full metadata from leader: {len(files)} files, {table.live_chunks()} chunks.")
+
+    def _apply_changes(self, reply):
+        """Replay a METADATA_SYNC delta (caller holds the lock). Files first, so chunk refs match the leader's."""
+        for name, meta in reply['files'].items():
+            self._set_file(name, meta)
+        for name, snapshot in reply['snapshots'].items():
+            old = self.snapshots.pop(name, None)
+            if snapshot:
+                for file_meta in snapshot['files'].values():
+                    file_meta['chunks'] = self.chunks.chunk_list(file_meta['chunks'])
+                    self._add_chunk_refs(file_meta['chunks'])
+                self.snapshots[name] = snapshot
+            for file_meta in (old['files'].values() if old else ()):
+                self._release_chunks(file_meta)
+        for chunk_id, record in reply['chunks'].items():
+            if record is None:
+                self.chunk_locations.pop(chunk_id, None)
+                self.chunk_checksums.pop(chunk_id, None)
+                self.ec_chunks.pop(chunk_id, None)
+                continue
+            locations, checksum, ec = record
+            if locations is None:
+                self.chunk_locations.pop(chunk_id, None)
+            else:
+                self.chunk_locations[chunk_id] = locations
+            if checksum:
+                self.chunk_checksums[chunk_id] = checksum
+            if ec:
+                self.ec_chunks[chunk_id] = ec
+
+    def _set_file(self, name, meta):
+        """Install (or remove, for None) a file entry, moving chunk references like the leader did."""
+        old = self.files.pop(name, None)
+        if meta:
+            meta['chunks'] = self.chunks.chunk_list(meta['chunks'])
+            self._add_chunk_refs(meta['chunks'])
+            self.files[name] = meta
+        if old:
+            self._release_chunks(old)
+
+def start_follower():
+    if len(sys.argv) < 2:
+        print("Usage: python follower.py <port> [leader_host:leader_port]")
+        sys.exit(1)
+    port = int(sys.argv[1])
+    leader_host, leader_port = MASTER_HOST, MASTER_PORT
+    if len(sys.argv) > 2:
+        leader_host, _, leader_port = sys.argv[2].rpartition(':')
+        leader_port = int(leader_port)
+    FollowerService(port, leader_host or MASTER_HOST, leader_port).start()
+
+if __name__ == "__main__":
+    start_follower()
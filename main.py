@@ -8,11 +8,16 @@ from cleanup_ports import kill_processes_on_ports
 from client_app import DFSGUI
 import master
 import node
+import follower
 
 def run_master_cli():
     # Wrapper to run master
     master.start_master()
 
+def run_follower_cli():
+    # Wrapper to run a read-replica follower, args already in sys.argv
+    follower.start_follower()
+
 def run_node_cli():
     # Wrapper to run node, args already in sys.argv
     node.start_node()
@@ -129,6 +134,8 @@ def main_gui():
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         if sys.argv[1] == 'master':
+            # [main.py, master, shard_index] -> [script, shard_index]
+            sys.argv.pop(1)
             run_master_cli()
         elif sys.argv[1] == 'node':
             # Remove the 'node' arg so node.py sees [script, id, port]
@@ -136,6 +143,10 @@ if __name__ == "__main__":
             # node.py expects [script, id, port]
             sys.argv.pop(1) 
             run_node_cli()
+        elif sys.argv[1] == 'follower':
+            # [main.py, follower, port, leader] -> [script, port, leader]
+            sys.argv.pop(1)
+            run_follower_cli()
         else:
             main_gui()
     else:
@@ -1,62 +1,336 @@
 import socket
+import base64
+import binascii
 import threading
 import time
 import json
 import logging
 import random
 import uuid
+import copy
+import os
+import sys
+import tempfile
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from config import *
-from utils import send_json, receive_json, recv_all
+from utils import send_json, receive_json, recv_all, unpack_id_list, shard_of, block_size_for, CODECS
+from erasure import ReedSolomon, fragment_id
+from metastore import ChunkTable, InlineStore, load_snapshot, save_snapshot
+from failure_detector import PhiAccrualDetector
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Master - %(levelname)s - %(message)s')
 
 class MasterService:
-    def __init__(self, host=MASTER_HOST, port=MASTER_PORT):
+    def __init__(self, host=MASTER_HOST, port=MASTER_PORT, shard=(0, 1)):
         self.host = host
         self.port = port
         self.running = True
-        self.metadata_file = "dfs_metadata.json"
+        # (index, count): in a federated namespace this master owns the filenames
+        # with shard_of(filename, count) == index; storage nodes are shared
+        self.shard = tuple(shard)
+        if self.shard[1] > 1:
+            self.metadata_file = f"dfs_metadata.shard{self.shard[0]}.bin"
+            self.legacy_metadata_file = None
+        else:
+            self.metadata_file = "dfs_metadata.bin"
+            self.legacy_metadata_file = "dfs_metadata.json" # Converted on first start
         
         # Registry
         # node_id -> {address: (ip, port), last_heartbeat: timestamp, status: 'ONLINE', stats: {}}
+        # status: ONLINE, SUSPECT (overdue, not repaired yet), OFFLINE or DECOMMISSIONED
         self.nodes = {} 
         
+        # Heartbeat history and check schedule for failure_detector_loop
+        self.detector = PhiAccrualDetector([PHI_SUSPECT_THRESHOLD, PHI_FAIL_THRESHOLD], PHI_WINDOW,
+                                           PHI_MIN_STD, HEARTBEAT_INTERVAL)
+        self.detector_wakeup = threading.Event()
+        
+        # Change journal tailed by read-replica followers (METADATA_SYNC):
+        # (seq, 'file' | 'snapshot' | 'chunk', key); epoch identifies this process
+        self.journal = deque(maxlen=JOURNAL_SIZE)
+        self.journal_seq = 0
+        self.journal_cond = threading.Condition()
+        self.epoch = uuid.uuid4().hex
+        
+        # Per-chunk records, stored compactly (see metastore.ChunkTable)
+        self.chunks = ChunkTable()
+        self.chunks.on_change = self._journal_chunk
+        
         # Files
-        # filename -> {size: int, chunks: [chunk_id_1, ...]}
+        # filename -> {size: int, chunks: ChunkList of chunk_ids, codec: str, chunking: str, version: int,
+        #              block_size: int (chunk size of fixed chunking, BLOCK_SIZE when absent),
+        #              ec: [k, m] (only for erasure-coded files),
+        #              inline_ref: [generation, offset, length] in inline_store (tiny files, chunks is empty)}
+        # Followers (and snapshots from before the inline store) hold inline: base64 data instead
         self.files = {}
+        self.inline_store = InlineStore(os.path.splitext(self.metadata_file)[0] + '.inline')
+        self.inline_compact_at = 0   # Store size at which to check for dead bodies again
+        self.inline_unsaved = False  # Compacted, the previous generation goes once a snapshot is saved
         
         # Chunk locations
         # chunk_id -> [node_id_1, node_id_2]
-        self.chunk_locations = {}
+        # Erasure-coded chunks hold one entry per fragment index (None = fragment lost)
+        # Values are decoded copies: assign a new list to change a placement
+        self.chunk_locations = self.chunks.locations
+        
+        # Content hashes (SHA-256 of the uncompressed chunk)
+        # chunk_id -> checksum
+        self.chunk_checksums = self.chunks.checksums
+        
+        # Namespace snapshots
+        # name -> {created: timestamp, files: {filename: file_meta}} (chunks shared with live files)
+        self.snapshots = {}
+        
+        # Derived from self.files (reference counts are also stored in the snapshot)
+        # chunk_id -> number of file entries (live and snapshotted) referencing it
+        self.chunk_refs = self.chunks.refs
+        # codec + raw checksum -> chunk handle, used to deduplicate uploads
+        # (None until the first deduplicated upload needs it, see _dedup_index)
+        self.hash_index = None
+        # chunk_id -> [k, m] for erasure-coded chunks
+        self.ec_chunks = {}
+        
+        # Pending deletions, sent in bulk by gc_loop
+        # node_id -> {stored_id, ...}; kept while the node is offline
+        self.gc_queue = {}
+        self.gc_wakeup = threading.Event()
+        
+        # Stored objects no file references, from block reports
+        # (node_id, stored_id) -> first seen; deleted after ORPHAN_GRACE_PERIOD
+        self.orphans = {}
+        
+        # Copies being made by Master (repair, rebalance) that are not in
+        # chunk_locations yet: {(node_id, stored_id)}; block reports leave them alone
+        self.pending_copies = set()
+        
+        # Download plans clients may cache: filename -> when the last lease on it
+        # expires. Writes to a file wait for its leases (_honoring_leases), and
+        # plans read meanwhile get none; None in lease_waits stands for every file
+        self.read_leases = {}
+        self.lease_waits = {} # filename -> writers waiting
+        
+        # Background rebalancer (pause/resume with the REBALANCE command)
+        self.rebalance = {'paused': False, 'active': False, 'bandwidth': REBALANCE_BANDWIDTH,
+                          'moved_chunks': 0, 'moved_bytes': 0, 'last_pass': None}
+        self.rebalance_wakeup = threading.Event()
         
         self.lock = threading.RLock() # Thread safety for registries
+        self.started = time.time()
+        self.unregistered_checked = False
         self.load_metadata()
 
+    def _use_chunk_table(self, table):
+        table.on_change = self._journal_chunk
+        self.chunks = table
+        self.chunk_locations = table.locations
+        self.chunk_checksums = table.checksums
+        self.chunk_refs = table.refs
+
     def load_metadata(self):
         if os.path.exists(self.metadata_file):
             try:
-                with open(self.metadata_file, 'r') as f:
+                start = time.time()
+                table, self.files, self.snapshots = load_snapshot(self.metadata_file)
+                self._use_chunk_table(table)
+                self.rebuild_chunk_refs(recount=False) # Reference counts are part of the snapshot
+                logging.info(f"Loaded metadata: {len(self.files)} files, {table.live_chunks()} chunks in {time.time() - start:.2f}s.")
+                self._migrate_inline()
+            except Exception as e:
+                logging.error(f"Failed to load metadata: {e}")
+        elif self.legacy_metadata_file and os.path.exists(self.legacy_metadata_file):
+            try:
+                with open(self.legacy_metadata_file, 'r') as f:
                     data = json.load(f)
-                    self.files = data.get('files', {})
-                    self.chunk_locations = data.get('chunk_locations', {})
-                logging.info(f"Loaded metadata: {len(self.files)} files.")
+                self.chunk_locations.update(data.get('chunk_locations', {}))
+                self.chunk_checksums.update(data.get('chunk_checksums', {}))
+                self.files = data.get('files', {})
+                self.snapshots = data.get('snapshots', {})
+                for meta in self._all_file_metas():
+                    meta['chunks'] = self.chunks.chunk_list(meta['chunks'])
+                self.rebuild_chunk_refs()
+                # From now on only the binary snapshot is written; the JSON file is left as it was
+                self._migrate_inline()
+                self.save_metadata()
+                logging.info(f"Converted {self.legacy_metadata_file} to {self.metadata_file}: {len(self.files)} files.")
             except Exception as e:
                 logging.error(f"Failed to load metadata: {e}")
 
     def save_metadata(self):
         try:
-            with open(self.metadata_file, 'w') as f:
-                json.dump({
-                    'files': self.files,
-                    'chunk_locations': self.chunk_locations
-                }, f)
+            self._compact_inline()
+            save_snapshot(self.metadata_file, self.chunks, self.files, self.snapshots)
+            if self.inline_unsaved:
+                self.inline_store.drop_unused(m['inline_ref'] for m in self._all_file_metas() if 'inline_ref' in m)
+                self.inline_unsaved = False
         except Exception as e:
             logging.error(f"Failed to save metadata: {e}")
 
+    def _compact_inline(self):
+        """
+        Copy the live inline bodies to a new store generation once dead ones (deleted or
+        overwritten files) exceed both them and INLINE_COMPACT_BYTES (caller holds the lock).
+        Checked again only after the store grew by that much, so appends stay amortized O(1).
+        """
+        store = self.inline_store
+        if store.size < self.inline_compact_at:
+            return
+        metas = [m for m in self._all_file_metas() if 'inline_ref' in m]
+        live = sum(ref[2] for ref in {tuple(m['inline_ref']) for m in metas})
+        if store.size - live > max(live, INLINE_COMPACT_BYTES):
+            size = store.size
+            moved = store.compact([m['inline_ref'] for m in metas])
+            for m in metas:
+                m['inline_ref'] = moved[tuple(m['inline_ref'])]
+            self.inline_unsaved = True
+            logging.info(f"Compacted the inline store: kept {live} of {size} bytes.")
+        self.inline_compact_at = store.size + max(live, INLINE_COMPACT_BYTES)
+
+    def _migrate_inline(self):
+        """Move inline bodies a loaded snapshot still carries as base64 into the inline store."""
+        metas = [m for m in self._all_file_metas() if 'inline' in m]
+        for m in metas:
+            m['inline_ref'] = self.inline_store.append(base64.b64decode(m.pop('inline')))
+        if metas:
+            self.save_metadata()
+            logging.info(f"Moved {len(metas)} inline bodies out of the metadata snapshot.")
+
+    def _inline_body(self, file_meta):
+        """Base64 data of an inline file (caller holds the lock)."""
+        if 'inline' in file_meta:
+            return file_meta['inline']
+        return base64.b64encode(self.inline_store.read(file_meta['inline_ref'])).decode('ascii')
+
+    def _with_inline_body(self, file_meta):
+        """file_meta with its inline body resolved, as followers keep it."""
+        if 'inline_ref' not in file_meta:
+            return file_meta
+        meta = {key: value for key, value in file_meta.items() if key != 'inline_ref'}
+        meta['inline'] = self._inline_body(file_meta)
+        return meta
+
+    def _owns(self, filename):
+        return shard_of(filename, self.shard[1]) == self.shard[0]
+
+    def _owns_stored(self, stored_id):
+        """
+        Whether a chunk or fragment a node stores belongs to this shard. Chunk IDs
+        start with the name of the file they were uploaded as, which renames and
+        clones never move to another shard; unrecognised names belong to shard 0.
+        """
+        if self.shard[1] == 1:
+            return True
+        name, sep, _ = stored_id.rpartition('_chunk_')
+        return self._owns(name) if sep else self.shard[0] == 0
+
+    def _wrong_shard(self, filename):
+        return {'status': 'ERROR', 'filename': filename,
+                'message': f"{filename} belongs to shard {shard_of(filename, self.shard[1])}, not {self.shard[0]}"}
+
+    def _journal(self, kind, key):
+        """Record that a file, snapshot or chunk changed (caller holds the lock)."""
+        with self.journal_cond:
+            self.journal_seq += 1
+            self.journal.append((self.journal_seq, kind, key))
+            self.journal_cond.notify_all()
+
+    def _journal_chunk(self, chunk_id):
+        self._journal('chunk', chunk_id)
+
+    def rebuild_chunk_refs(self, recount=True):
+        """
+        Recompute derived state from file metadata: reference counts (unless
+        the snapshot already carried them) and the erasure-coded chunk index.
+        The dedup index is dropped and rebuilt lazily by _dedup_index.
+        """
+        if recount:
+            self.chunks.clear_refs()
+        self.hash_index = None
+        self.ec_chunks = {}
+        for meta in self._all_file_metas():
+            if recount:
+                self.chunks.add_refs(meta['chunks'])
+            if meta.get('ec'):
+                for cid in meta['chunks']:
+                    self.ec_chunks[cid] = meta['ec']
+
+    def _dedup_index(self):
+        """The dedup index, built on first use so large namespaces start quickly (caller holds the lock)."""
+        if self.hash_index is None:
+            start = time.time()
+            index = {}
+            for meta in self._all_file_metas():
+                if meta.get('ec'):
+                    continue # Fragments are not deduplicated
+                codec = meta.get('codec', 'none')
+                for h in meta['chunks'].handles():
+                    checksum = self.chunks.digest(h)
+                    if checksum and self.chunks.has_locations(h):
+                        index.setdefault(self._dedup_key(codec, checksum), h)
+            self.hash_index = index
+            logging.info(f"Built dedup index: {len(index)} chunks in {time.time() - start:.2f}s.")
+        return self.hash_index
+
+    def _all_file_metas(self):
+        """Every file entry holding chunk references: the live namespace and all snapshots."""
+        metas = list(self.files.values())
+        for snap in self.snapshots.values():
+            metas.extend(snap['files'].values())
+        return metas
+
+    @staticmethod
+    def _dedup_key(codec, checksum):
+        # Stored bytes depend on the codec, so identical content is only shared within one codec
+        if isinstance(checksum, str):
+            checksum = bytes.fromhex(checksum)
+        return codec.encode() + b':' + checksum
+
+    def _add_chunk_refs(self, chunk_ids):
+        self.chunks.add_refs(self.chunks.chunk_list(chunk_ids))
+
+    @staticmethod
+    def _delete_items(chunk_id, node_ids, ec):
+        """Expand a chunk placement into [{chunk_id, nodes}] entries for _cleanup_chunks."""
+        if ec:
+            return [{'chunk_id': fragment_id(chunk_id, i), 'nodes': [nid]}
+                    for i, nid in enumerate(node_ids) if nid]
+        return [{'chunk_id': chunk_id, 'nodes': list(node_ids)}] # Copy list
+
+    def _release_chunks(self, file_meta):
+        """
+        Drop one reference per chunk of file_meta (caller holds the lock).
+        Returns [{chunk_id, nodes}] for chunks that are no longer referenced.
+        """
+        codec = file_meta.get('codec', 'none')
+        freed = []
+        for cid in file_meta['chunks']:
+            refs = self.chunk_refs.get(cid, 0) - 1
+            if refs > 0:
+                self.chunk_refs[cid] = refs
+                continue
+            handle = self.chunks.handle(cid)
+            self.chunk_refs.pop(cid, None)
+            checksum = self.chunk_checksums.pop(cid, None)
+            if checksum and self.hash_index is not None and self.hash_index.get(self._dedup_key(codec, checksum)) == handle:
+                del self.hash_index[self._dedup_key(codec, checksum)]
+            ec = self.ec_chunks.pop(cid, None)
+            if cid in self.chunk_locations:
+                freed.extend(self._delete_items(cid, self.chunk_locations[cid], ec))
+                del self.chunk_locations[cid]
+        return freed
+
     def start(self):
         # Start Failure Detector
         threading.Thread(target=self.failure_detector_loop, daemon=True).start()
-        
+        # Start Garbage Collector
+        threading.Thread(target=self.gc_loop, daemon=True).start()
+        # Start Rebalancer
+        threading.Thread(target=self.rebalance_loop, daemon=True).start()
+        self.serve()
+
+    def serve(self):
         # Start TCP Server
         server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -74,36 +348,167 @@ class MasterService:
             server_sock.close()
 
     def failure_detector_loop(self):
-        """Monitor heartbeats and trigger replication if node fails."""
+        """
+        Phi-accrual failure detection: sleep until the next node's suspicion
+        crosses a threshold. Past PHI_SUSPECT_THRESHOLD a node is SUSPECT (no
+        new chunks or reads, but no repair yet); past PHI_FAIL_THRESHOLD it is
+        OFFLINE and its chunks are re-replicated. A heartbeat clears suspicion.
+        """
         while self.running:
-            time.sleep(1)
+            with self.lock:
+                due = self.detector.next_due()
+            wake_at = time.time() + 1 if due is None else due
+            if not self.unregistered_checked:
+                wake_at = min(wake_at, self.started + NODE_TIMEOUT)
+            wake_at = max(wake_at, time.time())
+            self.detector_wakeup.wait(timeout=wake_at - time.time())
+            self.detector_wakeup.clear()
+            
             with self.lock:
                 now = time.time()
-                for node_id, info in list(self.nodes.items()):
-                    if info['status'] == 'ONLINE':
-                        if now - info['last_heartbeat'] > NODE_TIMEOUT:
-                            logging.warning(f"Node {node_id} TIMED OUT! Marking OFFLINE.")
-                            info['status'] = 'OFFLINE'
+                if now - wake_at > HEARTBEAT_INTERVAL:
+                    # We were stalled, not the nodes: their heartbeats may still be queued
+                    logging.warning(f"Failure detector ran {now - wake_at:.1f}s late; deferring node checks.")
+                    self.detector.defer(now - wake_at)
+                    continue
+                
+                for node_id, level in self.detector.expired(now):
+                    info = self.nodes.get(node_id)
+                    if not info or info['status'] not in ('ONLINE', 'SUSPECT'):
+                        self.detector.forget(node_id)
+                        continue
+                    suspicion = self.detector.phi(node_id, now)
+                    if level == 0:
+                        logging.warning(f"Node {node_id} SUSPECT (phi {suspicion:.1f}, "
+                                        f"{now - info['last_heartbeat']:.1f}s since last heartbeat).")
+                        info['status'] = 'SUSPECT'
+                    else:
+                        logging.warning(f"Node {node_id} TIMED OUT (phi {suspicion:.1f})! Marking OFFLINE.")
+                        info['status'] = 'OFFLINE'
+                        self.detector.forget(node_id)
+                        threading.Thread(target=self.handle_node_failure, args=(node_id,), daemon=True).start()
+                
+                if not self.unregistered_checked and now - self.started >= NODE_TIMEOUT:
+                    # After a restart, nodes that never came back are as good as failed
+                    self.unregistered_checked = True
+                    for node_id in self.chunks.node_ids.strings:
+                        if node_id not in self.nodes:
+                            logging.warning(f"Node {node_id} holds chunks but did not register since startup.")
                             threading.Thread(target=self.handle_node_failure, args=(node_id,), daemon=True).start()
 
     def handle_node_failure(self, failed_node_id):
         """Identify lost chunks and replicate them."""
         logging.info(f"Starting replication for failed node {failed_node_id}")
         chunks_to_replicate = []
+        stripes_to_repair = []
         
         with self.lock:
             # Find all chunks that were on this node
-            for chunk_id, locations in self.chunk_locations.items():
-                if failed_node_id in locations:
+            for chunk_id in self.chunks.chunks_on(failed_node_id):
+                locations = self.chunk_locations[chunk_id]
+                if chunk_id in self.ec_chunks:
+                    # Keep fragment positions; only the lost slots get rebuilt
+                    self.chunk_locations[chunk_id] = [None if nid == failed_node_id else nid for nid in locations]
+                    stripes_to_repair.append(chunk_id)
+                else:
                     locations.remove(failed_node_id)
+                    self.chunk_locations[chunk_id] = locations
                     chunks_to_replicate.append(chunk_id)
         
+        self._repair(chunks_to_replicate, stripes_to_repair)
+
+    def _repair(self, chunks_to_replicate, stripes_to_repair):
         for chunk_id in chunks_to_replicate:
             self.replicate_chunk(chunk_id)
+        for chunk_id in stripes_to_repair:
+            self.rebuild_fragments(chunk_id)
+
+    def _fetch_chunk(self, node_id, chunk_id):
+        """RETRIEVE_CHUNK from a node; returns the bytes or None."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.connect(self.nodes[node_id]['address'])
+            send_json(sock, {'type': 'RETRIEVE_CHUNK', 'chunk_id': chunk_id, 'qos': 'background'})
+            resp = receive_json(sock)
+            if resp and resp['status'] == 'OK':
+                return recv_all(sock, resp['size'])
+        return None
+
+    def _store_chunk(self, node_id, chunk_id, data):
+        """STORE_CHUNK on a node; returns True once the node acked."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.connect(self.nodes[node_id]['address'])
+            send_json(sock, {'type': 'STORE_CHUNK', 'chunk_id': chunk_id, 'size': len(data), 'qos': 'background'})
+            sock.sendall(data)
+            ack = receive_json(sock)
+            return bool(ack and ack['status'] == 'OK')
+
+    def rebuild_fragments(self, chunk_id):
+        """
+        Recompute the lost fragments of an erasure-coded chunk from any k
+        surviving ones and store them on nodes that hold no fragment yet.
+        """
+        with self.lock:
+            if chunk_id not in self.ec_chunks:
+                return
+            k, m = self.ec_chunks[chunk_id]
+            locations = list(self.chunk_locations.get(chunk_id, []))
+            missing = [i for i, nid in enumerate(locations) if nid is None]
+            sources = [(i, nid) for i, nid in enumerate(locations)
+                       if nid and self.nodes.get(nid, {}).get('status') == 'ONLINE']
+            candidates = [nid for nid in self._writable_nodes() if nid not in locations]
+        
+        if not missing:
+            return
+        if len(sources) < k:
+            logging.error(f"DATA LOSS WARNING: only {len(sources)} of {k} fragments left for chunk {chunk_id}")
+            return
+
+        fragments = {}
+        for i, nid in sources:
+            if len(fragments) == k:
+                break
+            try:
+                data = self._fetch_chunk(nid, fragment_id(chunk_id, i))
+                if data is not None:
+                    fragments[i] = data
+            except Exception as e:
+                logging.warning(f"Could not read fragment {i} of {chunk_id} from {nid}: {e}")
+        if len(fragments) < k:
+            logging.error(f"DATA LOSS WARNING: could not read {k} fragments of chunk {chunk_id}")
+            return
+
+        rebuilt = ReedSolomon(k, m).reconstruct(fragments, missing)
+        candidates = self._placement_sample(candidates, len(candidates))[::-1] # Best last, for pop()
+        for i in missing:
+            if not candidates:
+                logging.warning(f"Cannot rebuild fragment {i} of {chunk_id}: No available destination nodes.")
+                return
+            dest_node_id = candidates.pop()
+            with self.lock:
+                self.pending_copies.add((dest_node_id, fragment_id(chunk_id, i)))
+            try:
+                if self._store_chunk(dest_node_id, fragment_id(chunk_id, i), rebuilt[i]):
+                    with self.lock:
+                        locs = self.chunk_locations.get(chunk_id)
+                        # A block report may have recorded the new fragment already
+                        placed = bool(locs) and locs[i] in (None, dest_node_id)
+                        if placed:
+                            locs[i] = dest_node_id
+                            self.chunk_locations[chunk_id] = locs
+                    if placed:
+                        logging.info(f"Rebuilt fragment {i} of {chunk_id} on {dest_node_id}")
+                    else:
+                        # A concurrent repair (or a delete) got there first
+                        self._cleanup_chunks([{'chunk_id': fragment_id(chunk_id, i), 'nodes': [dest_node_id]}])
+            except Exception as e:
+                logging.error(f"Fragment rebuild failed for {chunk_id}[{i}]: {e}")
+            finally:
+                with self.lock:
+                    self.pending_copies.discard((dest_node_id, fragment_id(chunk_id, i)))
 
     def replicate_chunk(self, chunk_id):
         """
-        Copy chunk from a healthy replica to a new node.
+        Copy chunk from a healthy replica to a new node; True once the copy is recorded.
         """
         # 1. Find a source node
         source_node_id = None
@@ -122,10 +527,9 @@ class MasterService:
         # 2. Find a destination node (not already holding the chunk)
         dest_node_id = None
         with self.lock:
-            online_nodes = [nid for nid, info in self.nodes.items() if info['status'] == 'ONLINE']
-            candidates = [nid for nid in online_nodes if nid not in current_locations]
+            candidates = [nid for nid in self._writable_nodes() if nid not in current_locations]
             if candidates:
-                dest_node_id = random.choice(candidates)
+                dest_node_id = self._placement_sample(candidates, 1)[0]
         
         if not dest_node_id:
             logging.warning(f"Cannot replicate chunk {chunk_id}: No available destination nodes.")
@@ -134,164 +538,847 @@ class MasterService:
         logging.info(f"Replicating chunk {chunk_id} from {source_node_id} to {dest_node_id}")
 
         # 3. Perform transfer via Master (Source -> Master -> Dest)
+        with self.lock:
+            self.pending_copies.add((dest_node_id, chunk_id))
         try:
             # Fetch from Source
-            source_info = self.nodes[source_node_id]
-            data = None
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect(source_info['address'])
-                send_json(sock, {'type': 'RETRIEVE_CHUNK', 'chunk_id': chunk_id})
-                resp = receive_json(sock)
-                if resp and resp['status'] == 'OK':
-                    data = recv_all(sock, resp['size'])
+            data = self._fetch_chunk(source_node_id, chunk_id)
             
             if data:
                 # Push to Dest
-                dest_info = self.nodes[dest_node_id]
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                    sock.connect(dest_info['address'])
-                    send_json(sock, {'type': 'STORE_CHUNK', 'chunk_id': chunk_id, 'size': len(data)})
-                    sock.sendall(data)
-                    ack = receive_json(sock)
-                    if ack and ack['status'] == 'OK':
-                        with self.lock:
-                            if chunk_id in self.chunk_locations:
-                                self.chunk_locations[chunk_id].append(dest_node_id)
-                            logging.info(f"Replication successful for {chunk_id}")
+                if self._store_chunk(dest_node_id, chunk_id, data):
+                    with self.lock:
+                        # A block report may have recorded the copy already
+                        if chunk_id in self.chunk_locations and dest_node_id not in self.chunk_locations[chunk_id]:
+                            self.chunk_locations[chunk_id] = self.chunk_locations[chunk_id] + [dest_node_id]
+                        logging.info(f"Replication successful for {chunk_id}")
+                    return True
         except Exception as e:
             logging.error(f"Replication failed for {chunk_id}: {e}")
+        finally:
+            with self.lock:
+                self.pending_copies.discard((dest_node_id, chunk_id))
+        return False
+
+    def _writable_nodes(self):
+        """Online nodes that may receive new chunks, i.e. not draining (caller holds the lock)."""
+        return [nid for nid, info in self.nodes.items() if info['status'] == 'ONLINE' and not info.get('draining')]
+
+    def handle_decommission(self, sock, request):
+        """
+        Start draining a node: it gets no new chunks but keeps serving reads
+        while drain_node copies its chunks elsewhere.
+        """
+        node_id = request['node_id']
+        with self.lock:
+            info = self.nodes.get(node_id)
+            if not info or info['status'] != 'ONLINE':
+                send_json(sock, {'status': 'ERROR', 'message': f"Node {node_id} is not online"})
+                return
+            if info.get('draining'):
+                send_json(sock, {'status': 'ERROR', 'message': f"Node {node_id} is already draining"})
+                return
+            info['draining'] = True
+            pending = len(self._drain_work(node_id))
+        
+        threading.Thread(target=self.drain_node, args=(node_id,), daemon=True).start()
+        send_json(sock, {'status': 'OK', 'chunks': pending})
+        logging.info(f"Decommissioning {node_id}: {pending} chunks to copy away.")
+
+    def _drain_work(self, node_id):
+        """
+        (chunk_id, fragment index or None) for every chunk that still depends on
+        node_id: replicas short of REPLICATION_FACTOR elsewhere and EC fragments
+        still placed there (caller holds the lock).
+        """
+        writable = set(self._writable_nodes())
+        work = []
+        for chunk_id in self.chunks.chunks_on(node_id):
+            locations = self.chunk_locations[chunk_id]
+            if chunk_id in self.ec_chunks:
+                work.append((chunk_id, locations.index(node_id)))
+            elif sum(1 for nid in locations if nid in writable) < REPLICATION_FACTOR:
+                work.append((chunk_id, None))
+        return work
+
+    def drain_node(self, node_id):
+        """
+        Copy a draining node's chunks away, DECOMMISSION_CONCURRENCY at a time,
+        until no chunk depends on it, then release it. Stops if the node fails
+        meanwhile (handle_node_failure repairs the rest).
+        """
+        while self.running:
+            with self.lock:
+                info = self.nodes.get(node_id)
+                if not info or info['status'] not in ('ONLINE', 'SUSPECT') or not info.get('draining'):
+                    return
+                work = self._drain_work(node_id)
+                if not work:
+                    self._release_node(node_id)
+                    return
+            
+            with ThreadPoolExecutor(max_workers=DECOMMISSION_CONCURRENCY) as pool:
+                copied = sum(pool.map(lambda item: self._drain_chunk(node_id, *item), work))
+            logging.info(f"Drain of {node_id}: copied {copied} of {len(work)} chunks.")
+            if copied < len(work):
+                time.sleep(DECOMMISSION_RETRY_INTERVAL) # Not enough nodes, or transfers failed
+
+    def _drain_chunk(self, node_id, chunk_id, index):
+        """Add one replica elsewhere, or move EC fragment index off node_id; True on success."""
+        try:
+            if index is None:
+                return self.replicate_chunk(chunk_id)
+            with self.lock:
+                locations = self.chunk_locations.get(chunk_id) or []
+                candidates = [nid for nid in self._writable_nodes() if nid not in locations]
+            if not candidates:
+                logging.warning(f"Cannot move fragment {index} of {chunk_id} off {node_id}: No available destination nodes.")
+                return False
+            return self._move_chunk(chunk_id, index, node_id, self._placement_sample(candidates, 1)[0]) is not None
+        except Exception as e:
+            logging.error(f"Drain copy of {chunk_id} from {node_id} failed: {e}")
+            return False
+
+    def _release_node(self, node_id):
+        """Drop a fully drained node from every placement and mark it DECOMMISSIONED (caller holds the lock)."""
+        for chunk_id in self.chunks.chunks_on(node_id):
+            self.chunk_locations[chunk_id] = [nid for nid in self.chunk_locations[chunk_id] if nid != node_id]
+        self.nodes[node_id]['status'] = 'DECOMMISSIONED'
+        self.nodes[node_id]['draining'] = False
+        self.gc_queue.pop(node_id, None)
+        self.orphans = {key: seen for key, seen in self.orphans.items() if key[0] != node_id}
+        logging.info(f"Node {node_id} decommissioned; it can be shut down.")
+
+    def rebalance_loop(self):
+        """Run a rebalancing pass every REBALANCE_INTERVAL (and right after a resume) unless paused."""
+        while self.running:
+            self.rebalance_wakeup.wait(timeout=REBALANCE_INTERVAL)
+            self.rebalance_wakeup.clear()
+            if self.rebalance['paused']:
+                continue
+            try:
+                self.rebalance_pass()
+            except Exception as e:
+                logging.error(f"Rebalancer error: {e}")
+            finally:
+                with self.lock:
+                    self.rebalance['active'] = False
+                    self.rebalance['last_pass'] = time.time()
+
+    def rebalance_pass(self):
+        """
+        Move chunks from the fullest to the emptiest online node until every node
+        is within REBALANCE_THRESHOLD of the average utilization, at most
+        rebalance['bandwidth'] bytes/s. Utilization is stored bytes over capacity
+        (stored + free disk) from heartbeat stats, falling back to the node's
+        chunk count when a node does not report stored bytes.
+        Returns the number of chunks moved.
+        """
+        with self.lock:
+            held = {nid: [] for nid in self._writable_nodes()} # Draining nodes are emptied by drain_node
+            if len(held) < 2:
+                return 0
+            for chunk_id, locations in self.chunk_locations.items():
+                ec = chunk_id in self.ec_chunks
+                for index, node_id in enumerate(locations):
+                    if node_id in held:
+                        held[node_id].append((chunk_id, index if ec else None))
+            usage = {}
+            chunk_size = {} # Typical chunk on each node; files may use their own block size
+            for node_id, chunks in held.items():
+                stats = self.nodes[node_id].get('stats', {})
+                stored = stats.get('stored_bytes', len(chunks) * BLOCK_SIZE)
+                usage[node_id] = [stored, max(1, stored + stats.get('disk_free', 0))]
+                chunk_size[node_id] = stored / len(chunks) if chunks else BLOCK_SIZE
+            self.rebalance['active'] = True
+        for chunks in held.values():
+            random.shuffle(chunks) # Spread moves over files instead of draining one at a time
+        
+        moved, moved_bytes, started = 0, 0, time.time()
+        while self.running and not self.rebalance['paused'] and len(usage) > 1:
+            util = {nid: stored / capacity for nid, (stored, capacity) in usage.items()}
+            average = sum(util.values()) / len(util)
+            src = max(util, key=util.get)
+            dst = min(util, key=util.get)
+            if util[src] <= average * (1 + REBALANCE_THRESHOLD) and util[dst] >= average * (1 - REBALANCE_THRESHOLD):
+                break
+            # Stop before a move would leave the destination fuller than the source
+            step = chunk_size[src]
+            if (usage[src][0] - step) / usage[src][1] < (usage[dst][0] + step) / usage[dst][1]:
+                break
+            
+            size = None
+            while held[src] and size is None:
+                chunk_id, index = held[src].pop()
+                try:
+                    size = self._move_chunk(chunk_id, index, src, dst)
+                except Exception as e:
+                    # One failed copy (or unreachable node) only costs this chunk, not the pass
+                    logging.warning(f"Rebalancer could not move {chunk_id} from {src} to {dst}: {e}")
+            if size is None:
+                del usage[src] # Nothing it holds can move to dst
+                continue
+            usage[src][0] -= size
+            usage[dst][0] += size
+            moved += 1
+            moved_bytes += size
+            with self.lock:
+                self.rebalance['moved_chunks'] += 1
+                self.rebalance['moved_bytes'] += size
+            bandwidth = self.rebalance['bandwidth']
+            if bandwidth:
+                time.sleep(max(0, moved_bytes / bandwidth - (time.time() - started)))
+        
+        if moved:
+            logging.info(f"Rebalancer moved {moved} chunks ({moved_bytes} bytes) in {time.time() - started:.1f}s")
+        return moved
+
+    def _movable(self, chunk_id, index, src, dst):
+        """True if src holds the replica (or fragment index) and dst holds none of the chunk (caller holds the lock)."""
+        locations = self.chunk_locations.get(chunk_id)
+        if not locations or dst in locations:
+            return False
+        return src in locations if index is None else locations[index] == src
+
+    def _move_chunk(self, chunk_id, index, src, dst):
+        """
+        Replicate-then-delete one replica (or EC fragment index) from src to dst:
+        the source copy is queued for deletion only after dst is recorded.
+        Returns the bytes moved, or None if the chunk no longer qualifies.
+        """
+        stored_id = chunk_id if index is None else fragment_id(chunk_id, index)
+        with self.lock:
+            if not self._movable(chunk_id, index, src, dst):
+                return None
+            self.pending_copies.add((dst, stored_id))
+        try:
+            data = self._fetch_chunk(src, stored_id)
+            if data is None or not self._store_chunk(dst, stored_id, data):
+                raise ConnectionError(f"could not copy {stored_id} from {src} to {dst}")
+            with self.lock:
+                moved = self._movable(chunk_id, index, src, dst)
+                locations = self.chunk_locations.get(chunk_id) or []
+                if moved:
+                    locations[locations.index(src) if index is None else index] = dst
+                    self.chunk_locations[chunk_id] = locations
+                    stale = src
+                else:
+                    # Deleted or repaired meanwhile; drop the copy unless it got recorded
+                    recorded = dst in locations if index is None else index < len(locations) and locations[index] == dst
+                    stale = None if recorded else dst
+        finally:
+            with self.lock:
+                self.pending_copies.discard((dst, stored_id))
+        if stale:
+            self._cleanup_chunks([{'chunk_id': stored_id, 'nodes': [stale]}])
+        if not moved:
+            return None
+        logging.info(f"Rebalancer moved {stored_id} from {src} to {dst}")
+        return len(data)
+
+    def handle_metadata_sync(self, sock, request):
+        """
+        Change feed for read-replica followers (see follower.py). Waits up to
+        request['wait'] seconds for changes after request['since'], then replies
+        with the current state of every file, snapshot and chunk changed since,
+        plus all node states. A follower that is new, fell behind the journal,
+        or synced with an earlier Master process gets the full binary metadata
+        snapshot instead, as 'size' raw bytes after the reply.
+        """
+        since = request.get('since', -1)
+        same_epoch = request.get('epoch') == self.epoch
+        with self.journal_cond:
+            if same_epoch and since == self.journal_seq:
+                self.journal_cond.wait(timeout=min(request.get('wait', 0), FOLLOWER_SYNC_WAIT))
+        
+        path = None
+        with self.lock:
+            with self.journal_cond:
+                seq = self.journal_seq
+                oldest = self.journal[0][0] if self.journal else seq + 1
+                full = not same_epoch or since > seq or oldest > since + 1
+                changed = {'file': set(), 'snapshot': set(), 'chunk': set()}
+                if not full:
+                    for entry_seq, kind, key in reversed(self.journal):
+                        if entry_seq <= since:
+                            break
+                        changed[kind].add(key)
+            reply = {'status': 'OK', 'epoch': self.epoch, 'seq': seq, 'full': full,
+                     'nodes': {nid: dict(info) for nid, info in self.nodes.items()}}
+            if full:
+                fd, path = tempfile.mkstemp(dir='.', suffix='.sync')
+                os.close(fd)
+                # Followers have no inline store: ship the bodies in the snapshot
+                save_snapshot(path, self.chunks, {name: self._with_inline_body(meta) for name, meta in self.files.items()},
+                              {name: dict(snap, files={n: self._with_inline_body(m) for n, m in snap['files'].items()})
+                               for name, snap in self.snapshots.items()})
+            else:
+                reply['files'] = {name: self._wire_meta(self.files.get(name)) for name in changed['file']}
+                reply['snapshots'] = {name: self._wire_snapshot(self.snapshots.get(name)) for name in changed['snapshot']}
+                reply['chunks'] = {cid: self._chunk_record(cid) for cid in changed['chunk']}
+        
+        if not full:
+            send_json(sock, reply)
+            return
+        try:
+            reply['size'] = os.path.getsize(path)
+            send_json(sock, reply)
+            with open(path, 'rb') as f:
+                sock.sendfile(f)
+            logging.info(f"Sent full metadata snapshot ({reply['size']} bytes) to a follower.")
+        finally:
+            os.remove(path)
+
+    def _wire_meta(self, file_meta):
+        """A file entry as JSON (chunk IDs instead of a ChunkList, inline body resolved); None stays None."""
+        return dict(self._with_inline_body(file_meta), chunks=list(file_meta['chunks'])) if file_meta else None
+
+    def _wire_snapshot(self, snapshot):
+        if not snapshot:
+            return None
+        return {'created': snapshot['created'],
+                'files': {name: self._wire_meta(meta) for name, meta in snapshot['files'].items()}}
+
+    def _chunk_record(self, chunk_id):
+        """[locations, checksum, ec] of a chunk as followers apply it; None once it is gone."""
+        locations = self.chunk_locations.get(chunk_id)
+        checksum = self.chunk_checksums.get(chunk_id)
+        if locations is None and checksum is None:
+            return None
+        return [locations, checksum, self.ec_chunks.get(chunk_id)]
+
+    def handle_rebalance(self, sock, request):
+        """Pause, resume or inspect the rebalancer; 'bandwidth' (bytes/s, 0 = unlimited) changes its cap."""
+        action = request.get('action', 'status')
+        with self.lock:
+            if action == 'pause':
+                self.rebalance['paused'] = True
+            elif action == 'resume':
+                self.rebalance['paused'] = False
+            elif action != 'status':
+                send_json(sock, {'status': 'ERROR', 'message': f"Unknown rebalance action {action}"})
+                return
+            if request.get('bandwidth') is not None:
+                self.rebalance['bandwidth'] = max(0, int(request['bandwidth']))
+            state = dict(self.rebalance)
+        if action == 'resume':
+            self.rebalance_wakeup.set() # Start a pass right away
+        if action != 'status':
+            logging.info(f"Rebalancer {action}d (bandwidth cap {state['bandwidth']} bytes/s).")
+        send_json(sock, {'status': 'OK', 'rebalancer': state})
 
     def handle_client(self, sock):
         try:
             request = receive_json(sock)
             if not request:
                 return
-            
-            req_type = request.get('type')
-            
-            if req_type == 'HEARTBEAT':
-                self.handle_heartbeat(request)
-            elif req_type == 'GET_STATS':
-                 with self.lock:
-                    send_json(sock, {'status': 'OK', 'nodes': self.nodes})
-            elif req_type == 'UPLOAD_INIT':
-                self.handle_upload_init(sock, request)
-            elif req_type == 'UPLOAD_SUCCESS':
-                self.handle_upload_success(request)
-            elif req_type == 'DOWNLOAD_REQ':
-                self.handle_download_req(sock, request)
-            elif req_type == 'LIST_FILES':
-                with self.lock:
-                     # Calculate total size correctly
-                    file_list = []
-                    for fname, meta in self.files.items():
-                        # Count available replicas for health status
-                         file_list.append({
-                             'filename': fname, 
-                             'size': meta['size'],
-                             'status': 'Available' # Simplified
-                         })
-                    send_json(sock, {'status': 'OK', 'files': file_list})
-            elif req_type == 'DELETE_FILE':
-                self.handle_delete_file(sock, request)
-            else:
-                send_json(sock, {'status': 'ERROR', 'message': 'Unknown command'})
-                
+            self.handle_request(sock, request)
         except Exception as e:
             logging.error(f"Client handler error: {e}")
         finally:
             sock.close()
 
+    def handle_request(self, sock, request):
+        req_type = request.get('type')
+        
+        if req_type == 'HEARTBEAT':
+            self.handle_heartbeat(sock, request)
+        elif req_type == 'BLOCK_REPORT':
+            self.handle_block_report(sock, request)
+        elif req_type == 'GET_STATS':
+             with self.lock:
+                send_json(sock, {'status': 'OK', 'nodes': self.nodes})
+        elif req_type == 'UPLOAD_INIT':
+            self.handle_upload_init(sock, request)
+        elif req_type == 'UPLOAD_SUCCESS':
+            self.handle_upload_success(sock, request)
+        elif req_type == 'UPLOAD_INLINE':
+            self.handle_upload_inline(sock, request)
+        elif req_type == 'UPLOAD_INIT_BATCH':
+            self.handle_upload_init_batch(sock, request)
+        elif req_type == 'UPLOAD_SUCCESS_BATCH':
+            self.handle_upload_commit_batch(sock, request)
+        elif req_type == 'DOWNLOAD_REQ':
+            self.handle_download_req(sock, request)
+        elif req_type == 'DOWNLOAD_REQ_BATCH':
+            self.handle_download_req_batch(sock, request)
+        elif req_type == 'GET_CHECKSUMS':
+            self.handle_get_checksums(sock, request)
+        elif req_type == 'LIST_FILES':
+            with self.lock:
+                 # Calculate total size correctly
+                file_list = []
+                for fname, meta in self.files.items():
+                    # Count available replicas for health status
+                     file_list.append({
+                         'filename': fname, 
+                         'size': meta['size'],
+                         'status': 'Available' # Simplified
+                     })
+            send_json(sock, self._leased(request, {'status': 'OK', 'files': file_list}))
+        elif req_type == 'DELETE_FILE':
+            self.handle_delete_file(sock, request)
+        elif req_type == 'RENAME':
+            self.handle_rename(sock, request)
+        elif req_type == 'CLONE':
+            self.handle_clone(sock, request)
+        elif req_type == 'SNAPSHOT_CREATE':
+            self.handle_snapshot_create(sock, request)
+        elif req_type == 'SNAPSHOT_LIST':
+            self.handle_snapshot_list(sock, request)
+        elif req_type == 'SNAPSHOT_RESTORE':
+            self.handle_snapshot_restore(sock, request)
+        elif req_type == 'SNAPSHOT_DELETE':
+            self.handle_snapshot_delete(sock, request)
+        elif req_type == 'DECOMMISSION':
+            self.handle_decommission(sock, request)
+        elif req_type == 'REBALANCE':
+            self.handle_rebalance(sock, request)
+        elif req_type == 'METADATA_SYNC':
+            self.handle_metadata_sync(sock, request)
+        else:
+            send_json(sock, {'status': 'ERROR', 'message': 'Unknown command'})
+
     def handle_delete_file(self, sock, request):
         filename = request['filename']
         logging.info(f"Received delete request for {filename}")
         
         chunks_to_delete = []
-        with self.lock:
+        with self._honoring_leases([filename]), self.lock:
             if filename not in self.files:
                 send_json(sock, {'status': 'ERROR', 'message': 'File not found'})
                 return
             
-            # Get chunks to delete
-            chunk_ids = self.files[filename]['chunks']
-            for cid in chunk_ids:
-                if cid in self.chunk_locations:
-                    chunks_to_delete.append({
-                        'chunk_id': cid, 
-                        'nodes': list(self.chunk_locations[cid]) # Copy list
-                    })
-                    del self.chunk_locations[cid]
+            # Get chunks to delete (shared chunks survive until their last reference goes)
+            file_meta = self.files[filename]
+            chunks_to_delete = self._release_chunks(file_meta)
             
             # Remove file metadata
             del self.files[filename]
+            self._journal('file', filename)
             self.save_metadata()
             
-        # Notify nodes to delete chunks (best effort, no lock needed here)
-        # We spawned a thread for this to not block the client response too long?
-        # Actually client waits for confirmation. Let's do it inline but fast.
-        
-        threading.Thread(target=self._cleanup_chunks, args=(chunks_to_delete,), daemon=True).start()
+        # Notify nodes to delete chunks (queued, the GC sends them in bulk)
+        self._cleanup_chunks(chunks_to_delete)
         
         send_json(sock, {'status': 'OK'})
         logging.info(f"File {filename} deleted.")
 
+    def handle_rename(self, sock, request):
+        """
+        Move a file to a new name. Metadata only: chunks keep their IDs and locations.
+        An existing destination is replaced only when 'overwrite' is set.
+        """
+        src, dst = request['src'], request['dst']
+        chunks_to_delete = []
+        with self._honoring_leases([src, dst]), self.lock:
+            if src not in self.files:
+                send_json(sock, {'status': 'ERROR', 'message': 'File not found'})
+                return
+            if src == dst or (dst in self.files and not request.get('overwrite')):
+                send_json(sock, {'status': 'ERROR', 'message': f'{dst} already exists'})
+                return
+            if not self._owns(dst):
+                send_json(sock, self._wrong_shard(dst)) # Chunks cannot change shards
+                return
+            
+            file_meta = self.files.pop(src)
+            self._journal('file', src)
+            # The new entry takes a reference to every chunk, the old one gives it back
+            chunks_to_delete = self._replace_file(dst, copy.deepcopy(file_meta))
+            chunks_to_delete.extend(self._release_chunks(file_meta))
+            self.save_metadata()
+            version = self.files[dst]['version']
+        
+        self._after_commit(chunks_to_delete, [])
+        send_json(sock, {'status': 'OK', 'version': version})
+        logging.info(f"Renamed {src} -> {dst}.")
+
+    def handle_clone(self, sock, request):
+        """
+        Create dst sharing every chunk of src (copy-on-write: chunks are never
+        modified in place, so either file can later be overwritten or deleted).
+        With 'snapshot', src is read from that snapshot instead of the live namespace.
+        """
+        src, dst = request['src'], request['dst']
+        snapshot = request.get('snapshot')
+        chunks_to_delete = []
+        with self._honoring_leases([dst]), self.lock:
+            if snapshot is not None and snapshot not in self.snapshots:
+                send_json(sock, {'status': 'ERROR', 'message': f'Snapshot {snapshot} not found'})
+                return
+            source = self.snapshots[snapshot]['files'] if snapshot is not None else self.files
+            if src not in source:
+                send_json(sock, {'status': 'ERROR', 'message': 'File not found'})
+                return
+            if (dst in self.files and not request.get('overwrite')) or (snapshot is None and src == dst):
+                send_json(sock, {'status': 'ERROR', 'message': f'{dst} already exists'})
+                return
+            if not self._owns(dst):
+                send_json(sock, self._wrong_shard(dst))
+                return
+            
+            chunks_to_delete = self._replace_file(dst, copy.deepcopy(source[src]))
+            self.save_metadata()
+            version = self.files[dst]['version']
+        
+        self._after_commit(chunks_to_delete, [])
+        send_json(sock, {'status': 'OK', 'version': version})
+        logging.info(f"Cloned {src} -> {dst}" + (f" from snapshot {snapshot}." if snapshot is not None else "."))
+
+    def handle_snapshot_create(self, sock, request):
+        """Freeze the current namespace under a name; every chunk gains one reference per snapshotted file."""
+        name = request['name']
+        with self.lock:
+            if name in self.snapshots:
+                send_json(sock, {'status': 'ERROR', 'message': f'Snapshot {name} already exists'})
+                return
+            files = copy.deepcopy(self.files)
+            for file_meta in files.values():
+                self._add_chunk_refs(file_meta['chunks'])
+            self.snapshots[name] = {'created': time.time(), 'files': files}
+            self._journal('snapshot', name)
+            self.save_metadata()
+        send_json(sock, {'status': 'OK'})
+        logging.info(f"Snapshot {name} created ({len(files)} files).")
+
+    def handle_snapshot_list(self, sock, request):
+        with self.lock:
+            snapshots = [{
+                'name': name,
+                'created': snap['created'],
+                'files': len(snap['files']),
+                'size': sum(meta['size'] for meta in snap['files'].values())
+            } for name, snap in self.snapshots.items()]
+        send_json(sock, {'status': 'OK', 'snapshots': snapshots})
+
+    def handle_snapshot_restore(self, sock, request):
+        """Make the live namespace match a snapshot again. The snapshot itself is kept."""
+        name = request['name']
+        chunks_to_delete = []
+        with self._honoring_leases(None), self.lock:
+            if name not in self.snapshots:
+                send_json(sock, {'status': 'ERROR', 'message': f'Snapshot {name} not found'})
+                return
+            snap_files = self.snapshots[name]['files']
+            for filename in list(self.files):
+                if filename not in snap_files:
+                    chunks_to_delete.extend(self._release_chunks(self.files.pop(filename)))
+                    self._journal('file', filename)
+            for filename, file_meta in snap_files.items():
+                chunks_to_delete.extend(self._replace_file(filename, copy.deepcopy(file_meta)))
+            self.save_metadata()
+        
+        self._after_commit(chunks_to_delete, [])
+        send_json(sock, {'status': 'OK'})
+        logging.info(f"Namespace restored from snapshot {name}.")
+
+    def handle_snapshot_delete(self, sock, request):
+        """Drop a snapshot; chunks only it still referenced are removed from the nodes."""
+        name = request['name']
+        chunks_to_delete = []
+        with self.lock:
+            if name not in self.snapshots:
+                send_json(sock, {'status': 'ERROR', 'message': f'Snapshot {name} not found'})
+                return
+            for file_meta in self.snapshots.pop(name)['files'].values():
+                chunks_to_delete.extend(self._release_chunks(file_meta))
+            self._journal('snapshot', name)
+            self.save_metadata()
+        
+        self._after_commit(chunks_to_delete, [])
+        send_json(sock, {'status': 'OK'})
+        logging.info(f"Snapshot {name} deleted ({len(chunks_to_delete)} chunk copies freed).")
+
     def _cleanup_chunks(self, chunks_list):
-        for item in chunks_list:
-            cid = item['chunk_id']
-            for node_id in item['nodes']:
+        """Queue [{chunk_id, nodes}] for deletion; gc_loop delivers them per node in bulk."""
+        if not chunks_list:
+            return
+        with self.lock:
+            for item in chunks_list:
+                for node_id in item['nodes']:
+                    self.gc_queue.setdefault(node_id, set()).add(item['chunk_id'])
+        self.gc_wakeup.set()
+
+    def gc_loop(self):
+        """
+        Send queued deletions as one DELETE_CHUNKS per node and batch.
+        Deletions for offline nodes wait until the node is back.
+        """
+        while self.running:
+            self.gc_wakeup.wait(timeout=GC_INTERVAL)
+            self.gc_wakeup.clear()
+            batches = []
+            with self.lock:
+                self._expire_leases()
+                for item in self._collect_orphans():
+                    self.gc_queue.setdefault(item['nodes'][0], set()).add(item['chunk_id'])
+                for node_id, pending in list(self.gc_queue.items()):
+                    info = self.nodes.get(node_id)
+                    if not info or info['status'] != 'ONLINE':
+                        continue
+                    batch = [pending.pop() for _ in range(min(len(pending), GC_BATCH_SIZE))]
+                    if not pending:
+                        del self.gc_queue[node_id]
+                    batches.append((node_id, info['address'], batch))
+            
+            for node_id, address, batch in batches:
                 try:
-                    with self.lock:
-                        if node_id not in self.nodes: continue
-                        node_info = self.nodes[node_id]
-                        
-                    if node_info['status'] == 'ONLINE':
-                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ns:
-                            ns.connect(node_info['address'])
-                            send_json(ns, {'type': 'DELETE_CHUNK', 'chunk_id': cid})
-                            receive_json(ns) # Wait for ack
+                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as ns:
+                        ns.settimeout(GC_RPC_TIMEOUT) # One stuck node must not stall GC for the others
+                        ns.connect(address)
+                        send_json(ns, {'type': 'DELETE_CHUNKS', 'chunk_ids': batch, 'qos': 'background'})
+                        ack = receive_json(ns)
+                    if not ack or ack['status'] != 'OK':
+                        raise ConnectionError(ack.get('message') if ack else 'no reply')
+                    logging.info(f"GC: deleted {len(batch)} chunks on {node_id}")
                 except Exception as e:
-                    logging.warning(f"Failed to cleanup chunk {cid} on {node_id}: {e}")
+                    logging.warning(f"GC: failed to delete {len(batch)} chunks on {node_id}: {e}")
+                    with self.lock:
+                        self.gc_queue.setdefault(node_id, set()).update(batch)
+            
+            with self.lock:
+                # Full batches mean more work is waiting for an online node
+                if any(len(batch) == GC_BATCH_SIZE for _, _, batch in batches):
+                    self.gc_wakeup.set()
 
-    def handle_heartbeat(self, request):
+    def handle_heartbeat(self, sock, request):
         node_id = request['node_id']
         port = request['port']
         stats = request['stats']
+        repairs = ([], [], [])
         
         with self.lock:
+            previous = self.nodes.get(node_id)
+            if previous and previous['status'] == 'DECOMMISSIONED':
+                send_json(sock, {'status': 'DECOMMISSIONED'})
+                return
+            registered = bool(previous) and previous['status'] in ('ONLINE', 'SUSPECT')
+            # New, returning, or unknown since a Master restart: its inventory must be re-read
+            reported = registered and previous.get('reported', False)
+            draining = bool(previous) and previous.get('draining', False)
+            now = time.time()
+            if not registered:
+                self.detector.forget(node_id) # A gap spanning a failure is not an inter-arrival sample
+            elif previous['status'] == 'SUSPECT':
+                logging.info(f"Node {node_id} is back after {now - previous['last_heartbeat']:.1f}s; no longer suspect.")
+            if self.detector.heartbeat(node_id, now):
+                self.detector_wakeup.set()
+            stats['read_rate'] = 0
+            if registered and now > previous['last_heartbeat']:
+                # Bytes/s served since the last heartbeat (a restarted node counts from zero)
+                served = stats.get('served_bytes', 0) - previous['stats'].get('served_bytes', 0)
+                stats['read_rate'] = max(0, served) / (now - previous['last_heartbeat'])
             # If new node or updating existing
             self.nodes[node_id] = {
                 'address': ('localhost', port), # Assuming localhost for this demo
-                'last_heartbeat': time.time(),
+                'last_heartbeat': now,
                 'status': 'ONLINE',
-                'stats': stats
+                'stats': stats,
+                'reported': reported,
+                'draining': draining
             }
+            if draining and not registered:
+                # Back from a failure mid-drain: drain_node stopped, pick up where it left off
+                threading.Thread(target=self.drain_node, args=(node_id,), daemon=True).start()
+            if reported and (request.get('added') or request.get('removed')):
+                # Incremental block report
+                repairs = self._reconcile(node_id, request.get('added', []), request.get('removed', []))
+        
+        send_json(sock, {'status': 'OK', 'send_block_report': not reported})
+        self._schedule_repairs(*repairs)
+
+    def handle_block_report(self, sock, request):
+        """
+        Full chunk inventory of a node (on registration and every BLOCK_REPORT_INTERVAL).
+        Locations the node no longer backs are dropped and repaired, copies Master
+        did not know about are recorded, unreferenced ones become orphan candidates.
+        """
+        node_id = request['node_id']
+        stored = set(unpack_id_list(request['chunks']))
+        
+        with self.lock:
+            if self.nodes.get(node_id, {}).get('status') != 'ONLINE':
+                send_json(sock, {'status': 'ERROR', 'message': 'Unknown node, send a heartbeat first'})
+                return
+            # Diff against what Master places on this node: O(its chunks), not O(all chunks)
+            placed = set()
+            for chunk_id in self.chunks.chunks_on(node_id):
+                if chunk_id in self.ec_chunks:
+                    placed.update(fragment_id(chunk_id, i) for i, nid in enumerate(self.chunk_locations[chunk_id])
+                                  if nid == node_id)
+                else:
+                    placed.add(chunk_id)
+            gone = list(placed - stored)
+            # Candidates the node has deleted in the meantime are no longer orphans
+            self.orphans = {key: seen for key, seen in self.orphans.items() if key[0] != node_id or key[1] in stored}
+            repairs = self._reconcile(node_id, stored - placed, gone) # Known copies need no reconciling
+            self.nodes[node_id]['reported'] = True
+            self.nodes[node_id]['last_report'] = time.time()
+            unreferenced = sum(1 for key in self.orphans if key[0] == node_id)
+        
+        send_json(sock, {'status': 'OK'})
+        logging.info(f"Block report from {node_id}: {len(stored)} stored, {len(gone)} missing, "
+                     f"{len(repairs[2])} excess, {unreferenced} unreferenced.")
+        self._schedule_repairs(*repairs)
+
+    def _stored_object(self, stored_id):
+        """Map a name a node stores to (chunk_id, fragment index or None); (None, None) if no chunk matches."""
+        if stored_id in self.chunk_locations and stored_id not in self.ec_chunks:
+            return stored_id, None
+        chunk_id, sep, index = stored_id.rpartition('_frag_')
+        if sep and index.isdigit() and chunk_id in self.ec_chunks and chunk_id in self.chunk_locations:
+            if int(index) < len(self.chunk_locations[chunk_id]):
+                return chunk_id, int(index)
+        return None, None
+
+    def _reconcile(self, node_id, present, gone):
+        """
+        Apply what a node reported it holds (present) or no longer holds (gone)
+        to chunk_locations (caller holds the lock).
+        Returns (chunks to re-replicate, stripes to rebuild, excess copies to delete).
+        """
+        to_replicate, to_rebuild, excess = [], [], []
+        now = time.time()
+        for stored_id in gone:
+            self.orphans.pop((node_id, stored_id), None)
+            chunk_id, index = self._stored_object(stored_id)
+            if chunk_id is None:
+                continue
+            locations = self.chunk_locations[chunk_id]
+            if index is None and node_id in locations:
+                locations.remove(node_id)
+                to_replicate.append(chunk_id)
+            elif index is not None and locations[index] == node_id:
+                locations[index] = None
+                to_rebuild.append(chunk_id)
+            else:
+                continue
+            self.chunk_locations[chunk_id] = locations
+            logging.warning(f"Node {node_id} no longer holds {stored_id}")
+        
+        for stored_id in present:
+            if (node_id, stored_id) in self.pending_copies:
+                continue # Recorded by the repair/move that is writing it
+            chunk_id, index = self._stored_object(stored_id)
+            if chunk_id is None:
+                if self._owns_stored(stored_id): # Other shards account for their own chunks
+                    self.orphans.setdefault((node_id, stored_id), now)
+                continue
+            locations = self.chunk_locations[chunk_id]
+            if index is None:
+                if node_id in locations:
+                    continue
+                alive = [nid for nid in locations if self.nodes.get(nid, {}).get('status') == 'ONLINE']
+                if len(alive) >= REPLICATION_FACTOR:
+                    excess.append({'chunk_id': stored_id, 'nodes': [node_id]})
+                    continue
+                locations.append(node_id)
+            elif locations[index] is None:
+                locations[index] = node_id
+            else:
+                if locations[index] != node_id:
+                    excess.append({'chunk_id': stored_id, 'nodes': [node_id]})
+                continue
+            self.chunk_locations[chunk_id] = locations
+            logging.info(f"Recorded {stored_id} on {node_id} from block report")
+        return to_replicate, to_rebuild, excess
+
+    def _schedule_repairs(self, to_replicate, to_rebuild, excess):
+        self._cleanup_chunks(excess)
+        if to_replicate or to_rebuild:
+            threading.Thread(target=self._repair, args=(to_replicate, to_rebuild), daemon=True).start()
+
+    def _collect_orphans(self):
+        """
+        Orphans past ORPHAN_GRACE_PERIOD that still belong to no chunk, as
+        _cleanup_chunks items (caller holds the lock). The grace period covers
+        uploads whose chunks are stored but not yet committed.
+        """
+        now = time.time()
+        expired = [key for key, seen in self.orphans.items() if now - seen > ORPHAN_GRACE_PERIOD]
+        items = []
+        for key in expired:
+            del self.orphans[key]
+            node_id, stored_id = key
+            if self._stored_object(stored_id)[0] is None:
+                items.append({'chunk_id': stored_id, 'nodes': [node_id]})
+        if items:
+            logging.info(f"Deleting {len(items)} orphaned chunks.")
+        return items
 
     def handle_upload_init(self, sock, request):
+        send_json(sock, self._plan_upload(request))
+
+    def handle_upload_init_batch(self, sock, request):
+        """Plan many uploads in one round trip: {files: [UPLOAD_INIT body, ...]}."""
+        send_json(sock, {'status': 'OK', 'files': [self._plan_upload(item) for item in request['files']]})
+
+    def _plan_upload(self, request):
         """
         Client asks to upload file.
         Returns: [ {chunk_id, [node_ips]} ]
+        If the client sends per-chunk 'checksums', chunks whose content the
+        cluster already holds come back as {chunk_id, nodes: [], dedup: True}
+        and must not be transferred.
+        With 'ec': [k, m] every chunk gets k+m distinct nodes, one per fragment.
         """
         filename = request['filename']
         filesize = request['filesize']
+        codec = request.get('codec', 'none')
+        checksums = request.get('checksums')
+        ec = request.get('ec')
+        block_size = request.get('block_size')
+        if block_size is None:
+            block_size = block_size_for(filesize, BLOCK_SIZE_POLICY, BLOCK_SIZE)
         
-        num_chunks = (filesize + BLOCK_SIZE - 1) // BLOCK_SIZE
+        if not self._owns(filename):
+            return self._wrong_shard(filename)
+        if codec not in CODECS:
+            return {'status': 'ERROR', 'message': f'Unknown codec {codec}'}
+        if ec and (ec[0] < 1 or ec[1] < 0 or ec[0] + ec[1] > 256):
+            return {'status': 'ERROR', 'message': f'Invalid erasure scheme {ec}'}
+        block_size_error = self._block_size_error(block_size)
+        if block_size_error:
+            return {'status': 'ERROR', 'message': block_size_error}
+        
+        if checksums is not None:
+            # Content-defined chunks vary in size; the client says how many there are
+            num_chunks = len(checksums)
+        else:
+            num_chunks = (filesize + block_size - 1) // block_size
         chunks_plan = []
         
         with self.lock:
-            online_nodes = [nid for nid, info in self.nodes.items() if info['status'] == 'ONLINE']
+            online_nodes = self._writable_nodes()
             
             if len(online_nodes) < 1:
-                send_json(sock, {'status': 'ERROR', 'message': 'No online nodes'})
-                return
+                return {'status': 'ERROR', 'message': 'No online nodes'}
+            if ec and len(online_nodes) < ec[0] + ec[1]:
+                return {'status': 'ERROR', 'message': f'Erasure coding needs {ec[0] + ec[1]} online nodes'}
 
+            planned = {} # dedup key -> chunk_id planned earlier in this upload
             for i in range(num_chunks):
+                if checksums and not ec:
+                    key = self._dedup_key(codec, checksums[i])
+                    existing = self._dedup_index().get(key)
+                    existing = self.chunks.chunk_id(existing) if existing is not None else None
+                    if existing and not self.chunk_locations.get(existing):
+                        existing = None # Every replica is lost; store a fresh copy
+                    existing = existing or planned.get(key)
+                    if existing:
+                        chunks_plan.append({'chunk_id': existing, 'nodes': [], 'dedup': True})
+                        continue
+                
                 chunk_id = f"{filename}_chunk_{i}_{uuid.uuid4().hex[:8]}"
+                if checksums and not ec:
+                    planned[key] = chunk_id
                 # Choose replicas
                 # Round robin or random. Let's do random for simplicity but ensure distinct
                 replicas = []
                 available = list(online_nodes)
-                count = min(REPLICATION_FACTOR, len(available))
-                replicas = random.sample(available, count)
+                count = ec[0] + ec[1] if ec else min(REPLICATION_FACTOR, len(available))
+                replicas = self._placement_sample(available, count, block_size)
                 
                 # Format for client: list of (ip, port)
                 replica_addrs = [self.nodes[nid]['address'] for nid in replicas]
@@ -301,43 +1388,205 @@ class MasterService:
                     'nodes': replica_addrs
                 })
         
-        send_json(sock, {'status': 'OK', 'chunks': chunks_plan})
+        return {'status': 'OK', 'filename': filename, 'codec': codec, 'ec': ec, 'block_size': block_size,
+                'chunks': chunks_plan}
+
+    def _block_size_error(self, block_size):
+        """Why block_size cannot be a file's block size, or None."""
+        if type(block_size) is not int:
+            return f'Block size must be an integer number of bytes, got {block_size!r}'
+        if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            return f'Block size {block_size} outside [{MIN_BLOCK_SIZE}, {MAX_BLOCK_SIZE}]'
+        return None
+
+    def handle_upload_success(self, sock, request):
+        chunks_to_delete = []
+        stripes_to_repair = []
+        with self._honoring_leases([request['filename']]), self.lock:
+            resp = self._commit_upload(request, chunks_to_delete, stripes_to_repair)
+            if resp['status'] == 'OK':
+                self.save_metadata()
+        self._after_commit(chunks_to_delete, stripes_to_repair)
+        send_json(sock, resp)
+
+    def handle_upload_commit_batch(self, sock, request):
+        """
+        Commit many uploads with a single metadata write: {files: [UPLOAD_SUCCESS
+        or UPLOAD_INLINE body, ...]}. Each file succeeds or fails on its own.
+        """
+        chunks_to_delete = []
+        stripes_to_repair = []
+        results = []
+        with self._honoring_leases([item['filename'] for item in request['files']]), self.lock:
+            for item in request['files']:
+                if 'data' in item:
+                    results.append(self._commit_inline(item, chunks_to_delete))
+                else:
+                    results.append(self._commit_upload(item, chunks_to_delete, stripes_to_repair))
+            if any(r['status'] == 'OK' for r in results):
+                self.save_metadata()
+        self._after_commit(chunks_to_delete, stripes_to_repair)
+        send_json(sock, {'status': 'OK', 'files': results})
+        logging.info(f"Batch commit: {sum(1 for r in results if r['status'] == 'OK')} of {len(results)} files.")
 
-    def handle_upload_success(self, request):
+    def _after_commit(self, chunks_to_delete, stripes_to_repair):
+        """Background work a commit left behind: freed chunks and degraded stripes."""
+        self._cleanup_chunks(chunks_to_delete)
+        for c_id in stripes_to_repair:
+            threading.Thread(target=self.rebuild_fragments, args=(c_id,), daemon=True).start()
+
+    def _commit_upload(self, request, chunks_to_delete, stripes_to_repair):
         """
-        Client confirms upload. Commit metadata.
-        Client sends chunks_placed: [{chunk_id, nodes: [[ip, port], ...]}]
+        Client confirms upload. Commit metadata (caller holds the lock and saves).
+        Client sends chunks_placed: [{chunk_id, nodes: [[ip, port], ...], checksum}]
+        Deduplicated chunks are sent as {chunk_id, nodes: [], dedup: True}.
+        For erasure-coded files nodes is positional per fragment, None where a store failed.
         Master resolves [ip, port] to node_ids.
+        With base_version the commit is a compare-and-swap on the file version.
+        block_size must be the one UPLOAD_INIT planned: downloads and syncs split
+        the file with it, so fixed chunks must add up to filesize at that size.
         """
         filename = request['filename']
         filesize = request['filesize']
+        codec = request.get('codec', 'none')
+        base_version = request.get('base_version')
+        ec = request.get('ec')
+        chunking = request.get('chunking', 'fixed')
+        block_size = request.get('block_size')
+        if not self._owns(filename):
+            return self._wrong_shard(filename)
         
-        with self.lock:
-            chunk_ids = []
-            for item in request['chunks_placed']:
-                c_id = item['chunk_id']
-                chunk_ids.append(c_id)
-                
-                # Resolve addresses to Node IDs
-                resolved_node_ids = []
-                for addr_list in item['nodes']:
-                    addr_tuple = tuple(addr_list)
-                    # Find node_id for this address
-                    for nid, info in self.nodes.items():
-                        if info['address'] == addr_tuple:
-                            resolved_node_ids.append(nid)
-                            break
-                
-                self.chunk_locations[c_id] = resolved_node_ids
-            
-            self.files[filename] = {
-                'size': filesize,
-                'chunks': chunk_ids
-            }
-            self.save_metadata()
-        logging.info(f"File {filename} uploaded successfully.")
+        chunk_ids = [item['chunk_id'] for item in request['chunks_placed']]
+        new_items = [item for item in request['chunks_placed'] if not item.get('dedup')]
+        current_version = self._file_version(filename)
+        
+        # A referenced chunk may have been deleted since UPLOAD_INIT
+        new_ids = {item['chunk_id'] for item in new_items}
+        missing = [cid for cid in chunk_ids if cid not in new_ids and cid not in self.chunk_locations]
+        error = self._block_size_error(block_size)
+        if error is None:
+            if chunking == 'fixed' and len(chunk_ids) != (filesize + block_size - 1) // block_size:
+                error = f'{len(chunk_ids)} chunks do not make {filesize} bytes in blocks of {block_size}'
+            elif missing:
+                error = f'Referenced chunk {missing[0]} no longer exists'
+            elif base_version is not None and base_version != current_version:
+                error = f'Version conflict: expected {base_version}, found {current_version}'
+        if error:
+            # Nothing references the freshly stored chunks, so reclaim them
+            for item in new_items:
+                chunks_to_delete.extend(self._delete_items(item['chunk_id'], self._resolve_placement(item['nodes'], ec), ec))
+            return {'status': 'ERROR', 'filename': filename, 'message': error}
+        
+        for item in new_items:
+            c_id = item['chunk_id']
+            self.chunk_locations[c_id] = self._resolve_placement(item['nodes'], ec)
+            if ec:
+                self.ec_chunks[c_id] = ec
+                if None in self.chunk_locations[c_id]:
+                    stripes_to_repair.append(c_id)
+                if item.get('checksum'):
+                    self.chunk_checksums[c_id] = item['checksum']
+            elif item.get('checksum'):
+                self.chunk_checksums[c_id] = item['checksum']
+                if self.hash_index is not None:
+                    self.hash_index.setdefault(self._dedup_key(codec, item['checksum']), self.chunks.handle(c_id))
+        
+        file_meta = {
+            'size': filesize,
+            'chunks': chunk_ids,
+            'codec': codec,
+            'chunking': chunking,
+            'block_size': block_size
+        }
+        if ec:
+            file_meta['ec'] = ec
+        chunks_to_delete.extend(self._replace_file(filename, file_meta))
+        logging.info(f"File {filename} uploaded successfully ({len(chunk_ids) - len(new_items)} chunks deduplicated).")
+        return {'status': 'OK', 'filename': filename, 'version': current_version + 1}
 
-    def handle_download_req(self, sock, request):
+    def handle_upload_inline(self, sock, request):
+        chunks_to_delete = []
+        with self._honoring_leases([request['filename']]), self.lock:
+            resp = self._commit_inline(request, chunks_to_delete)
+            if resp['status'] == 'OK':
+                self.save_metadata()
+        self._after_commit(chunks_to_delete, [])
+        send_json(sock, resp)
+
+    def _commit_inline(self, request, chunks_to_delete):
+        """
+        Store a tiny file with the master: one round trip, no node traffic.
+        The data is appended to the inline store, which the metadata snapshot
+        references, so later saves do not rewrite it.
+        Caller holds the lock and saves.
+        """
+        filename = request['filename']
+        base_version = request.get('base_version')
+        
+        if not self._owns(filename):
+            return self._wrong_shard(filename)
+        try:
+            data = base64.b64decode(request['data'], validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            return {'status': 'ERROR', 'filename': filename, 'message': 'Inline data is not valid base64'}
+        if len(data) != request['filesize']:
+            return {'status': 'ERROR', 'filename': filename,
+                    'message': f"Inline data is {len(data)} bytes, not the {request['filesize']} announced"}
+        if len(data) > INLINE_THRESHOLD:
+            return {'status': 'ERROR', 'filename': filename, 'message': f'Inline files are limited to {INLINE_THRESHOLD} bytes'}
+        
+        current_version = self._file_version(filename)
+        if base_version is not None and base_version != current_version:
+            return {'status': 'ERROR', 'filename': filename, 'message': f'Version conflict: expected {base_version}, found {current_version}'}
+        chunks_to_delete.extend(self._replace_file(filename, {
+            'size': len(data),
+            'chunks': [],
+            'codec': 'none',
+            'inline_ref': self.inline_store.append(data)
+        }))
+        logging.info(f"File {filename} stored inline ({request['filesize']} bytes).")
+        return {'status': 'OK', 'filename': filename, 'version': current_version + 1}
+
+    def _file_version(self, filename):
+        """Current version of a file, 0 if it does not exist (caller holds the lock)."""
+        meta = self.files.get(filename)
+        return meta.get('version', 1) if meta else 0
+
+    def _replace_file(self, filename, file_meta):
+        """
+        Install file_meta as the next version of filename (caller holds the lock).
+        Returns the chunks the previous version freed, for _cleanup_chunks.
+        """
+        old_meta = self.files.get(filename)
+        file_meta['chunks'] = self.chunks.chunk_list(file_meta['chunks'])
+        file_meta['version'] = self._file_version(filename) + 1
+        self.files[filename] = file_meta
+        self._journal('file', filename)
+        self._add_chunk_refs(file_meta['chunks'])
+        # Overwrite: the previous version's chunks lose their reference
+        return self._release_chunks(old_meta) if old_meta else []
+
+    def _resolve_address(self, addr_list):
+        """Map an [ip, port] sent by a client back to its node_id (None if unknown)."""
+        addr_tuple = tuple(addr_list)
+        # Find node_id for this address
+        for nid, info in self.nodes.items():
+            if info['address'] == addr_tuple:
+                return nid
+        return None
+
+    def _resolve_placement(self, addr_lists, ec):
+        """
+        Map [[ip, port], ...] sent by a client back to node_ids.
+        Erasure-coded placements stay positional, with None for missing fragments.
+        """
+        if ec:
+            return [self._resolve_address(addr) if addr else None for addr in addr_lists]
+        resolved_node_ids = [self._resolve_address(addr) for addr in addr_lists]
+        return [nid for nid in resolved_node_ids if nid]
+
+    def handle_get_checksums(self, sock, request):
+        """Return the current version and per-chunk checksums of a file, for delta sync."""
         filename = request['filename']
         with self.lock:
             if filename not in self.files:
@@ -345,25 +1594,184 @@ class MasterService:
                 return
             
             file_meta = self.files[filename]
-            plan = []
-            for chunk_id in file_meta['chunks']:
-                locs = self.chunk_locations.get(chunk_id, [])
-                # Filter for online nodes
-                alive_locs = [nid for nid in locs if self.nodes.get(nid, {}).get('status') == 'ONLINE']
-                
-                if not alive_locs:
-                     send_json(sock, {'status': 'ERROR', 'message': 'Data unavailable'})
-                     return
-                     
-                plan.append({
-                    'chunk_id': chunk_id,
-                    'nodes': [self.nodes[nid]['address'] for nid in alive_locs]
-                })
+            send_json(sock, {
+                'status': 'OK',
+                'version': file_meta.get('version', 1),
+                'codec': file_meta.get('codec', 'none'),
+                'chunking': file_meta.get('chunking', 'fixed'),
+                'block_size': file_meta.get('block_size', BLOCK_SIZE),
+                'ec': file_meta.get('ec'),
+                'chunks': [{'chunk_id': cid, 'checksum': self.chunk_checksums.get(cid)}
+                           for cid in file_meta['chunks']]
+            })
+
+    def handle_download_req(self, sock, request):
+        with self.lock:
+            resp = self._download_plan(request['filename'])
+            lease = self._grant_lease(request['filename'], resp)
+        send_json(sock, self._leased(request, resp, lease))
+
+    def handle_download_req_batch(self, sock, request):
+        """
+        Plans for many files in one round trip: {filenames: [...]} -> {files: {name: plan}}.
+        Optional 'tags' ({name: tag}) are the client's cached copies, checked like DOWNLOAD_REQ's 'tag'.
+        """
+        tags = request.get('tags', {})
+        with self.lock:
+            plans = {filename: self._download_plan(filename) for filename in request['filenames']}
+            leases = {filename: self._grant_lease(filename, plan) for filename, plan in plans.items()}
+        plans = {filename: self._leased({'tag': tags.get(filename)}, plan, leases[filename])
+                 for filename, plan in plans.items()}
+        send_json(sock, {'status': 'OK', 'files': plans})
+
+    def _placement_sample(self, candidates, count, size=BLOCK_SIZE):
+        """
+        Pick count distinct nodes for new data, at random but preferring nodes whose
+        fastest tier (from the heartbeat's 'tiers') still has room for a size-byte chunk, then
+        nodes without tier info or with room only on slower tiers; full nodes last.
+        """
+        def rank(node_id):
+            tiers = self.nodes[node_id]['stats'].get('tiers')
+            if not tiers:
+                return 1
+            if tiers[0]['free'] >= size:
+                return 0
+            return 1 if any(tier['free'] >= size for tier in tiers) else 2
+        candidates = random.sample(candidates, len(candidates))
+        return sorted(candidates, key=rank)[:count]
+
+    def _read_load(self, node_id):
+        """A node's read load from its last heartbeat; 0 when idle."""
+        stats = self.nodes[node_id]['stats']
+        return (stats.get('cpu', 0) / 100 + stats.get('read_rate', 0) / READ_LOAD_BYTES
+                + stats.get('active_requests', 0) / READ_LOAD_REQUESTS)
+
+    def _read_order(self, node_ids):
+        """
+        Order a chunk's replicas for one reader: a weighted shuffle where a node's
+        chance of coming first falls with its load (u ** (1 + load), largest first).
+        Clients read the first replica, so reads spread over all copies while
+        load reports are a heartbeat old.
+        """
+        if len(node_ids) < 2:
+            return node_ids
+        return sorted(node_ids, key=lambda nid: -random.random() ** (1 + self._read_load(nid)))
+
+    def _grant_lease(self, filename, plan):
+        """
+        Seconds a client may cache filename's download plan (caller holds the
+        lock and builds the plan in the same critical section). Recorded so
+        writes can wait the lease out; 0 while a write to the file is waiting.
+        """
+        if plan['status'] != 'OK' or filename in self.lease_waits or None in self.lease_waits:
+            return 0
+        self.read_leases[filename] = time.time() + METADATA_LEASE
+        return METADATA_LEASE
+
+    @contextmanager
+    def _honoring_leases(self, filenames):
+        """
+        Hold a write to filenames (None: the whole namespace) back until every
+        download plan of them a client may still be caching has expired, so no
+        cached plan outlives the file contents it describes. Enter it before
+        taking the lock and commit inside it.
+        """
+        keys = [None] if filenames is None else list(dict.fromkeys(filenames))
+        with self.lock:
+            for key in keys:
+                self.lease_waits[key] = self.lease_waits.get(key, 0) + 1
+            leased = self.read_leases.values() if filenames is None else (self.read_leases.get(f, 0) for f in keys)
+            delay = max(leased, default=0) - time.time()
+        try:
+            if delay > 0:
+                target = 'the namespace' if filenames is None else ', '.join(keys)
+                logging.info(f"Write to {target} waits {delay:.1f}s for cached download plans to expire")
+                time.sleep(delay)
+            yield
+        finally:
+            with self.lock:
+                for key in keys:
+                    self.lease_waits[key] -= 1
+                    if not self.lease_waits[key]:
+                        del self.lease_waits[key]
+                    self.read_leases.pop(key, None) # Expired while we waited
+
+    def _expire_leases(self):
+        """Forget read leases that ran out (caller holds the lock)."""
+        now = time.time()
+        for filename in [f for f, expires in self.read_leases.items() if expires <= now]:
+            del self.read_leases[filename]
+
+    def _leased(self, request, reply, lease=METADATA_LEASE):
+        """
+        Let the client cache a successful read reply: add a content tag and the
+        lease (seconds) it may reuse the reply for. A client revalidating a copy
+        with the same tag gets NOT_MODIFIED (and a new lease) instead of the body.
+        """
+        if reply['status'] != 'OK':
+            return reply
+        canonical = reply
+        if reply.get('chunks'):
+            # Replica order differs per request (_read_order), the replica set is what counts
+            canonical = dict(reply, chunks=[dict(c, nodes=sorted(c['nodes'])) if 'nodes' in c else c
+                                            for c in reply['chunks']])
+        tag = format(zlib.crc32(json.dumps(canonical, sort_keys=True).encode('utf-8')), '08x')
+        if request.get('tag') == tag:
+            return {'status': 'NOT_MODIFIED', 'lease': lease}
+        return dict(reply, tag=tag, lease=lease)
+
+    def _download_plan(self, filename):
+        """Build the DOWNLOAD_REQ response for one file (caller holds the lock)."""
+        if filename not in self.files:
+            return {'status': 'ERROR', 'message': 'File not found'}
+        
+        file_meta = self.files[filename]
+        if 'inline' in file_meta or 'inline_ref' in file_meta:
+            return {'status': 'OK', 'filesize': file_meta['size'], 'version': file_meta.get('version', 1),
+                    'inline': self._inline_body(file_meta), 'chunks': []}
+        
+        plan = []
+        for chunk_id in file_meta['chunks']:
+            locs = self.chunk_locations.get(chunk_id, [])
+            
+            if chunk_id in self.ec_chunks:
+                # Degraded reads are fine as long as any k fragments are reachable
+                k, m = self.ec_chunks[chunk_id]
+                fragments = [self.nodes[nid]['address'] if self.nodes.get(nid, {}).get('status') == 'ONLINE' else None
+                             for nid in locs]
+                if sum(1 for addr in fragments if addr) < k:
+                    return {'status': 'ERROR', 'message': 'Data unavailable'}
+                plan.append({'chunk_id': chunk_id, 'ec': [k, m], 'fragments': fragments})
+                continue
+            
+            # Filter for online nodes
+            alive_locs = self._read_order([nid for nid in locs if self.nodes.get(nid, {}).get('status') == 'ONLINE'])
+            
+            if not alive_locs:
+                return {'status': 'ERROR', 'message': 'Data unavailable'}
                 
-            send_json(sock, {'status': 'OK', 'filesize': file_meta['size'], 'chunks': plan})
+            plan.append({
+                'chunk_id': chunk_id,
+                'nodes': [self.nodes[nid]['address'] for nid in alive_locs]
+            })
+            
+        return {
+            'status': 'OK',
+            'filesize': file_meta['size'],
+            'version': file_meta.get('version', 1),
+            'codec': file_meta.get('codec', 'none'),
+            'chunking': file_meta.get('chunking', 'fixed'),
+            'block_size': file_meta.get('block_size', BLOCK_SIZE),
+            'chunks': plan
+        }
 
 def start_master():
-    master = MasterService()
+    # python master.py [shard_index]: with MASTER_SHARDS set, run that shard on its configured port
+    if MASTER_SHARDS and len(sys.argv) > 1:
+        index = int(sys.argv[1])
+        master = MasterService(port=MASTER_SHARDS[index][1], shard=(index, len(MASTER_SHARDS)))
+    else:
+        master = MasterService()
     master.start()
 
 if __name__ == "__main__":
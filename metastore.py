@@ -0,0 +1,594 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import MutableMapping, Sequence
+
+# Chunk IDs minted by the master look like "<filename>_chunk_<i>_<8 hex>"; those are
+# stored as three integers. Anything else is kept as a plain string.
+_HEX = '0123456789abcdef'
+_LOST = 0xFFFF # Node slot of a lost erasure-coded fragment
+_NO_DIGEST = bytes(32)
+
+class StringTable:
+    """Interns strings to small integer indices (filenames, node IDs)."""
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def intern(self, s):
+        idx = self.index.get(s)
+        if idx is None:
+            idx = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return idx
+
+    def __len__(self):
+        return len(self.strings)
+
+class ChunkTable:
+    """
+    Every chunk the master knows about, addressed by an integer handle.
+    Per-chunk fields live in parallel arrays instead of per-chunk dicts/lists:
+      chunk ID  -> filename index + chunk number + 32-bit suffix
+      locations -> 2 bytes per replica/fragment slot (interned node index)
+      checksum  -> 32 raw SHA-256 bytes
+      refs      -> uint32
+    The locations, checksums and refs attributes are dict-like views keyed by
+    chunk ID string, so callers keep using chunk IDs.
+    """
+    def __init__(self):
+        self.names = StringTable() # Filename part of chunk IDs
+        self.node_ids = StringTable()
+        self._prefix = array('I')
+        self._number = array('I')
+        self._suffix = array('I')
+        self._locs = [] # handle -> bytes of node indices, or None
+        self._digests = bytearray()
+        self._refs = array('I')
+        self._handles = {} # packed ID (int) or raw ID (str) -> handle; None until first lookup after a snapshot load
+        self._raw_ids = {} # handle -> chunk ID that does not follow the master's format
+        self._free = []
+        self._by_node = None # node index -> set of handles placed there; None until first use
+        self.locations = _LocationView(self)
+        self.checksums = _ChecksumView(self)
+        self.refs = _RefView(self)
+        self.on_change = None # Called with the chunk ID after a location or checksum change
+
+    def _key(self, chunk_id):
+        head, _, suffix = chunk_id.rpartition('_')
+        name, sep, number = head.rpartition('_chunk_')
+        if (not sep or len(suffix) != 8 or suffix.strip(_HEX) or not (number.isascii() and number.isdigit())
+                or number != str(int(number)) or int(number) > 0xFFFFFFFF):
+            return chunk_id, None
+        parts = (name, int(number), int(suffix, 16))
+        prefix = self.names.index.get(name)
+        if prefix is None:
+            return None, parts # Unknown filename, so no chunk can have this ID yet
+        return (prefix << 64) | (parts[1] << 32) | parts[2], parts
+
+    def _index(self):
+        """The chunk ID -> handle index, built on first use after load_snapshot."""
+        if self._handles is None:
+            skip = set(self._free).union(self._raw_ids)
+            handles = {(p << 64) | (n << 32) | x: h
+                       for h, (p, n, x) in enumerate(zip(self._prefix, self._number, self._suffix)) if h not in skip}
+            handles.update((raw, h) for h, raw in self._raw_ids.items())
+            self._handles = handles
+        return self._handles
+
+    def handle(self, chunk_id, create=False):
+        """Handle of chunk_id; None if unknown and create is False."""
+        key, parts = self._key(chunk_id)
+        h = self._index().get(key) if key is not None else None
+        if h is not None or not create:
+            return h
+
+        if parts:
+            prefix = self.names.intern(parts[0])
+            key = (prefix << 64) | (parts[1] << 32) | parts[2]
+        else:
+            prefix, parts = 0, (None, 0, 0)
+        if self._free:
+            h = self._free.pop()
+            self._prefix[h], self._number[h], self._suffix[h] = prefix, parts[1], parts[2]
+        else:
+            h = len(self._locs)
+            self._prefix.append(prefix)
+            self._number.append(parts[1])
+            self._suffix.append(parts[2])
+            self._locs.append(None)
+            self._digests += _NO_DIGEST
+            self._refs.append(0)
+        if isinstance(key, str):
+            self._raw_ids[h] = key
+        self._index()[key] = h
+        return h
+
+    def chunk_id(self, h):
+        raw = self._raw_ids.get(h)
+        if raw is not None:
+            return raw
+        return f"{self.names.strings[self._prefix[h]]}_chunk_{self._number[h]}_{self._suffix[h]:08x}"
+
+    def _maybe_free(self, h):
+        """Recycle a handle once nothing is recorded for it any more."""
+        if self._locs[h] is not None or self._refs[h] or self._digests[h * 32:h * 32 + 32] != _NO_DIGEST:
+            return
+        raw = self._raw_ids.pop(h, None)
+        if raw is not None:
+            del self._index()[raw]
+        else:
+            del self._index()[(self._prefix[h] << 64) | (self._number[h] << 32) | self._suffix[h]]
+        self._free.append(h)
+
+    def clear_refs(self):
+        self._refs = array('I', bytes(4 * len(self._refs)))
+
+    def add_refs(self, chunk_list):
+        for h in chunk_list.handles():
+            self._refs[h] += 1
+
+    def digest(self, h):
+        """Raw SHA-256 of a chunk, or None if unknown."""
+        digest = bytes(self._digests[h * 32:h * 32 + 32])
+        return digest if digest != _NO_DIGEST else None
+
+    def has_locations(self, h):
+        return self._locs[h] is not None
+
+    def chunk_list(self, chunk_ids):
+        """Immutable, range-encoded sequence of chunk IDs for a file entry."""
+        if isinstance(chunk_ids, ChunkList) and chunk_ids.table is self:
+            return chunk_ids
+        return ChunkList(self, [self.handle(cid, create=True) for cid in chunk_ids])
+
+    def _encode_locs(self, node_ids):
+        return array('H', [_LOST if nid is None else self.node_ids.intern(nid) for nid in node_ids]).tobytes()
+
+    def _decode_locs(self, data):
+        return [None if idx == _LOST else self.node_ids.strings[idx] for idx in array('H', data)]
+
+    def live_chunks(self):
+        return len(self._locs) - len(self._free)
+
+    def _node_index(self):
+        """The node index -> handles index, built on first use (block reports) from the location slots."""
+        if self._by_node is None:
+            by_node = {}
+            for h, locs in enumerate(self._locs):
+                if locs is not None:
+                    for idx in set(array('H', locs)) - {_LOST}:
+                        by_node.setdefault(idx, set()).add(h)
+            self._by_node = by_node
+        return self._by_node
+
+    def _set_locs(self, h, data):
+        """Replace a chunk's location slots (None: no locations), keeping the node index current."""
+        if self._by_node is not None:
+            old = set(array('H', self._locs[h])) if self._locs[h] is not None else set()
+            new = set(array('H', data)) if data is not None else set()
+            for idx in old - new - {_LOST}:
+                handles = self._by_node[idx]
+                handles.discard(h)
+                if not handles:
+                    del self._by_node[idx]
+            for idx in new - old - {_LOST}:
+                self._by_node.setdefault(idx, set()).add(h)
+        self._locs[h] = data
+
+    def chunks_on(self, node_id):
+        """IDs of every chunk with a replica or fragment on node_id."""
+        idx = self.node_ids.index.get(node_id)
+        if idx is None:
+            return []
+        return [self.chunk_id(h) for h in self._node_index().get(idx, ())]
+
+class ChunkList(Sequence):
+    """
+    A file's chunk IDs as runs of consecutive handles: [start, count, start, count, ...].
+    Chunks committed together get consecutive handles, so most files are one run.
+    """
+    __slots__ = ('table', 'runs', 'length')
+
+    def __init__(self, table, handles):
+        self.table = table
+        self.runs = array('I')
+        self.length = len(handles)
+        for h in handles:
+            if self.runs and self.runs[-2] + self.runs[-1] == h:
+                self.runs[-1] += 1
+            else:
+                self.runs.extend((h, 1))
+
+    @classmethod
+    def from_runs(cls, table, runs):
+        chunk_list = cls(table, [])
+        chunk_list.runs = array('I', runs)
+        chunk_list.length = sum(chunk_list.runs[1::2])
+        return chunk_list
+
+    def handles(self):
+        for i in range(0, len(self.runs), 2):
+            yield from range(self.runs[i], self.runs[i] + self.runs[i + 1])
+
+    def __iter__(self):
+        chunk_id = self.table.chunk_id
+        return (chunk_id(h) for h in self.handles())
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        for i in range(0, len(self.runs), 2):
+            if index < self.runs[i + 1]:
+                return self.table.chunk_id(self.runs[i] + index)
+            index -= self.runs[i + 1]
+
+    def __eq__(self, other):
+        return isinstance(other, (list, tuple, ChunkList)) and list(self) == list(other)
+
+    def __deepcopy__(self, memo):
+        return self # Immutable; snapshots and clones share it
+
+    def __repr__(self):
+        return f"ChunkList({list(self)!r})"
+
+class _LocationView(MutableMapping):
+    """chunk_id -> [node_id, ...] (None for a lost fragment). Values are copies: assign to update."""
+    def __init__(self, table):
+        self.table = table
+        self.count = 0
+
+    def __getitem__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        if h is None or self.table._locs[h] is None:
+            raise KeyError(chunk_id)
+        return self.table._decode_locs(self.table._locs[h])
+
+    def __setitem__(self, chunk_id, node_ids):
+        h = self.table.handle(chunk_id, create=True)
+        if self.table._locs[h] is None:
+            self.count += 1
+        self.table._set_locs(h, self.table._encode_locs(node_ids))
+        if self.table.on_change:
+            self.table.on_change(chunk_id)
+
+    def __delitem__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        if h is None or self.table._locs[h] is None:
+            raise KeyError(chunk_id)
+        self.table._set_locs(h, None)
+        self.count -= 1
+        self.table._maybe_free(h)
+        if self.table.on_change:
+            self.table.on_change(chunk_id)
+
+    def __contains__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        return h is not None and self.table._locs[h] is not None
+
+    def __iter__(self):
+        for h, locs in enumerate(self.table._locs):
+            if locs is not None:
+                yield self.table.chunk_id(h)
+
+    def items(self):
+        decode = self.table._decode_locs
+        return [(self.table.chunk_id(h), decode(locs)) for h, locs in enumerate(self.table._locs) if locs is not None]
+
+    def __len__(self):
+        return self.count
+
+class _ChecksumView(MutableMapping):
+    """chunk_id -> SHA-256 hex digest."""
+    def __init__(self, table):
+        self.table = table
+        self.count = 0
+
+    def _digest(self, h):
+        return bytes(self.table._digests[h * 32:h * 32 + 32])
+
+    def __getitem__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        if h is None or self._digest(h) == _NO_DIGEST:
+            raise KeyError(chunk_id)
+        return self._digest(h).hex()
+
+    def __setitem__(self, chunk_id, checksum):
+        digest = bytes.fromhex(checksum)
+        if len(digest) != 32:
+            raise ValueError(f"Not a SHA-256 digest: {checksum}")
+        h = self.table.handle(chunk_id, create=True)
+        if self._digest(h) == _NO_DIGEST:
+            self.count += 1
+        self.table._digests[h * 32:h * 32 + 32] = digest
+        if self.table.on_change:
+            self.table.on_change(chunk_id)
+
+    def __delitem__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        if h is None or self._digest(h) == _NO_DIGEST:
+            raise KeyError(chunk_id)
+        self.table._digests[h * 32:h * 32 + 32] = _NO_DIGEST
+        self.count -= 1
+        self.table._maybe_free(h)
+        if self.table.on_change:
+            self.table.on_change(chunk_id)
+
+    def __iter__(self):
+        for h in range(len(self.table._refs)):
+            if self._digest(h) != _NO_DIGEST:
+                yield self.table.chunk_id(h)
+
+    def __len__(self):
+        return self.count
+
+class _RefView(MutableMapping):
+    """chunk_id -> number of file entries referencing it (absent when 0)."""
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        if h is None or not self.table._refs[h]:
+            raise KeyError(chunk_id)
+        return self.table._refs[h]
+
+    def __setitem__(self, chunk_id, refs):
+        h = self.table.handle(chunk_id, create=True)
+        self.table._refs[h] = refs
+        if not refs:
+            self.table._maybe_free(h)
+
+    def __delitem__(self, chunk_id):
+        h = self.table.handle(chunk_id)
+        if h is None or not self.table._refs[h]:
+            raise KeyError(chunk_id)
+        self.table._refs[h] = 0
+        self.table._maybe_free(h)
+
+    def __iter__(self):
+        for h, refs in enumerate(self.table._refs):
+            if refs:
+                yield self.table.chunk_id(h)
+
+    def __len__(self):
+        return sum(1 for refs in self.table._refs if refs)
+
+class InlineStore:
+    """
+    Bodies of inline (tiny) files, kept out of the metadata snapshot so saving
+    it never rewrites them. Bodies are appended to <prefix>.<generation> and
+    file entries reference them as [generation, offset, length]. compact()
+    copies the live bodies to a new generation; drop_unused() then deletes
+    the generations no saved snapshot references any more.
+    Not thread-safe: the master calls it under its lock.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        directory, base = os.path.split(os.path.abspath(prefix))
+        self.directory = directory
+        generations = [int(name[len(base) + 1:]) for name in os.listdir(directory)
+                       if name.startswith(base + '.') and name[len(base) + 1:].isdigit()]
+        self.generation = max(generations, default=0)
+        self.handles = {} # generation -> open file, opened on first use
+        path = self._path(self.generation)
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _path(self, generation):
+        return f"{self.prefix}.{generation}"
+
+    def _file(self, generation):
+        f = self.handles.get(generation)
+        if f is None:
+            f = self.handles[generation] = open(self._path(generation), 'a+b')
+        return f
+
+    def append(self, data):
+        """Store data durably; returns its reference."""
+        f = self._file(self.generation)
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        self.size = offset + len(data)
+        return [self.generation, offset, len(data)]
+
+    def read(self, ref):
+        generation, offset, length = ref
+        f = self._file(generation)
+        f.seek(offset)
+        data = f.read(length)
+        if len(data) != length:
+            raise ValueError(f"Inline body {ref} is truncated")
+        return data
+
+    def compact(self, refs):
+        """Copy the bodies refs point to into a new generation; returns {tuple(old ref): new ref}."""
+        moved = {}
+        bodies = [(tuple(ref), self.read(ref)) for ref in refs]
+        self.generation += 1 # The highest on disk, so the file is new
+        self.size = 0
+        for key, data in bodies:
+            if key not in moved:
+                moved[key] = self.append(data)
+        if not bodies:
+            self.append(b'') # Create the file so the generation survives a restart
+        return moved
+
+    def drop_unused(self, refs):
+        """Delete generations other than the current one that no reference points to."""
+        used = {ref[0] for ref in refs} | {self.generation}
+        base = os.path.basename(self.prefix)
+        for name in os.listdir(self.directory):
+            suffix = name[len(base) + 1:]
+            if name.startswith(base + '.') and suffix.isdigit() and int(suffix) not in used:
+                f = self.handles.pop(int(suffix), None)
+                if f:
+                    f.close()
+                os.remove(os.path.join(self.directory, name))
+
+    def close(self):
+        for f in self.handles.values():
+            f.close()
+        self.handles.clear()
+
+# Binary metadata snapshot
+#
+#   header:  b'DFSMETA\0', u32 format version, u32 section count
+#   section: 4-byte tag, u64 payload length, payload, zero padding to 8 bytes
+#
+# All integers are little-endian. Per-chunk columns are fixed-width arrays indexed
+# by handle, so a reader can map them straight from the file. Readers skip
+# sections they do not know; incompatible layout changes bump the version.
+SNAPSHOT_MAGIC = b'DFSMETA\0'
+SNAPSHOT_VERSION = 1
+_FLAG_LOCS = 1 # The chunk has a placement (possibly empty)
+_FLAG_FREE = 2 # Unused handle, kept so file entries keep their handles
+
+def _le(arr):
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+def _from_le(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+def _pack_strings(strings):
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets = array('I', [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return struct.pack('<I', len(blobs)) + _le(offsets) + b''.join(blobs)
+
+def _unpack_strings(data):
+    count = struct.unpack_from('<I', data)[0]
+    offsets = _from_le('I', data[4:8 + 4 * count])
+    blob = bytes(data[8 + 4 * count:])
+    table = StringTable()
+    table.strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+    table.index = {s: i for i, s in enumerate(table.strings)}
+    return table
+
+def _json_default(obj):
+    # File entries reference chunks by handle runs
+    if isinstance(obj, ChunkList):
+        return list(obj.runs)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def save_snapshot(path, table, files, snapshots):
+    """Write the whole namespace to path atomically (temp file + rename)."""
+    n = len(table._locs)
+    flags = bytearray(n)
+    loc_offsets = array('I', [0])
+    loc_slots = bytearray()
+    for h, locs in enumerate(table._locs):
+        if locs is not None:
+            flags[h] = _FLAG_LOCS
+            loc_slots += locs
+        loc_offsets.append(len(loc_slots) // 2)
+    for h in table._free:
+        flags[h] = _FLAG_FREE
+    if sys.byteorder == 'big':
+        loc_slots = _le(_from_le('H', loc_slots))
+
+    sections = [
+        (b'META', json.dumps({'chunks': n, 'locations': table.locations.count,
+                              'checksums': table.checksums.count}).encode('utf-8')),
+        (b'NAME', _pack_strings(table.names.strings)),
+        (b'NODE', _pack_strings(table.node_ids.strings)),
+        (b'PREF', _le(table._prefix)),
+        (b'NUMB', _le(table._number)),
+        (b'SUFX', _le(table._suffix)),
+        (b'REFS', _le(table._refs)),
+        (b'DGST', bytes(table._digests)),
+        (b'FLAG', bytes(flags)),
+        (b'LOFF', _le(loc_offsets)),
+        (b'LOCS', bytes(loc_slots)),
+        (b'RAWI', json.dumps({str(h): cid for h, cid in table._raw_ids.items()}).encode('utf-8')),
+        (b'FILE', json.dumps(files, default=_json_default).encode('utf-8')),
+        (b'SNAP', json.dumps(snapshots, default=_json_default).encode('utf-8')),
+    ]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + struct.pack('<II', SNAPSHOT_VERSION, len(sections)))
+        for tag, payload in sections:
+            f.write(tag + struct.pack('<Q', len(payload)))
+            f.write(payload)
+            f.write(bytes(-len(payload) % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_sections(path):
+    """Map a snapshot file and return {tag: memoryview of payload} (plus the open mmap)."""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    if bytes(view[:8]) != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a metadata snapshot")
+    version, count = struct.unpack_from('<II', view, 8)
+    if version > SNAPSHOT_VERSION:
+        raise ValueError(f"{path} uses snapshot format {version}, this master reads up to {SNAPSHOT_VERSION}")
+    sections = {}
+    pos = 16
+    for _ in range(count):
+        tag = bytes(view[pos:pos + 4])
+        length = struct.unpack_from('<Q', view, pos + 4)[0]
+        sections[tag] = view[pos + 12:pos + 12 + length]
+        pos += 12 + length + (-length % 8)
+    return sections, mm
+
+def load_snapshot(path):
+    """Read a snapshot written by save_snapshot. Returns (table, files, snapshots)."""
+    sections, mm = read_sections(path)
+    try:
+        table = ChunkTable()
+        table.names = _unpack_strings(sections[b'NAME'])
+        table.node_ids = _unpack_strings(sections[b'NODE'])
+        table._prefix = _from_le('I', sections[b'PREF'])
+        table._number = _from_le('I', sections[b'NUMB'])
+        table._suffix = _from_le('I', sections[b'SUFX'])
+        table._refs = _from_le('I', sections[b'REFS'])
+        table._digests = bytearray(sections[b'DGST'])
+        flags = bytes(sections[b'FLAG'])
+        loc_offsets = _from_le('I', sections[b'LOFF'])
+        loc_slots = bytes(sections[b'LOCS'])
+        if sys.byteorder == 'big':
+            loc_slots = _from_le('H', loc_slots).tobytes()
+        table._locs = [loc_slots[2 * loc_offsets[h]:2 * loc_offsets[h + 1]] if flag & _FLAG_LOCS else None
+                       for h, flag in enumerate(flags)]
+        table._free = [h for h, flag in enumerate(flags) if flag & _FLAG_FREE]
+        table._raw_ids = {int(h): cid for h, cid in json.loads(bytes(sections[b'RAWI'])).items()}
+        table._handles = None # Built on the first lookup by chunk ID
+        counts = json.loads(bytes(sections[b'META']))
+        table.locations.count = counts['locations']
+        table.checksums.count = counts['checksums']
+
+        def chunk_lists(entries):
+            for meta in entries.values():
+                meta['chunks'] = ChunkList.from_runs(table, meta['chunks'])
+            return entries
+        files = chunk_lists(json.loads(bytes(sections[b'FILE'])))
+        snapshots = json.loads(bytes(sections[b'SNAP']))
+        for snap in snapshots.values():
+            chunk_lists(snap['files'])
+    finally:
+        del sections
+        mm.close()
+    return table, files, snapshots
@@ -1,26 +1,325 @@
+import asyncio
 import socket
+import signal
 import threading
 import time
 import os
 import psutil
 import logging
 import sys
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from config import *
-from utils import send_json, receive_json, recv_all, calculate_checksum
+from utils import send_json, receive_json, recv_all, calculate_checksum, pack_id_list, pack_json, read_json
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - Node-%(process)d - %(levelname)s - %(message)s')
 
+class ChunkCache:
+    """
+    Size-bounded LRU cache of chunk bytes, keyed by chunk_id.
+    Chunks larger than the whole budget are never cached. A reader brackets its
+    disk read with begin_read()/end_read() and passes the generation begin_read()
+    returned to put(); invalidate() bumps it only while reads are in flight, so
+    bytes read before a store or delete are not cached and idle IDs cost nothing.
+    """
+    def __init__(self, max_bytes=CHUNK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict() # chunk_id -> bytes, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reads = {} # chunk_id -> [reads in flight, invalidations since the first began]
+        self.lock = threading.Lock()
+
+    def get(self, chunk_id):
+        with self.lock:
+            data = self.entries.get(chunk_id)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(chunk_id)
+            self.hits += 1
+            return data
+
+    def begin_read(self, chunk_id):
+        with self.lock:
+            entry = self.reads.setdefault(chunk_id, [0, 0])
+            entry[0] += 1
+            return entry[1]
+
+    def end_read(self, chunk_id):
+        with self.lock:
+            entry = self.reads[chunk_id]
+            entry[0] -= 1
+            if not entry[0]:
+                del self.reads[chunk_id]
+
+    def put(self, chunk_id, data, generation=None):
+        """Cache data, unless chunk_id was invalidated since begin_read() returned generation (when given)."""
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if generation is not None and self.reads.get(chunk_id, (0, None))[1] != generation:
+                return # Stored or deleted while it was being read
+            self._discard(chunk_id)
+            self.entries[chunk_id] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, chunk_id):
+        with self.lock:
+            entry = self.reads.get(chunk_id)
+            if entry:
+                entry[1] += 1
+            self._discard(chunk_id)
+
+    def _discard(self, chunk_id):
+        data = self.entries.pop(chunk_id, None)
+        if data is not None:
+            self.current_bytes -= len(data)
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'cache_hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'cache_evictions': self.evictions,
+                'cache_bytes': self.current_bytes,
+                'cache_entries': len(self.entries)
+            }
+
+class TokenBucket:
+    """Byte rate limit: `rate` bytes/s (0 = unlimited) with bursts of up to `burst` bytes."""
+    def __init__(self, rate, burst=BLOCK_SIZE):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.time()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+
+    def consume(self, amount):
+        """Wait until amount bytes may pass; returns the seconds waited."""
+        wait = self.reserve(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def reserve(self, amount):
+        """Take amount bytes of tokens; returns how long the caller must wait before sending them."""
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate) if self.rate > 0 else self.burst
+            self.stamp = now
+            if self.rate <= 0:
+                return 0
+            # Go into debt and wait it off, so callers are served in arrival order
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+class TrafficShaper:
+    """
+    Node-side QoS. Every command names its traffic class in the 'qos' header
+    field ('foreground' unless it says 'background'); each class has its own
+    token bucket, and background disk I/O is held back while foreground disk
+    I/O is in flight (for at most QOS_MAX_DEFER), so recovery traffic cannot
+    push client reads off the disk.
+    """
+    CLASSES = ('foreground', 'background')
+
+    def __init__(self, limits=QOS_LIMITS):
+        self.buckets = {cls: TokenBucket(limits.get(cls, 0)) for cls in self.CLASSES}
+        self.io_cond = threading.Condition()
+        self.foreground_io = 0
+        self.throttled = {cls: 0.0 for cls in self.CLASSES} # Seconds spent waiting for tokens
+        self.deferred = 0 # Background disk operations that waited for foreground ones
+
+    def traffic_class(self, command):
+        return 'background' if command.get('qos') == 'background' else 'foreground'
+
+    def throttle(self, traffic_class, size, rate=None):
+        """Wait for size bytes of the class's bandwidth; rate (from the header) caps this transfer further."""
+        wait = self.reserve(traffic_class, size, rate)
+        if wait:
+            time.sleep(wait)
+
+    def reserve(self, traffic_class, size, rate=None):
+        """Non-blocking throttle: the seconds to wait before moving size bytes."""
+        wait = self.buckets[traffic_class].reserve(size)
+        if rate:
+            wait = max(wait, size / rate)
+        if wait:
+            with self.io_cond:
+                self.throttled[traffic_class] += wait
+        return wait
+
+    def begin_io(self, traffic_class):
+        with self.io_cond:
+            if traffic_class == 'foreground':
+                self.foreground_io += 1
+            elif self.foreground_io:
+                self.deferred += 1
+                self.io_cond.wait_for(lambda: self.foreground_io == 0, timeout=QOS_MAX_DEFER)
+
+    def end_io(self, traffic_class):
+        if traffic_class == 'foreground':
+            with self.io_cond:
+                self.foreground_io -= 1
+                if not self.foreground_io:
+                    self.io_cond.notify_all()
+
+    def set_limits(self, limits):
+        for cls, rate in limits.items():
+            if cls not in self.buckets:
+                raise ValueError(f"Unknown traffic class {cls}")
+            self.buckets[cls].set_rate(max(0, int(rate)))
+
+    def get_stats(self):
+        with self.io_cond:
+            return {
+                'qos_limits': {cls: bucket.rate for cls, bucket in self.buckets.items()},
+                'qos_throttled_seconds': {cls: round(s, 3) for cls, s in self.throttled.items()},
+                'qos_deferred_io': self.deferred
+            }
+
+PART_SUFFIX = '.part' # Chunk being written (<chunk_id>.<writer>.part); renamed into place once complete
+
+def fsync_path(path):
+    """fsync a file, or a directory so the renames in it are durable (skipped where unsupported)."""
+    if os.path.isdir(path):
+        if not hasattr(os, 'O_DIRECTORY'):
+            return # Windows cannot open directories; NTFS journals renames itself
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    else:
+        fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sync_files(paths):
+    """Make the data of every file in paths durable, with one flush where the OS has one."""
+    if hasattr(os, 'sync'):
+        os.sync() # Every dirty page, so one call covers the whole batch
+        return
+    for path in paths:
+        fsync_path(path)
+
+class GroupCommitter:
+    """
+    Group commit for chunk writes. Writers leave their .part file in the page
+    cache, hand it in and block; the first one in becomes the leader, waits
+    `window` for others to join, then flushes the data of the whole batch
+    once, renames it into place and fsyncs the directory once before
+    releasing them all. Writers arriving mid-commit form the next batch.
+    """
+    def __init__(self, directory, window=GROUP_COMMIT_WINDOW):
+        self.directory = directory
+        self.window = window
+        self.cond = threading.Condition()
+        self.pending = [] # [part_path, final_path, done, error]
+        self.committing = False
+        self.batches = 0
+        self.files = 0
+
+    def commit(self, part_path, final_path):
+        """Return once part_path is durable under final_path; raises if the batch failed."""
+        entry = [part_path, final_path, False, None]
+        with self.cond:
+            self.pending.append(entry)
+            while not entry[2] and self.committing:
+                self.cond.wait()
+            if not entry[2]:
+                self.committing = True # Lead the next batch
+        if not entry[2]:
+            self._lead()
+        if entry[3]:
+            raise entry[3]
+
+    def _lead(self):
+        if self.window:
+            time.sleep(self.window)
+        with self.cond:
+            batch, self.pending = self.pending, []
+        error = None
+        try:
+            sync_files([entry[0] for entry in batch]) # Data first: a rename must never expose unflushed bytes
+            for part_path, final_path, _, _ in batch:
+                os.replace(part_path, final_path)
+            fsync_path(self.directory)
+        except OSError as e:
+            error = e
+        with self.cond:
+            for entry in batch:
+                entry[2], entry[3] = True, error
+            self.batches += 1
+            self.files += len(batch)
+            self.committing = False
+            self.cond.notify_all()
+
+    def get_stats(self):
+        with self.cond:
+            return {'commit_batches': self.batches,
+                    'commit_batch_avg': round(self.files / self.batches, 2) if self.batches else 0.0}
+
 class NodeServer:
-    def __init__(self, node_id, port, master_host=MASTER_HOST, master_port=MASTER_PORT):
+    def __init__(self, node_id, port, master_host=MASTER_HOST, master_port=MASTER_PORT, masters=None,
+                 durability=NODE_DURABILITY):
         self.node_id = node_id
         self.port = port
-        self.master_host = master_host
-        self.master_port = master_port
-        self.storage_path = os.path.join(STORAGE_ROOT, f"node_{node_id}")
+        # Every master shard of a federated namespace (or the single master)
+        self.masters = [tuple(m) for m in (masters or MASTER_SHARDS or [(master_host, master_port)])]
+        # Storage tiers, fastest first; storage_path is the fastest one
+        self.tiers = [{'name': name, 'path': os.path.join(root, f"node_{node_id}"), 'capacity': capacity, 'bytes': 0}
+                      for name, root, capacity in (NODE_TIERS or [('default', STORAGE_ROOT, 0)])]
+        self.storage_path = self.tiers[0]['path']
         self.running = True
+        self.cache = ChunkCache(CHUNK_CACHE_BYTES)
+        self.qos = TrafficShaper(QOS_LIMITS)
+        # Read load, reported to Master for replica ordering
+        self.load_lock = threading.Lock()
+        self.served_bytes = 0
+        self.active_requests = 0
+        
+        if durability not in ('none', 'fsync', 'group'):
+            raise ValueError(f"Unknown durability mode {durability}")
+        self.durability = durability
+        self.committers = [GroupCommitter(tier['path']) for tier in self.tiers]
         
-        if not os.path.exists(self.storage_path):
-            os.makedirs(self.storage_path)
+        # Where each chunk lives: chunk_id -> [tier index, write generation, size]. Stores
+        # bump the generation first, so a migrator move that raced with one is dropped.
+        self.tier_lock = threading.Lock()
+        self.tier_of = {}
+        self.access = {} # chunk_id -> [last read, reads since the last migrator pass]
+        for index, tier in enumerate(self.tiers):
+            if not os.path.exists(tier['path']):
+                os.makedirs(tier['path'])
+            for name in os.listdir(tier['path']):
+                path = os.path.join(tier['path'], name)
+                if name.endswith(PART_SUFFIX) or name in self.tier_of:
+                    # Never acked (the writer retries elsewhere), or left behind by an interrupted migration
+                    os.remove(path)
+                    continue
+                self.tier_of[name] = [index, 0, os.path.getsize(path)]
+                tier['bytes'] += self.tier_of[name][2]
+        
+        # Chunk inventory for block reports: everything on disk (chunk_id -> size),
+        # plus, per master, the changes since the last report that reached it
+        self.inventory_lock = threading.Lock()
+        self.inventory = {name: entry[2] for name, entry in self.tier_of.items()}
+        self.stored_bytes = sum(self.inventory.values())
+        self.reports = {address: {'added': set(), 'removed': set(), 'last_full_report': 0, 'send_full': True}
+                        for address in self.masters}
             
         logging.info(f"Node {self.node_id} initialized. Storage: {self.storage_path}")
 
@@ -28,11 +327,13 @@ class NodeServer:
         """Start the node server (heartbeat and command listener)."""
         # Start heartbeat thread
         threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+        if len(self.tiers) > 1:
+            threading.Thread(target=self.migrator_loop, daemon=True).start()
         
         # Start TCP listener
         server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_sock.bind(('0.0.0.0', self.port))
-        server_sock.listen(5)
+        server_sock.listen(NODE_BACKLOG)
         logging.info(f"Node {self.node_id} listening on port {self.port}")
         
         try:
@@ -45,27 +346,100 @@ class NodeServer:
             server_sock.close()
 
     def heartbeat_loop(self):
-        """Periodically send heartbeat with stats to Master."""
-        while self.running:
-            try:
-                stats = self.get_stats()
-                message = {
-                    'type': 'HEARTBEAT',
+        """
+        Periodically send heartbeat with stats to every master. Heartbeats carry
+        the chunks added/removed since the previous one (incremental block report);
+        a full inventory goes out when a master asks and every BLOCK_REPORT_INTERVAL.
+        """
+        active = list(self.masters)
+        while self.running and active:
+            stats = self.get_stats()
+            for address in list(active):
+                if not self.heartbeat(address, stats):
+                    active.remove(address)
+            time.sleep(HEARTBEAT_INTERVAL)
+        if not active:
+            logging.info(f"Node {self.node_id} was decommissioned by Master; it is safe to shut down.")
+
+    def heartbeat(self, address, stats):
+        """One heartbeat to one master; False once that master has decommissioned us."""
+        report = self.reports[address]
+        if report['send_full'] or time.time() - report['last_full_report'] > BLOCK_REPORT_INTERVAL:
+            report['send_full'] = not self.send_block_report(address)
+
+        with self.inventory_lock:
+            added, removed = report['added'], report['removed']
+            report['added'], report['removed'] = set(), set()
+        try:
+            message = {
+                'type': 'HEARTBEAT',
+                'node_id': self.node_id,
+                'port': self.port,
+                'stats': stats,
+                'added': sorted(added),
+                'removed': sorted(removed)
+            }
+            
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.connect(address)
+                send_json(sock, message)
+                reply = receive_json(sock)
+            if reply and reply['status'] == 'DECOMMISSIONED':
+                return False
+            # Master restarted or lost track of us: it needs the whole inventory
+            report['send_full'] = report['send_full'] or not reply or reply.get('send_block_report', False)
+                
+        except ConnectionRefusedError:
+            logging.warning(f"Node {self.node_id} could not connect to Master at {address[0]}:{address[1]}")
+            report['send_full'] = True # The deltas are lost with this heartbeat
+        except Exception as e:
+            logging.error(f"Heartbeat error: {e}")
+            report['send_full'] = True
+        return True
+
+    def send_block_report(self, address):
+        """Send the full chunk inventory to one master; True once it was accepted."""
+        report = self.reports[address]
+        with self.inventory_lock:
+            chunks = sorted(self.inventory)
+            added, removed = report['added'], report['removed']
+            report['added'], report['removed'] = set(), set() # Covered by the full report
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.connect(address)
+                send_json(sock, {
+                    'type': 'BLOCK_REPORT',
                     'node_id': self.node_id,
                     'port': self.port,
-                    'stats': stats
-                }
-                
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                    sock.connect((self.master_host, self.master_port))
-                    send_json(sock, message)
-                    
-            except ConnectionRefusedError:
-                logging.warning(f"Node {self.node_id} could not connect to Master at {self.master_host}:{self.master_port}")
-            except Exception as e:
-                logging.error(f"Heartbeat error: {e}")
-                
-            time.sleep(HEARTBEAT_INTERVAL)
+                    'chunks': pack_id_list(chunks)
+                })
+                reply = receive_json(sock)
+            if reply and reply['status'] == 'OK':
+                report['last_full_report'] = time.time()
+                logging.info(f"Node {self.node_id} sent block report ({len(chunks)} chunks)")
+                return True
+        except Exception as e:
+            logging.warning(f"Node {self.node_id} block report failed: {e}")
+        with self.inventory_lock:
+            # Keep the deltas so the next heartbeat still carries them
+            report['added'] |= added
+            report['removed'] |= removed
+        return False
+
+    def _record_added(self, chunk_id, size):
+        with self.inventory_lock:
+            self.stored_bytes += size - self.inventory.get(chunk_id, 0)
+            self.inventory[chunk_id] = size
+            for report in self.reports.values():
+                report['added'].add(chunk_id)
+                report['removed'].discard(chunk_id)
+
+    def _record_removed(self, chunk_id):
+        with self.inventory_lock:
+            self.stored_bytes -= self.inventory.pop(chunk_id, 0)
+            for report in self.reports.values():
+                report['removed'].add(chunk_id)
+                report['added'].discard(chunk_id)
 
     def get_stats(self):
         """Gather system metrics using psutil."""
@@ -77,16 +451,37 @@ class NodeServer:
         jitter_cpu = random.uniform(-1.5, 1.5)
         jitter_mem = random.uniform(-0.5, 0.5)
         
-        return {
+        stats = {
             'cpu': max(0, round(psutil.cpu_percent() + jitter_cpu, 1)),
             'ram_percent': max(0, round(mem.percent + jitter_mem, 1)),
             'ram_used': mem.used,
             'disk_percent': disk.percent,
-            'disk_free': disk.free
+            'disk_free': disk.free,
+            'stored_bytes': self.stored_bytes,
+            'stored_chunks': len(self.inventory),
+            'served_bytes': self.served_bytes,
+            'active_requests': self.active_requests
         }
+        stats.update(self.cache.get_stats())
+        stats.update(self.qos.get_stats())
+        batches = sum(c.batches for c in self.committers)
+        stats['commit_batches'] = batches
+        stats['commit_batch_avg'] = round(sum(c.files for c in self.committers) / batches, 2) if batches else 0.0
+        stats['durability'] = self.durability
+        with self.tier_lock:
+            used = [tier['bytes'] for tier in self.tiers]
+        stats['tiers'] = []
+        for tier, tier_used in zip(self.tiers, used):
+            tier_disk = psutil.disk_usage(tier['path'])
+            capacity = tier['capacity'] or tier_disk.total
+            stats['tiers'].append({'name': tier['name'], 'capacity': capacity, 'used': tier_used,
+                                   'free': max(0, min(capacity - tier_used, tier_disk.free))})
+        return stats
 
     def handle_client(self, client_sock):
         """Handle incoming commands from Master or Client."""
+        with self.load_lock:
+            self.active_requests += 1
         try:
             command = receive_json(client_sock)
             if not command:
@@ -100,6 +495,10 @@ class NodeServer:
                 self.handle_retrieve_chunk(client_sock, command)
             elif cmd_type == 'DELETE_CHUNK':
                 self.handle_delete_chunk(client_sock, command)
+            elif cmd_type == 'DELETE_CHUNKS':
+                self.handle_delete_chunks(client_sock, command)
+            elif cmd_type == 'SET_QOS':
+                self.handle_set_qos(client_sock, command)
             else:
                 logging.warning(f"Unknown command: {cmd_type}")
                 
@@ -107,6 +506,17 @@ class NodeServer:
             logging.error(f"Error handling client: {e}")
         finally:
             client_sock.close()
+            with self.load_lock:
+                self.active_requests -= 1
+
+    def _count_served(self, chunk_id, size):
+        with self.load_lock:
+            self.served_bytes += size
+        if len(self.tiers) > 1:
+            with self.tier_lock:
+                reads = self.access.setdefault(chunk_id, [0, 0])
+                reads[0] = time.time()
+                reads[1] += 1
 
     def handle_store_chunk(self, sock, command):
         """
@@ -119,48 +529,412 @@ class NodeServer:
         """
         chunk_id = command['chunk_id']
         size = command['size']
+        traffic_class = self.qos.traffic_class(command)
         
+        # Not reading yet holds the sender back through TCP flow control
+        self.qos.throttle(traffic_class, size, command.get('rate'))
         data = recv_all(sock, size)
         if not data:
             logging.error("Failed to receive chunk data")
             return
 
-        filepath = os.path.join(self.storage_path, chunk_id)
-        with open(filepath, 'wb') as f:
-            f.write(data)
+        checksum = self._save_chunk(chunk_id, data, traffic_class)
+        send_json(sock, {'status': 'OK', 'checksum': checksum})
+
+    def _save_chunk(self, chunk_id, data, traffic_class):
+        """Write a received chunk to the fastest tier with room and to the inventory; returns its checksum."""
+        with self.tier_lock:
+            entry = self.tier_of.setdefault(chunk_id, [None, 0, 0])
+            entry[1] += 1 # Any migration of the previous version is now void
+            index = self._tier_for(len(data))
+        tier = self.tiers[index]
+        filepath = os.path.join(tier['path'], chunk_id)
+        # One temp file per writer: stores of the same chunk (dedup, re-replication) may overlap
+        part_path = f"{filepath}.{uuid.uuid4().hex[:8]}{PART_SUFFIX}"
+        try:
+            self.qos.begin_io(traffic_class)
+            try:
+                # Group commit flushes the data later, once for the whole batch
+                self._write_part(part_path, data, sync=self.durability == 'fsync')
+                if self.durability != 'group':
+                    os.replace(part_path, filepath)
+                    if self.durability == 'fsync':
+                        fsync_path(tier['path']) # Make the rename itself durable
+            finally:
+                self.qos.end_io(traffic_class)
+            if self.durability == 'group':
+                self.committers[index].commit(part_path, filepath) # Shared directory fsync, outside the I/O gate
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        with self.tier_lock:
+            entry = self.tier_of.setdefault(chunk_id, [None, 0, 0])
+            if entry[0] is not None:
+                self.tiers[entry[0]]['bytes'] -= entry[2]
+                if entry[0] != index:
+                    # Overwritten on another tier: drop the old copy
+                    os.remove(os.path.join(self.tiers[entry[0]]['path'], chunk_id))
+            entry[0], entry[2] = index, len(data)
+            tier['bytes'] += len(data)
+        # Drop any cached copy so an overwrite is never served stale
+        self.cache.invalidate(chunk_id)
+        self._record_added(chunk_id, len(data))
             
         checksum = calculate_checksum(data)
-        logging.info(f"Stored chunk {chunk_id}, size {size}, checksum {checksum[:8]}...")
-        
-        send_json(sock, {'status': 'OK', 'checksum': checksum})
+        logging.info(f"Stored chunk {chunk_id}, size {len(data)}, checksum {checksum[:8]}...")
+        return checksum
 
     def handle_retrieve_chunk(self, sock, command):
         """
         Read chunk from disk and send back.
         """
         chunk_id = command['chunk_id']
-        filepath = os.path.join(self.storage_path, chunk_id)
-        
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                data = f.read()
-            send_json(sock, {'status': 'OK', 'size': len(data)})
-            sock.sendall(data)
-            logging.info(f"Served chunk {chunk_id}")
-        else:
+        traffic_class = self.qos.traffic_class(command)
+        data = self.cache.get(chunk_id)
+        cached = data is not None
+        if not cached:
+            data = self._load_chunk(chunk_id, traffic_class)
+        if data is None:
             send_json(sock, {'status': 'ERROR', 'message': 'Chunk not found'})
+            return
+
+        self.qos.throttle(traffic_class, len(data), command.get('rate'))
+        send_json(sock, {'status': 'OK', 'size': len(data)})
+        sock.sendall(data)
+        self._count_served(chunk_id, len(data))
+        logging.info(f"Served chunk {chunk_id}{' (cached)' if cached else ''}")
+
+    def _write_part(self, part_path, data, sync):
+        with open(part_path, 'wb') as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                # Data and size only; the rename that follows carries the rest
+                getattr(os, 'fdatasync', os.fsync)(f.fileno())
+
+    def _tier_for(self, size):
+        """Fastest tier with room for size more bytes, else the slowest (caller holds tier_lock)."""
+        for index, tier in enumerate(self.tiers):
+            if not tier['capacity'] or tier['bytes'] + size <= tier['capacity']:
+                return index
+        return len(self.tiers) - 1
+
+    def _load_chunk(self, chunk_id, traffic_class):
+        """Read a chunk from its tier into the cache; None if it is not stored here."""
+        for attempt in range(2):
+            generation = self.cache.begin_read(chunk_id)
+            try:
+                with self.tier_lock:
+                    entry = self.tier_of.get(chunk_id)
+                    index = entry[0] if entry else None
+                if index is None:
+                    return None
+                self.qos.begin_io(traffic_class)
+                try:
+                    with open(os.path.join(self.tiers[index]['path'], chunk_id), 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue # Moved to another tier meanwhile
+                finally:
+                    self.qos.end_io(traffic_class)
+                self.cache.put(chunk_id, data, generation)
+                return data
+            finally:
+                self.cache.end_read(chunk_id)
+        return None
 
     def handle_delete_chunk(self, sock, command):
+        send_json(sock, self._delete_one(command))
+
+    def _delete_one(self, command):
         chunk_id = command['chunk_id']
-        filepath = os.path.join(self.storage_path, chunk_id)
-        
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if self._delete_chunk_file(chunk_id, self.qos.traffic_class(command)):
             logging.info(f"Deleted chunk {chunk_id}")
-            send_json(sock, {'status': 'OK'})
-        else:
-             # Even if not found, we consider delete successful (idempotent)
-            send_json(sock, {'status': 'OK', 'message': 'Chunk not found'})
+            return {'status': 'OK'}
+        # Even if not found, we consider delete successful (idempotent)
+        return {'status': 'OK', 'message': 'Chunk not found'}
+
+    def handle_delete_chunks(self, sock, command):
+        send_json(sock, self._delete_many(command))
+
+    def _delete_many(self, command):
+        """
+        Bulk delete from the master's garbage collector; missing chunks count as deleted.
+        The batch passes the QoS gate once: deferring every chunk ID up to
+        QOS_MAX_DEFER would stall a full batch for minutes under foreground load.
+        """
+        traffic_class = self.qos.traffic_class(command)
+        self.qos.begin_io(traffic_class)
+        try:
+            deleted = sum(1 for chunk_id in command['chunk_ids'] if self._delete_chunk_file(chunk_id, None))
+        finally:
+            self.qos.end_io(traffic_class)
+        logging.info(f"Deleted {deleted} of {len(command['chunk_ids'])} chunks")
+        return {'status': 'OK', 'deleted': deleted}
+
+    def _delete_chunk_file(self, chunk_id, traffic_class='foreground'):
+        """Remove a chunk from disk and cache; False if it was not there. traffic_class None: caller holds the I/O gate."""
+        if traffic_class:
+            self.qos.begin_io(traffic_class)
+        try:
+            with self.tier_lock:
+                entry = self.tier_of.pop(chunk_id, None)
+                self.access.pop(chunk_id, None)
+                if entry and entry[0] is not None:
+                    self.tiers[entry[0]]['bytes'] -= entry[2]
+                    os.remove(os.path.join(self.tiers[entry[0]]['path'], chunk_id))
+        finally:
+            if traffic_class:
+                self.qos.end_io(traffic_class)
+            # Once the file is gone, so a read racing with the delete cannot re-cache it
+            self.cache.invalidate(chunk_id)
+        if not entry or entry[0] is None:
+            return False
+        self._record_removed(chunk_id)
+        return True
+
+    def migrator_loop(self):
+        while self.running:
+            time.sleep(TIER_MIGRATE_INTERVAL)
+            try:
+                self.migrate_tiers()
+            except Exception as e:
+                logging.error(f"Tier migration error: {e}")
+
+    def migrate_tiers(self):
+        """
+        One migrator pass. A tier above TIER_HIGH_WATERMARK demotes its least
+        recently read chunks one tier down until it is at TIER_LOW_WATERMARK;
+        chunks read TIER_PROMOTE_READS times since the previous pass move one
+        tier up while that tier stays under TIER_LOW_WATERMARK. Returns the
+        number of chunks moved.
+        """
+        with self.tier_lock:
+            chunks = {cid: (entry[0], entry[2]) for cid, entry in self.tier_of.items() if entry[0] is not None}
+            access = {cid: tuple(reads) for cid, reads in self.access.items()}
+            for reads in self.access.values():
+                reads[1] = 0
+            used = [tier['bytes'] for tier in self.tiers]
+        
+        moves = []
+        for index, tier in enumerate(self.tiers[:-1]):
+            if not tier['capacity'] or used[index] <= TIER_HIGH_WATERMARK * tier['capacity']:
+                continue
+            coldest = sorted((cid for cid, (i, _) in chunks.items() if i == index),
+                             key=lambda cid: access.get(cid, (0, 0))[0])
+            for cid in coldest:
+                if used[index] <= TIER_LOW_WATERMARK * tier['capacity']:
+                    break
+                moves.append((cid, index, index + 1))
+                used[index] -= chunks[cid][1]
+                used[index + 1] += chunks[cid][1]
+        
+        demoted = {cid for cid, _, _ in moves}
+        hot = sorted((cid for cid, (i, _) in chunks.items()
+                      if i > 0 and cid not in demoted and access.get(cid, (0, 0))[1] >= TIER_PROMOTE_READS),
+                     key=lambda cid: -access[cid][1])
+        for cid in hot:
+            index, size = chunks[cid]
+            faster = self.tiers[index - 1]
+            if faster['capacity'] and used[index - 1] + size > TIER_LOW_WATERMARK * faster['capacity']:
+                continue
+            moves.append((cid, index, index - 1))
+            used[index - 1] += size
+            used[index] -= size
+        
+        moved = sum(1 for cid, src, dst in moves if self._move_to_tier(cid, src, dst))
+        if moved:
+            logging.info(f"Node {self.node_id} migrated {moved} chunks between tiers "
+                         f"({sum(1 for _, src, dst in moves if dst > src)} demotions planned)")
+        return moved
+
+    def _move_to_tier(self, chunk_id, src, dst):
+        """Copy a chunk to another tier as background I/O, then switch over; False if it changed meanwhile."""
+        with self.tier_lock:
+            entry = self.tier_of.get(chunk_id)
+            if not entry or entry[0] != src:
+                return False
+            generation, size = entry[1], entry[2]
+        src_path = os.path.join(self.tiers[src]['path'], chunk_id)
+        dst_path = os.path.join(self.tiers[dst]['path'], chunk_id)
+        part_path = dst_path + '.migrate' + PART_SUFFIX
+        
+        self.qos.throttle('background', size)
+        self.qos.begin_io('background')
+        try:
+            with open(src_path, 'rb') as f:
+                data = f.read()
+            self._write_part(part_path, data, sync=self.durability != 'none')
+        except FileNotFoundError:
+            return False # Deleted or rewritten meanwhile
+        finally:
+            self.qos.end_io('background')
+        
+        with self.tier_lock:
+            entry = self.tier_of.get(chunk_id)
+            if not entry or entry[:2] != [src, generation]:
+                os.remove(part_path)
+                return False
+            os.replace(part_path, dst_path)
+            if self.durability != 'none':
+                fsync_path(self.tiers[dst]['path']) # Durable on dst before it disappears from src
+            os.remove(src_path)
+            entry[0] = dst
+            self.tiers[src]['bytes'] -= size
+            self.tiers[dst]['bytes'] += size
+        return True
+
+    def handle_set_qos(self, sock, command):
+        send_json(sock, self._set_qos(command))
+
+    def _set_qos(self, command):
+        """Change traffic class limits at runtime: {'limits': {class: bytes/s, ...}} (0 = unlimited)."""
+        try:
+            self.qos.set_limits(command.get('limits', {}))
+        except (ValueError, TypeError) as e:
+            return {'status': 'ERROR', 'message': str(e)}
+        logging.info(f"QoS limits now {self.qos.get_stats()['qos_limits']}")
+        return {'status': 'OK', 'limits': self.qos.get_stats()['qos_limits']}
+
+class AsyncNodeServer(NodeServer):
+    """
+    NodeServer on an asyncio event loop (NODE_ENGINE = 'asyncio'). Connections
+    are coroutines rather than threads, disk reads and writes go to a pool of
+    NODE_IO_WORKERS threads, and at most NODE_MAX_CONNECTIONS connections are
+    served at once. stop() or SIGINT/SIGTERM closes the listener and lets
+    in-flight writes finish (up to NODE_SHUTDOWN_GRACE) before exiting.
+    Heartbeats keep their own thread.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None # Set once serve() runs
+        self.stop_lock = threading.Lock()
+        self.stop_requested = False # A stop() before serve() published its loop is kept here
+
+    def start(self):
+        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+        if len(self.tiers) > 1:
+            threading.Thread(target=self.migrator_loop, daemon=True).start()
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            logging.error(f"Node {self.node_id} server error: {e}")
+        finally:
+            self.running = False
+
+    def stop(self):
+        """Begin a graceful shutdown; safe to call from any thread, also before serve()."""
+        with self.stop_lock:
+            self.stop_requested = True
+            loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stopping.set)
+            except RuntimeError:
+                pass # The loop has already finished
+
+    async def serve(self):
+        self.stopping = asyncio.Event()
+        with self.stop_lock:
+            self.loop = asyncio.get_running_loop()
+            if self.stop_requested:
+                self.running = False
+                logging.info(f"Node {self.node_id} stopped before serving.")
+                return
+        self.slots = asyncio.Semaphore(NODE_MAX_CONNECTIONS)
+        self.io_pool = ThreadPoolExecutor(max_workers=NODE_IO_WORKERS)
+        self.writes = set() # STORE_CHUNK handlers in flight, awaited on shutdown
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.stopping.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass # Windows, or not the main thread: stop() only
+
+        server = await asyncio.start_server(self.handle_connection, '0.0.0.0', self.port, backlog=NODE_BACKLOG)
+        logging.info(f"Node {self.node_id} listening on port {self.port} (asyncio)")
+        await self.stopping.wait()
+
+        server.close() # No new connections
+        if self.writes:
+            logging.info(f"Node {self.node_id} finishing {len(self.writes)} in-flight writes before shutdown")
+            await asyncio.wait(list(self.writes), timeout=NODE_SHUTDOWN_GRACE)
+        self.running = False
+        self.io_pool.shutdown(wait=True)
+        logging.info(f"Node {self.node_id} stopped.")
+
+    async def handle_connection(self, reader, writer):
+        """Async counterpart of handle_client."""
+        async with self.slots:
+            with self.load_lock:
+                self.active_requests += 1
+            try:
+                command = await read_json(reader)
+                if not command:
+                    return
+
+                cmd_type = command.get('type')
+                
+                if cmd_type == 'STORE_CHUNK':
+                    task = asyncio.current_task()
+                    self.writes.add(task)
+                    try:
+                        await self.store_chunk(reader, writer, command)
+                    finally:
+                        self.writes.discard(task)
+                elif cmd_type == 'RETRIEVE_CHUNK':
+                    await self.retrieve_chunk(writer, command)
+                elif cmd_type == 'DELETE_CHUNK':
+                    writer.write(pack_json(await self._in_pool(self._delete_one, command)))
+                elif cmd_type == 'DELETE_CHUNKS':
+                    writer.write(pack_json(await self._in_pool(self._delete_many, command)))
+                elif cmd_type == 'SET_QOS':
+                    writer.write(pack_json(self._set_qos(command)))
+                else:
+                    logging.warning(f"Unknown command: {cmd_type}")
+                await writer.drain()
+                    
+            except Exception as e:
+                logging.error(f"Error handling client: {e}")
+            finally:
+                writer.close()
+                with self.load_lock:
+                    self.active_requests -= 1
+
+    def _in_pool(self, func, *args):
+        return self.loop.run_in_executor(self.io_pool, func, *args)
+
+    async def store_chunk(self, reader, writer, command):
+        chunk_id = command['chunk_id']
+        size = command['size']
+        traffic_class = self.qos.traffic_class(command)
+        
+        await asyncio.sleep(self.qos.reserve(traffic_class, size, command.get('rate')))
+        try:
+            data = await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            logging.error("Failed to receive chunk data")
+            return
+        checksum = await self._in_pool(self._save_chunk, chunk_id, data, traffic_class)
+        writer.write(pack_json({'status': 'OK', 'checksum': checksum}))
+
+    async def retrieve_chunk(self, writer, command):
+        chunk_id = command['chunk_id']
+        traffic_class = self.qos.traffic_class(command)
+        data = self.cache.get(chunk_id)
+        cached = data is not None
+        if not cached:
+            data = await self._in_pool(self._load_chunk, chunk_id, traffic_class)
+        if data is None:
+            writer.write(pack_json({'status': 'ERROR', 'message': 'Chunk not found'}))
+            return
+
+        await asyncio.sleep(self.qos.reserve(traffic_class, len(data), command.get('rate')))
+        writer.write(pack_json({'status': 'OK', 'size': len(data)}))
+        writer.write(data)
+        await writer.drain()
+        self._count_served(chunk_id, len(data))
+        logging.info(f"Served chunk {chunk_id}{' (cached)' if cached else ''}")
 
 def start_node():
     if len(sys.argv) < 3:
@@ -170,7 +944,8 @@ def start_node():
     node_id = sys.argv[1]
     port = int(sys.argv[2])
     
-    node = NodeServer(node_id, port)
+    engine = AsyncNodeServer if NODE_ENGINE == 'asyncio' else NodeServer
+    node = engine(node_id, port)
     node.start()
 
 if __name__ == "__main__":
@@ -26,6 +26,7 @@ def main():
         
     print("\nCluster is running!")
     print("You can now run 'python client_app.py' to start the GUI.")
+    print("Or use 'python dfs.py' from the command line (put/get/ls/rm).")
     print("Press Ctrl+C to stop the cluster (or close the windows manually).")
     
     try:
@@ -0,0 +1,51 @@
+import socket
+import time
+import pytest
+from utils import pack_id_list, receive_json
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    from master import MasterService
+    monkeypatch.chdir(tmp_path)
+    master = MasterService(port=0)
+    for i in (1, 2, 3):
+        master.nodes[f"node_{i}"] = {'address': ('localhost', 7000 + i), 'last_heartbeat': time.time(),
+                                     'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+    master.scheduled = []
+    master._schedule_repairs = lambda *repairs: master.scheduled.append(repairs)
+    return master
+
+def report(master, node_id, chunk_ids):
+    a, b = socket.socketpair()
+    with a, b:
+        master.handle_block_report(a, {'node_id': node_id, 'chunks': pack_id_list(sorted(chunk_ids))})
+        return receive_json(b)
+
+def test_report_diffs_against_placement(master):
+    master.chunk_locations['a_chunk_0_00000001'] = ['node_1', 'node_2']
+    master.chunk_locations['a_chunk_1_00000002'] = ['node_1', 'node_3']
+    master.chunk_locations['b_chunk_0_00000003'] = ['node_2']
+    master.chunk_locations['c_chunk_0_00000005'] = ['node_2', 'node_3']
+    reply = report(master, 'node_1', ['a_chunk_0_00000001', 'b_chunk_0_00000003', 'c_chunk_0_00000005',
+                                      'stray_chunk_0_00000004'])
+    assert reply['status'] == 'OK'
+    # Lost: dropped and queued for re-replication
+    assert master.chunk_locations['a_chunk_1_00000002'] == ['node_3']
+    to_replicate, to_rebuild, excess = master.scheduled[-1]
+    assert to_replicate == ['a_chunk_1_00000002']
+    # Unknown copies of known chunks: recorded while short of REPLICATION_FACTOR, else excess
+    assert master.chunk_locations['b_chunk_0_00000003'] == ['node_2', 'node_1']
+    assert master.chunk_locations['c_chunk_0_00000005'] == ['node_2', 'node_3']
+    assert excess == [{'chunk_id': 'c_chunk_0_00000005', 'nodes': ['node_1']}]
+    assert ('node_1', 'stray_chunk_0_00000004') in master.orphans # Nothing references it
+    assert set(master.chunks.chunks_on('node_1')) == {'a_chunk_0_00000001', 'b_chunk_0_00000003'}
+
+def test_report_erasure_fragments(master):
+    master.chunk_locations['e_chunk_0_00000001'] = ['node_1', 'node_2', 'node_1']
+    master.ec_chunks['e_chunk_0_00000001'] = [2, 1]
+    report(master, 'node_1', ['e_chunk_0_00000001_frag_0'])
+    assert master.chunk_locations['e_chunk_0_00000001'] == ['node_1', 'node_2', None]
+    assert master.scheduled[-1][1] == ['e_chunk_0_00000001']
+
+def test_report_from_unknown_node(master):
+    assert report(master, 'node_9', [])['status'] == 'ERROR'
@@ -0,0 +1,66 @@
+import time
+import pytest
+from config import BLOCK_SIZE, BLOCK_SIZE_POLICY, MAX_BLOCK_SIZE, MIN_BLOCK_SIZE
+from utils import block_size_for
+
+MB = 1024**2
+
+def test_policy_picks_last_threshold_reached():
+    policy = [(256 * MB, 8 * MB), (4096 * MB, 64 * MB)]
+    assert block_size_for(0, policy, MB) == MB
+    assert block_size_for(256 * MB - 1, policy, MB) == MB
+    assert block_size_for(256 * MB, policy, MB) == 8 * MB
+    assert block_size_for(4096 * MB - 1, policy, MB) == 8 * MB
+    assert block_size_for(100 * 4096 * MB, policy, MB) == 64 * MB
+    assert block_size_for(10 * MB, [], MB) == MB
+
+def test_configured_policy_within_bounds():
+    for _, size in BLOCK_SIZE_POLICY:
+        assert MIN_BLOCK_SIZE <= size <= MAX_BLOCK_SIZE
+    assert MIN_BLOCK_SIZE <= BLOCK_SIZE <= MAX_BLOCK_SIZE
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    from master import MasterService
+    monkeypatch.chdir(tmp_path)
+    master = MasterService(port=0)
+    master.nodes['node_1'] = {'address': ('localhost', 7001), 'last_heartbeat': time.time(),
+                              'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+    return master
+
+def commit(master, filename, filesize, chunk_ids, **fields):
+    request = dict({'filename': filename, 'filesize': filesize,
+                    'chunks_placed': [{'chunk_id': cid, 'nodes': [['localhost', 7001]]} for cid in chunk_ids]}, **fields)
+    with master.lock:
+        return master._commit_upload(request, [], [])
+
+def test_plan_uses_policy_by_default(master):
+    filesize = BLOCK_SIZE_POLICY[0][0]
+    plan = master._plan_upload({'filename': 'big.bin', 'filesize': filesize})
+    assert plan['status'] == 'OK'
+    assert plan['block_size'] == BLOCK_SIZE_POLICY[0][1]
+    assert len(plan['chunks']) == filesize // plan['block_size']
+
+@pytest.mark.parametrize('block_size', [True, '8M', 8.0 * MB, [MB], MIN_BLOCK_SIZE - 1, MAX_BLOCK_SIZE + 1, 0])
+def test_plan_rejects_bad_block_size(master, block_size):
+    plan = master._plan_upload({'filename': 'a.bin', 'filesize': 10 * MB, 'block_size': block_size})
+    assert plan['status'] == 'ERROR'
+
+def test_commit_stores_planned_block_size(master):
+    plan = master._plan_upload({'filename': 'a.bin', 'filesize': 5 * MB, 'block_size': 2 * MB})
+    assert len(plan['chunks']) == 3
+    reply = commit(master, 'a.bin', 5 * MB, [c['chunk_id'] for c in plan['chunks']], block_size=2 * MB)
+    assert reply['status'] == 'OK', reply
+    assert master.files['a.bin']['block_size'] == 2 * MB
+
+@pytest.mark.parametrize('fields', [{}, {'block_size': None}, {'block_size': '2M'}, {'block_size': False},
+                                    {'block_size': MAX_BLOCK_SIZE * 2}, {'block_size': MB}])
+def test_commit_rejects_block_size_other_than_planned(master, fields):
+    plan = master._plan_upload({'filename': 'a.bin', 'filesize': 5 * MB, 'block_size': 2 * MB})
+    reply = commit(master, 'a.bin', 5 * MB, [c['chunk_id'] for c in plan['chunks']], **fields)
+    assert reply['status'] == 'ERROR'
+    assert 'a.bin' not in master.files
+
+def test_commit_cdc_chunk_count_is_free(master):
+    reply = commit(master, 'c.bin', 5 * MB, ['c.bin_chunk_0_00000001'], chunking='cdc', block_size=MB)
+    assert reply['status'] == 'OK', reply
@@ -0,0 +1,41 @@
+from node import ChunkCache
+
+def test_lru_eviction_and_stats():
+    cache = ChunkCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'5678')
+    assert cache.get('a') == b'1234' # 'b' is now least recently used
+    cache.put('c', b'90ab')
+    assert cache.get('b') is None
+    assert cache.get('c') == b'90ab'
+    cache.put('huge', b'x' * 11) # Larger than the whole budget
+    assert cache.get('huge') is None
+    stats = cache.get_stats()
+    assert stats['cache_evictions'] == 1
+    assert stats['cache_bytes'] == 8
+
+def test_put_after_invalidate_is_dropped():
+    cache = ChunkCache(max_bytes=100)
+    generation = cache.begin_read('a') # A reader starts reading the old bytes from disk
+    cache.invalidate('a')              # ...a store or delete completes meanwhile
+    cache.put('a', b'old', generation)
+    cache.end_read('a')
+    assert cache.get('a') is None
+    generation = cache.begin_read('a')
+    cache.put('a', b'new', generation)
+    cache.end_read('a')
+    assert cache.get('a') == b'new'
+
+def test_idle_invalidations_leave_no_state():
+    cache = ChunkCache(max_bytes=100)
+    for i in range(1000): # Stores and deletes of chunks nobody is reading
+        cache.invalidate(f"chunk_{i}")
+    generation = cache.begin_read('a')
+    other = cache.begin_read('a') # Two concurrent readers of the same chunk
+    cache.end_read('a')
+    assert cache.reads == {'a': [1, 0]}
+    cache.put('a', b'data', generation)
+    cache.end_read('a')
+    assert cache.reads == {}
+    assert cache.get('a') == b'data'
+    assert other == generation
@@ -0,0 +1,15 @@
+from dfs_client import DFSClient
+
+def test_batch_calls_report_failure_without_a_master_reply(tmp_path):
+    client = DFSClient()
+    client._call_master = lambda request, filename=None, shard=0: None
+    client._call_reader = lambda request, filename=None, shard=0: None
+    paths = []
+    for name, size in (('big.bin', 200000), ('tiny.txt', 10)):
+        path = tmp_path / name
+        path.write_bytes(b'x' * size)
+        paths.append(str(path))
+    messages = []
+    assert client.upload_many(paths, messages.append) == {path: False for path in paths}
+    assert any('no reply from Master' in m for m in messages)
+    assert client.download_many(['big.bin'], str(tmp_path), messages.append) == {'big.bin': False}
@@ -0,0 +1,94 @@
+import socket
+import time
+import pytest
+from utils import calculate_checksum, receive_json
+
+BLOCK = 1 << 20
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    from master import MasterService
+    monkeypatch.chdir(tmp_path)
+    master = MasterService(port=0)
+    register_nodes(master)
+    return master
+
+def register_nodes(master):
+    for i in (1, 2, 3):
+        master.nodes[f"node_{i}"] = {'address': ('localhost', 7000 + i), 'last_heartbeat': time.time(),
+                                     'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+
+def call(master, handler, request):
+    a, b = socket.socketpair()
+    with a, b:
+        handler(a, request)
+        return receive_json(b)
+
+def upload(master, filename, blocks):
+    """Upload len(blocks) chunks with dedup checksums; returns the file's chunk IDs."""
+    checksums = [calculate_checksum(block) for block in blocks]
+    plan = master._plan_upload({'filename': filename, 'filesize': BLOCK * len(blocks), 'block_size': BLOCK,
+                                'checksums': checksums})
+    assert plan['status'] == 'OK', plan
+    placed = [dict(c, checksum=checksum) for c, checksum in zip(plan['chunks'], checksums)]
+    reply = call(master, master.handle_upload_success, {'filename': filename, 'filesize': BLOCK * len(blocks),
+                                                        'block_size': BLOCK, 'chunks_placed': placed})
+    assert reply['status'] == 'OK', reply
+    return list(master.files[filename]['chunks'])
+
+def queued(master):
+    """Chunk IDs waiting for the GC on any node."""
+    return set().union(*master.gc_queue.values()) if master.gc_queue else set()
+
+def test_shared_chunk_survives_deleting_one_file(master):
+    a = upload(master, 'a.bin', [b'shared', b'only a'])
+    b = upload(master, 'b.bin', [b'shared', b'only b'])
+    assert b[0] == a[0] and b[1] != a[1] # Only the new content was planned for transfer
+    assert master.chunk_refs[a[0]] == 2
+
+    assert call(master, master.handle_delete_file, {'filename': 'a.bin'})['status'] == 'OK'
+    assert master.chunk_refs[a[0]] == 1
+    assert a[0] in master.chunk_locations
+    assert queued(master) == {a[1]}
+
+    assert call(master, master.handle_delete_file, {'filename': 'b.bin'})['status'] == 'OK'
+    assert a[0] not in master.chunk_locations
+    assert queued(master) == {a[0], a[1], b[1]}
+    assert upload(master, 'c.bin', [b'shared'])[0] != a[0] # Freed content is stored afresh
+
+def test_overwrite_frees_only_unshared_chunks(master):
+    old = upload(master, 'a.bin', [b'kept', b'replaced'])
+    new = upload(master, 'a.bin', [b'kept', b'fresh'])
+    assert new[0] == old[0] and master.chunk_refs[old[0]] == 1
+    assert master.files['a.bin']['version'] == 2
+    assert old[1] not in master.chunk_locations
+    assert queued(master) == {old[1]}
+
+def test_snapshot_keeps_chunks_of_a_deleted_file(master):
+    chunks = upload(master, 'a.bin', [b'one', b'two'])
+    assert call(master, master.handle_snapshot_create, {'name': 'daily'})['status'] == 'OK'
+    assert all(master.chunk_refs[cid] == 2 for cid in chunks)
+
+    assert call(master, master.handle_delete_file, {'filename': 'a.bin'})['status'] == 'OK'
+    assert all(master.chunk_refs[cid] == 1 for cid in chunks)
+    assert not queued(master)
+
+    assert call(master, master.handle_snapshot_delete, {'name': 'daily'})['status'] == 'OK'
+    assert queued(master) == set(chunks)
+    assert not any(cid in master.chunk_locations for cid in chunks)
+
+def test_reload_and_restore_from_a_snapshot(master):
+    from master import MasterService
+    chunks = upload(master, 'a.bin', [b'one', b'two'])
+    upload(master, 'b.bin', [b'one'])
+    call(master, master.handle_snapshot_create, {'name': 'daily'})
+    call(master, master.handle_delete_file, {'filename': 'a.bin'})
+
+    restarted = MasterService(port=0) # Reference counts come back with the metadata snapshot
+    register_nodes(restarted)
+    assert 'a.bin' not in restarted.files
+    assert [restarted.chunk_refs[cid] for cid in chunks] == [3, 1] # b.bin, and both files in the snapshot
+    assert call(restarted, restarted.handle_snapshot_restore, {'name': 'daily'})['status'] == 'OK'
+    assert list(restarted.files['a.bin']['chunks']) == chunks
+    assert [restarted.chunk_refs[cid] for cid in chunks] == [4, 2]
+    assert upload(restarted, 'c.bin', [b'two']) == [chunks[1]] # The dedup index is rebuilt too
@@ -0,0 +1,46 @@
+import json
+import pytest
+import dfs
+from dfs_client import DFSClient
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, size in (('a.bin', 10), ('b.bin', 20), ('c.bin', 30)):
+        (tmp_path / name).write_bytes(b'x' * size)
+    return tmp_path
+
+def test_multi_file_put_is_one_batch(workdir, monkeypatch, capsys):
+    calls = []
+    def upload_many(self, paths, log_callback=None, **options):
+        calls.append((list(paths), options))
+        log_callback('Upload of c.bin failed: no space')
+        return {path: not path.endswith('c.bin') for path in paths}
+    monkeypatch.setattr(DFSClient, 'upload_many', upload_many)
+    monkeypatch.setattr(DFSClient, 'upload_file', lambda *a, **k: pytest.fail('per-file upload'))
+    assert dfs.main(['--json', 'put', '--ec', '2,1', '-j', '8', '*.bin']) == 1
+    summary = json.loads(capsys.readouterr().out)
+    assert [paths for paths, _ in calls] == [['a.bin', 'b.bin', 'c.bin']]
+    assert calls[0][1]['ec'] == (2, 1) and calls[0][1]['max_in_flight'] == 8
+    assert (summary['files'], summary['failed'], summary['bytes']) == (2, 1, 30)
+    assert summary['results'][2]['error'] == 'Upload of c.bin failed: no space'
+
+def test_multi_file_get_is_one_batch(workdir, monkeypatch, capsys):
+    calls = []
+    def download_many(self, names, dest_dir, log_callback=None, max_in_flight=None):
+        calls.append(list(names))
+        for name in names:
+            (workdir / dest_dir / name).write_bytes(b'y' * 5)
+        return {name: True for name in names}
+    monkeypatch.setattr(DFSClient, 'download_many', download_many)
+    monkeypatch.setattr(DFSClient, 'download_file', lambda *a, **k: pytest.fail('per-file download'))
+    assert dfs.main(['--json', 'get', 'x', 'y', '-d', 'out']) == 0
+    assert calls == [['x', 'y']]
+    assert json.loads(capsys.readouterr().out)['bytes'] == 10
+
+def test_bad_ec_is_a_usage_error(workdir, capsys):
+    for value in ('4', 'a,b', '4,2,1'):
+        with pytest.raises(SystemExit) as exit:
+            dfs.main(['put', '--ec', value, 'a.bin'])
+        assert exit.value.code == 2
+        assert 'expected K,M' in capsys.readouterr().err
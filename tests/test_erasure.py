@@ -0,0 +1,40 @@
+import itertools
+import os
+import pytest
+from erasure import ReedSolomon, fragment_id, gf_mul, gf_inv
+
+def test_gf_inverse():
+    for a in range(1, 256):
+        assert gf_mul(a, gf_inv(a)) == 1
+
+@pytest.mark.parametrize('k,m', [(1, 0), (2, 1), (4, 2), (6, 3)])
+def test_decode_from_any_k_fragments(k, m):
+    rs = ReedSolomon(k, m)
+    data = os.urandom(1000 + k) # Not a multiple of k: exercises padding
+    fragments = rs.encode(data)
+    assert len(fragments) == k + m
+    assert len({len(f) for f in fragments}) == 1
+    for subset in itertools.combinations(range(k + m), k):
+        assert rs.decode({i: fragments[i] for i in subset}) == data
+
+def test_reconstruct_lost_fragments():
+    rs = ReedSolomon(4, 2)
+    fragments = rs.encode(os.urandom(5000))
+    available = {i: fragments[i] for i in (1, 3, 4, 5)}
+    rebuilt = rs.reconstruct(available, [0, 2])
+    assert rebuilt == {0: fragments[0], 2: fragments[2]}
+
+def test_too_few_fragments():
+    rs = ReedSolomon(4, 2)
+    fragments = rs.encode(b'data')
+    with pytest.raises(ValueError):
+        rs.decode({i: fragments[i] for i in range(3)})
+
+def test_empty_data_and_invalid_schemes():
+    rs = ReedSolomon(3, 2)
+    assert rs.decode(dict(enumerate(rs.encode(b'')))) == b''
+    with pytest.raises(ValueError):
+        ReedSolomon(0, 2)
+    with pytest.raises(ValueError):
+        ReedSolomon(200, 100)
+    assert fragment_id('f_chunk_0_0000abcd', 2) == 'f_chunk_0_0000abcd_frag_2'
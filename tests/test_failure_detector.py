@@ -0,0 +1,56 @@
+import pytest
+from failure_detector import PhiAccrualDetector, phi
+
+def regular_node(detector, node_id='n1', interval=2.0, beats=20, start=0.0):
+    for i in range(beats):
+        detector.heartbeat(node_id, start + i * interval)
+    return start + (beats - 1) * interval
+
+def test_phi_grows_with_silence():
+    values = [phi(elapsed, 2.0, 0.5) for elapsed in (1.0, 2.0, 3.0, 4.0, 6.0)]
+    assert values == sorted(values)
+    assert phi(2.0, 2.0, 0.5) == pytest.approx(0.301, abs=0.01) # Half the heartbeats come later than the mean
+
+def test_thresholds_are_crossed_in_order():
+    detector = PhiAccrualDetector([3.0, 8.0], window=100, min_std=0.5, first_interval=2.0)
+    last = regular_node(detector)
+    assert detector.expired(last + 2.0) == []
+    suspect_at = detector.next_due()
+    assert last + 2.0 < suspect_at
+    assert detector.phi('n1', suspect_at) == pytest.approx(3.0, abs=0.01)
+    assert detector.expired(suspect_at) == [('n1', 0)]
+    fail_at = detector.next_due()
+    assert detector.phi('n1', fail_at) == pytest.approx(8.0, abs=0.01)
+    assert detector.expired(fail_at) == [('n1', 1)]
+    assert detector.next_due() is None
+
+def test_heartbeat_resets_suspicion():
+    detector = PhiAccrualDetector([3.0, 8.0], window=100, min_std=0.5, first_interval=2.0)
+    last = regular_node(detector)
+    suspect_at = detector.next_due()
+    assert detector.expired(suspect_at) == [('n1', 0)]
+    detector.heartbeat('n1', suspect_at + 0.1)
+    assert detector.expired(suspect_at + 1.0) == []
+    assert detector.next_due() > suspect_at + 2.0
+
+def test_irregular_nodes_get_more_slack():
+    detector = PhiAccrualDetector([8.0], window=100, min_std=0.1, first_interval=2.0)
+    regular_node(detector, 'steady', interval=2.0)
+    t = 0.0
+    for i in range(20):
+        t += 1.0 if i % 2 else 3.0 # Same mean, much larger deviation
+        detector.heartbeat('jittery', t)
+    steady_last, jittery_last = detector.last['steady'], detector.last['jittery']
+    assert detector.due['jittery'] - jittery_last > detector.due['steady'] - steady_last
+
+def test_window_and_defer():
+    detector = PhiAccrualDetector([3.0], window=5, min_std=0.1, first_interval=2.0)
+    regular_node(detector, interval=10.0, beats=10)
+    regular_node(detector, interval=1.0, beats=6, start=100.0)
+    mean, _ = detector.stats('n1')
+    assert mean == pytest.approx(1.0) # Only the last 5 intervals count
+    due = detector.next_due()
+    detector.defer(5.0)
+    assert detector.next_due() == pytest.approx(due + 5.0)
+    detector.forget('n1')
+    assert detector.next_due() is None
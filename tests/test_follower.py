@@ -0,0 +1,118 @@
+import base64
+import socket
+import threading
+import time
+import pytest
+from utils import receive_json
+
+BLOCK = 1 << 20
+
+class Leader:
+    """Serves a MasterService's RPCs on an ephemeral port."""
+    def __init__(self, master):
+        self.master = master
+        self.sock = socket.socket()
+        self.sock.bind(('localhost', 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.master.handle_client, args=(conn,), daemon=True).start()
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    from master import MasterService
+    from follower import FollowerService
+    monkeypatch.chdir(tmp_path)
+    master = MasterService(port=0)
+    for i in (1, 2, 3):
+        master.nodes[f"node_{i}"] = {'address': ('localhost', 7000 + i), 'last_heartbeat': time.time(),
+                                     'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+    leader = Leader(master)
+    follower = FollowerService(0, 'localhost', leader.port)
+    full_loads = []
+    load_full = follower._load_full
+    monkeypatch.setattr(follower, '_load_full', lambda snapshot: (full_loads.append(len(snapshot)), load_full(snapshot)))
+    yield master, follower, full_loads
+    leader.sock.close()
+
+def call(master, handler, request):
+    a, b = socket.socketpair()
+    with a, b:
+        handler(a, request)
+        return receive_json(b)
+
+def upload(master, filename, blocks=2):
+    plan = master._plan_upload({'filename': filename, 'filesize': BLOCK * blocks, 'block_size': BLOCK})
+    reply = call(master, master.handle_upload_success, {'filename': filename, 'filesize': BLOCK * blocks,
+                                                        'block_size': BLOCK, 'chunks_placed': plan['chunks']})
+    assert reply['status'] == 'OK', reply
+
+def assert_same_metadata(master, follower):
+    assert {name: master._wire_meta(meta) for name, meta in master.files.items()} == \
+           {name: follower._wire_meta(meta) for name, meta in follower.files.items()}
+    assert {name: master._wire_snapshot(snap) for name, snap in master.snapshots.items()} == \
+           {name: follower._wire_snapshot(snap) for name, snap in follower.snapshots.items()}
+    chunk_ids = {cid for meta in master._all_file_metas() for cid in meta['chunks']}
+    assert chunk_ids == {cid for meta in follower._all_file_metas() for cid in meta['chunks']}
+    for cid in chunk_ids:
+        assert follower.chunk_locations[cid] == master.chunk_locations[cid], cid
+        assert follower.chunk_refs[cid] == master.chunk_refs[cid], cid
+
+def test_follower_applies_journal_deltas(cluster):
+    master, follower, full_loads = cluster
+    upload(master, 'a.bin')
+    follower.sync_once(wait=0)
+    assert len(full_loads) == 1 # A new follower starts from the full snapshot
+    assert_same_metadata(master, follower)
+
+    upload(master, 'b.bin', 3)
+    upload(master, 'a.bin', 1) # Overwrite: the old chunks lose their only reference
+    call(master, master.handle_snapshot_create, {'name': 'daily'})
+    call(master, master.handle_clone, {'src': 'b.bin', 'dst': 'c.bin'})
+    call(master, master.handle_rename, {'src': 'c.bin', 'dst': 'd.bin'})
+    call(master, master.handle_delete_file, {'filename': 'b.bin'})
+    data = b'tiny file body'
+    call(master, master.handle_upload_inline, {'filename': 't.txt', 'filesize': len(data),
+                                               'data': base64.b64encode(data).decode('ascii')})
+    with master.lock:
+        cid = master.files['d.bin']['chunks'][0]
+        master.chunk_locations[cid] = ['node_3'] # A repair moved a replica
+    follower.sync_once(wait=0)
+    assert len(full_loads) == 1
+    assert follower.synced_seq == master.journal_seq
+    assert_same_metadata(master, follower)
+    assert base64.b64decode(follower.files['t.txt']['inline']) == data
+
+    call(master, master.handle_snapshot_delete, {'name': 'daily'})
+    follower.sync_once(wait=0)
+    assert len(full_loads) == 1
+    assert_same_metadata(master, follower)
+
+def test_follower_resyncs_fully_from_a_new_leader_process(cluster):
+    master, follower, full_loads = cluster
+    upload(master, 'a.bin')
+    follower.sync_once(wait=0)
+    master.epoch = 'restarted' # As after a leader restart: its journal means nothing to us
+    upload(master, 'b.bin')
+    follower.sync_once(wait=0)
+    assert len(full_loads) == 2
+    assert follower.leader_epoch == 'restarted'
+    assert_same_metadata(master, follower)
+
+def test_follower_behind_the_journal_gets_a_snapshot(cluster):
+    master, follower, full_loads = cluster
+    follower.sync_once(wait=0)
+    with master.journal_cond:
+        master.journal.clear() # Entries the follower never saw have been trimmed
+        master.journal_seq += 5
+    upload(master, 'a.bin')
+    follower.sync_once(wait=0)
+    assert len(full_loads) == 2
+    assert_same_metadata(master, follower)
@@ -0,0 +1,108 @@
+import socket
+import threading
+import time
+import pytest
+import master as master_module
+from node import NodeServer
+from utils import receive_json, send_json
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def test_delete_batch_defers_once_under_foreground_load(workdir):
+    node = NodeServer('n1', 0, master_port=1, durability='none')
+    ids = [f"c_chunk_{i}_{i:08x}" for i in range(20)]
+    for cid in ids:
+        node._save_chunk(cid, b'data', 'foreground')
+    node.qos.begin_io('foreground') # A foreground transfer that outlasts the batch
+    try:
+        start = time.time()
+        reply = node._delete_many({'chunk_ids': ids + ['never_stored'], 'qos': 'background'})
+        elapsed = time.time() - start
+    finally:
+        node.qos.end_io('foreground')
+    assert reply == {'status': 'OK', 'deleted': 20}
+    assert elapsed < 2 * master_module.QOS_MAX_DEFER
+    assert node.qos.get_stats()['qos_deferred_io'] == 1
+    assert not node.tier_of
+
+def test_gc_gives_up_on_a_silent_node(workdir, monkeypatch):
+    monkeypatch.setattr(master_module, 'GC_RPC_TIMEOUT', 0.2)
+    silent = socket.socket()
+    silent.bind(('localhost', 0))
+    silent.listen()
+    master = master_module.MasterService(port=0)
+    master.nodes['node_1'] = {'address': silent.getsockname(), 'last_heartbeat': time.time(),
+                              'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+    master.gc_queue['node_1'] = {'a_chunk_0_00000001'}
+    gc = threading.Thread(target=master.gc_loop, daemon=True)
+    gc.start()
+    master.gc_wakeup.set()
+    try:
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            time.sleep(0.05)
+            with master.lock:
+                if master.gc_queue.get('node_1') and gc.is_alive():
+                    break
+        with master.lock:
+            assert master.gc_queue.get('node_1') == {'a_chunk_0_00000001'} # Requeued for the next pass
+    finally:
+        master.running = False
+        master.gc_wakeup.set()
+        silent.close()
+
+class FakeNode:
+    """Acknowledges every DELETE_CHUNKS and records the chunk IDs of each request."""
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('localhost', 0))
+        self.sock.listen()
+        self.requests = []
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                request = receive_json(conn)
+                self.requests.append(request['chunk_ids'])
+                send_json(conn, {'status': 'OK', 'deleted': len(request['chunk_ids'])})
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not condition():
+        time.sleep(0.02)
+    return condition()
+
+def test_gc_batches_per_node_and_waits_for_offline_nodes(workdir, monkeypatch):
+    monkeypatch.setattr(master_module, 'GC_BATCH_SIZE', 3)
+    node = FakeNode()
+    master = master_module.MasterService(port=0)
+    master.nodes['node_1'] = {'address': node.sock.getsockname(), 'last_heartbeat': time.time(),
+                              'status': 'OFFLINE', 'stats': {}, 'reported': True, 'draining': False}
+    ids = [f"a_chunk_{i}_{i:08x}" for i in range(7)]
+    master._cleanup_chunks([{'chunk_id': cid, 'nodes': ['node_1']} for cid in ids])
+    gc = threading.Thread(target=master.gc_loop, daemon=True)
+    gc.start()
+    try:
+        time.sleep(0.2)
+        assert node.requests == [] # Kept until the node is back
+        with master.lock:
+            assert master.gc_queue['node_1'] == set(ids)
+            master.nodes['node_1']['status'] = 'ONLINE'
+        master.gc_wakeup.set()
+        assert wait_for(lambda: sum(map(len, node.requests)) == len(ids))
+        assert sorted(map(len, node.requests)) == [1, 3, 3] # Full batches run back to back
+        assert sorted(sum(node.requests, [])) == ids
+        assert wait_for(lambda: not master.gc_queue)
+    finally:
+        master.running = False
+        master.gc_wakeup.set()
+        node.sock.close()
+
@@ -0,0 +1,88 @@
+import base64
+import os
+import pytest
+import master as master_module
+from metastore import save_snapshot
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def put(master, filename, data):
+    with master.lock:
+        reply = master._commit_inline({'filename': filename, 'filesize': len(data),
+                                       'data': base64.b64encode(data).decode('ascii')}, [])
+        master.save_metadata()
+    return reply
+
+def body(master, filename):
+    with master.lock:
+        return base64.b64decode(master._download_plan(filename)['inline'])
+
+def test_bodies_live_outside_the_snapshot(workdir):
+    master = master_module.MasterService(port=0)
+    data = os.urandom(4000)
+    assert put(master, 'a.txt', data)['status'] == 'OK'
+    assert 'inline' not in master.files['a.txt']
+    with open(master.metadata_file, 'rb') as f:
+        assert base64.b64encode(data) not in f.read()
+    assert body(master, 'a.txt') == data
+
+    restarted = master_module.MasterService(port=0)
+    assert body(restarted, 'a.txt') == data
+    assert restarted._wire_meta(restarted.files['a.txt'])['inline'] == base64.b64encode(data).decode('ascii')
+
+def test_rejects_inconsistent_bodies(workdir):
+    master = master_module.MasterService(port=0)
+    with master.lock:
+        short = master._commit_inline({'filename': 'a.txt', 'filesize': 10, 'data': base64.b64encode(b'abc').decode()}, [])
+        garbage = master._commit_inline({'filename': 'b.txt', 'filesize': 3, 'data': 'not base64!'}, [])
+        big = os.urandom(master_module.INLINE_THRESHOLD + 1)
+        too_big = master._commit_inline({'filename': 'c.txt', 'filesize': len(big), 'data': base64.b64encode(big).decode()}, [])
+    assert [short['status'], garbage['status'], too_big['status']] == ['ERROR'] * 3
+    assert master.files == {}
+    assert master.inline_store.size == 0
+
+def test_compaction_drops_dead_bodies(workdir, monkeypatch):
+    monkeypatch.setattr(master_module, 'INLINE_COMPACT_BYTES', 10000)
+    master = master_module.MasterService(port=0)
+    keep = os.urandom(1000)
+    put(master, 'keep.txt', keep)
+    for i in range(30):
+        put(master, 'churn.txt', os.urandom(1000)) # Every overwrite leaves a dead body
+    last = os.urandom(1000)
+    put(master, 'churn.txt', last)
+    assert master.inline_store.generation > 0
+    assert master.inline_store.size < 20000
+    generations = [name for name in os.listdir('.') if name.startswith('dfs_metadata.inline.')]
+    assert generations == [f"dfs_metadata.inline.{master.inline_store.generation}"]
+
+    restarted = master_module.MasterService(port=0)
+    assert body(restarted, 'keep.txt') == keep
+    assert body(restarted, 'churn.txt') == last
+
+def test_snapshot_shares_body_with_live_file(workdir, monkeypatch):
+    monkeypatch.setattr(master_module, 'INLINE_COMPACT_BYTES', 0)
+    master = master_module.MasterService(port=0)
+    data = os.urandom(500)
+    put(master, 'a.txt', data)
+    with master.lock:
+        master.snapshots['s1'] = {'created': 0, 'files': {'a.txt': dict(master.files['a.txt'])}}
+        master.save_metadata()
+    put(master, 'a.txt', os.urandom(500))
+    put(master, 'a.txt', os.urandom(500)) # Compacts: the snapshot's body must survive
+    with master.lock:
+        assert base64.b64decode(master._inline_body(master.snapshots['s1']['files']['a.txt'])) == data
+
+def test_old_snapshot_bodies_are_migrated(workdir):
+    master = master_module.MasterService(port=0)
+    data = b'legacy inline body'
+    files = {'old.txt': {'size': len(data), 'chunks': master.chunks.chunk_list([]), 'codec': 'none',
+                         'inline': base64.b64encode(data).decode('ascii')}}
+    save_snapshot(master.metadata_file, master.chunks, files, {})
+
+    restarted = master_module.MasterService(port=0)
+    assert 'inline' not in restarted.files['old.txt']
+    assert body(restarted, 'old.txt') == data
+    assert body(master_module.MasterService(port=0), 'old.txt') == data
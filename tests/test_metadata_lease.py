@@ -0,0 +1,68 @@
+import threading
+import time
+import pytest
+import master as master_module
+
+LEASE = 0.3
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(master_module, 'METADATA_LEASE', LEASE)
+    master = master_module.MasterService(port=0)
+    master.files['a.txt'] = {'size': 3, 'chunks': [], 'codec': 'none', 'inline': 'YWJj', 'version': 1}
+    return master
+
+def read_plan(master, filename='a.txt'):
+    with master.lock:
+        plan = master._download_plan(filename)
+        return master._leased({}, plan, master._grant_lease(filename, plan))
+
+def test_write_waits_for_cached_plans(master):
+    assert read_plan(master)['lease'] == LEASE
+    start = time.time()
+    with master._honoring_leases(['a.txt']):
+        waited = time.time() - start
+    assert waited >= LEASE * 0.9
+    assert master.lease_waits == {}
+    assert 'a.txt' not in master.read_leases
+
+def test_unleased_file_writes_at_once(master):
+    read_plan(master)
+    start = time.time()
+    with master._honoring_leases(['b.txt']):
+        pass
+    assert time.time() - start < LEASE / 2
+
+def test_no_lease_while_write_waits(master):
+    read_plan(master)
+    entered = threading.Event()
+    def write():
+        with master._honoring_leases(['a.txt']):
+            entered.set()
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.05)
+    assert not entered.is_set()
+    assert read_plan(master)['lease'] == 0 # Would outlive the write otherwise
+    writer.join()
+    assert entered.is_set()
+    assert read_plan(master)['lease'] == LEASE
+
+def test_namespace_write_waits_for_every_lease(master):
+    read_plan(master)
+    start = time.time()
+    with master._honoring_leases(None):
+        assert read_plan(master)['lease'] == 0
+    assert time.time() - start >= LEASE * 0.9
+
+def test_missing_file_gets_no_lease(master):
+    assert read_plan(master, 'missing.txt')['status'] == 'ERROR'
+    assert master.read_leases == {}
+
+def test_expired_leases_are_forgotten(master):
+    read_plan(master)
+    time.sleep(LEASE)
+    with master.lock:
+        master._expire_leases()
+    assert master.read_leases == {}
@@ -0,0 +1,88 @@
+import time
+import pytest
+from metastore import ChunkTable, save_snapshot, load_snapshot
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def make_table():
+    table = ChunkTable()
+    ids = [f"movie.mkv_chunk_{i}_{i:08x}" for i in range(5)] + ['legacy-chunk-id']
+    for i, cid in enumerate(ids):
+        table.locations[cid] = ['node_1', 'node_2'] if i % 2 else ['node_3', None]
+        table.checksums[cid] = f"{i + 1:064x}"
+    files = {'movie.mkv': {'size': 5 << 20, 'chunks': table.chunk_list(ids[:5]), 'codec': 'none', 'version': 2},
+             'old.bin': {'size': 10, 'chunks': table.chunk_list(ids[5:]), 'codec': 'zlib', 'version': 1}}
+    return table, files, ids
+
+def test_snapshot_round_trip(workdir):
+    table, files, ids = make_table()
+    snapshots = {'nightly': {'created': 1.5, 'files': {'movie.mkv': dict(files['movie.mkv'])}}}
+    save_snapshot('meta.bin', table, files, snapshots)
+    loaded, loaded_files, loaded_snapshots = load_snapshot('meta.bin')
+
+    assert loaded.live_chunks() == len(ids)
+    for cid in ids:
+        assert loaded.locations[cid] == table.locations[cid]
+        assert loaded.checksums[cid] == table.checksums[cid]
+    assert list(loaded_files['movie.mkv']['chunks']) == ids[:5]
+    assert list(loaded_files['old.bin']['chunks']) == ids[5:]
+    assert loaded_files['movie.mkv']['version'] == 2
+    assert list(loaded_snapshots['nightly']['files']['movie.mkv']['chunks']) == ids[:5]
+
+def test_new_chunks_after_load(workdir):
+    table, files, ids = make_table()
+    save_snapshot('meta.bin', table, files, {})
+    loaded, _, _ = load_snapshot('meta.bin')
+    # A filename the snapshot has never seen, before anything built the ID index
+    new_id = "fresh.txt_chunk_0_0badcafe"
+    loaded.locations[new_id] = ['node_1']
+    assert loaded.handle(new_id) is not None
+    assert loaded.locations[new_id] == ['node_1']
+    assert loaded.locations[ids[0]] == table.locations[ids[0]]
+
+def test_chunks_on_follows_location_changes(workdir):
+    table, files, ids = make_table()
+    on_node_1 = {cid for i, cid in enumerate(ids) if i % 2}
+    assert set(table.chunks_on('node_1')) == on_node_1 # Index built here, then kept up to date
+    table.locations[ids[0]] = ['node_1', None]
+    table.locations[ids[1]] = ['node_2']
+    del table.locations[ids[3]]
+    expected = on_node_1 - {ids[1], ids[3]} | {ids[0]}
+    assert set(table.chunks_on('node_1')) == expected
+    assert set(table.chunks_on('node_3')) == {ids[2], ids[4]}
+    assert table.chunks_on('node_9') == []
+
+    save_snapshot('meta.bin', table, files, {})
+    loaded, _, _ = load_snapshot('meta.bin')
+    assert set(loaded.chunks_on('node_1')) == expected
+    table.locations[ids[5]] = ['node_9']
+    assert set(table.chunks_on('node_9')) == {ids[5]}
+
+def register_node(master, node_id='node_1', port=7001):
+    master.nodes[node_id] = {'address': ('localhost', port), 'last_heartbeat': time.time(),
+                             'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+
+def upload(master, filename, filesize):
+    plan = master._plan_upload({'filename': filename, 'filesize': filesize})
+    assert plan['status'] == 'OK', plan
+    placed = [{'chunk_id': c['chunk_id'], 'nodes': c['nodes']} for c in plan['chunks']]
+    with master.lock:
+        reply = master._commit_upload({'filename': filename, 'filesize': filesize, 'block_size': plan['block_size'],
+                                       'chunks_placed': placed}, [], [])
+        master.save_metadata()
+    return reply
+
+def test_upload_after_master_restart(workdir):
+    from master import MasterService
+    master = MasterService(port=0)
+    register_node(master)
+    assert upload(master, 'before.bin', 3 << 20)['status'] == 'OK'
+
+    restarted = MasterService(port=0) # Loads the snapshot the first one saved
+    assert list(restarted.files['before.bin']['chunks']) == list(master.files['before.bin']['chunks'])
+    register_node(restarted)
+    assert upload(restarted, 'after.bin', 2 << 20)['status'] == 'OK'
+    assert len(restarted.files['after.bin']['chunks']) == 2
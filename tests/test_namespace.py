@@ -0,0 +1,68 @@
+import socket
+import time
+import pytest
+from utils import receive_json
+
+BLOCK = 1 << 20
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    from master import MasterService
+    monkeypatch.chdir(tmp_path)
+    master = MasterService(port=0)
+    for i in (1, 2):
+        master.nodes[f"node_{i}"] = {'address': ('localhost', 7000 + i), 'last_heartbeat': time.time(),
+                                     'status': 'ONLINE', 'stats': {}, 'reported': True, 'draining': False}
+    return master
+
+def call(master, handler, request):
+    a, b = socket.socketpair()
+    with a, b:
+        handler(a, request)
+        return receive_json(b)
+
+def upload(master, filename, blocks=2):
+    plan = master._plan_upload({'filename': filename, 'filesize': BLOCK * blocks, 'block_size': BLOCK})
+    reply = call(master, master.handle_upload_success, {'filename': filename, 'filesize': BLOCK * blocks,
+                                                        'block_size': BLOCK, 'chunks_placed': plan['chunks']})
+    assert reply['status'] == 'OK', reply
+    return list(master.files[filename]['chunks'])
+
+def test_rename_moves_metadata_only(master):
+    chunks = upload(master, 'a.bin')
+    locations = {cid: list(master.chunk_locations[cid]) for cid in chunks}
+    assert call(master, master.handle_rename, {'src': 'a.bin', 'dst': 'b.bin'})['status'] == 'OK'
+    assert 'a.bin' not in master.files
+    assert list(master.files['b.bin']['chunks']) == chunks
+    assert {cid: master.chunk_locations[cid] for cid in chunks} == locations
+    assert all(master.chunk_refs[cid] == 1 for cid in chunks)
+    assert not master.gc_queue
+
+def test_rename_onto_an_existing_file(master):
+    upload(master, 'a.bin')
+    replaced = upload(master, 'b.bin')
+    assert call(master, master.handle_rename, {'src': 'a.bin', 'dst': 'b.bin'})['status'] == 'ERROR'
+    reply = call(master, master.handle_rename, {'src': 'a.bin', 'dst': 'b.bin', 'overwrite': True})
+    assert reply == {'status': 'OK', 'version': 2}
+    assert set().union(*master.gc_queue.values()) == set(replaced)
+
+def test_clone_shares_chunks_until_both_are_gone(master):
+    chunks = upload(master, 'a.bin')
+    assert call(master, master.handle_clone, {'src': 'a.bin', 'dst': 'b.bin'})['status'] == 'OK'
+    assert list(master.files['b.bin']['chunks']) == chunks
+    assert all(master.chunk_refs[cid] == 2 for cid in chunks)
+
+    upload(master, 'a.bin') # Copy-on-write: overwriting the source leaves the clone intact
+    assert all(master.chunk_refs[cid] == 1 for cid in chunks)
+    assert all(cid in master.chunk_locations for cid in chunks)
+    call(master, master.handle_delete_file, {'filename': 'b.bin'})
+    assert set().union(*master.gc_queue.values()) == set(chunks)
+
+def test_clone_from_a_snapshot(master):
+    chunks = upload(master, 'a.bin')
+    call(master, master.handle_snapshot_create, {'name': 'daily'})
+    call(master, master.handle_delete_file, {'filename': 'a.bin'})
+    assert call(master, master.handle_clone, {'src': 'a.bin', 'dst': 'a.bin'})['status'] == 'ERROR'
+    assert call(master, master.handle_clone, {'src': 'a.bin', 'dst': 'a.bin', 'snapshot': 'daily'})['status'] == 'OK'
+    assert list(master.files['a.bin']['chunks']) == chunks
+    assert call(master, master.handle_clone, {'src': 'a.bin', 'dst': 'c.bin', 'snapshot': 'weekly'})['status'] == 'ERROR'
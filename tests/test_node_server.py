@@ -0,0 +1,30 @@
+import asyncio
+import threading
+import time
+import pytest
+from node import AsyncNodeServer
+
+@pytest.fixture
+def node(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return AsyncNodeServer('test', 0, master_port=1)
+
+def test_stop_before_serve(node):
+    node.stop() # Not serving yet: must not raise, and must not be lost
+    server = threading.Thread(target=asyncio.run, args=(node.serve(),))
+    server.start()
+    server.join(timeout=5)
+    assert not server.is_alive()
+    assert not node.running
+
+def test_stop_ends_serve(node):
+    server = threading.Thread(target=asyncio.run, args=(node.serve(),))
+    server.start()
+    deadline = time.time() + 5
+    while node.loop is None and time.time() < deadline:
+        time.sleep(0.01)
+    node.stop()
+    server.join(timeout=10)
+    assert not server.is_alive()
+    assert not node.running
+    node.stop() # Loop already closed: nothing left to do
@@ -0,0 +1,69 @@
+import os
+import threading
+import pytest
+from node import NodeServer, PART_SUFFIX
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def store_concurrently(node, chunk_id, payloads):
+    errors = []
+    def store(data):
+        try:
+            node._save_chunk(chunk_id, data, 'foreground')
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=store, args=(data,)) for data in payloads]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+@pytest.mark.parametrize('durability', ['none', 'fsync', 'group'])
+def test_concurrent_stores_of_one_chunk(workdir, durability):
+    node = NodeServer('n1', 0, master_port=1, durability=durability)
+    data = os.urandom(256 * 1024)
+    assert store_concurrently(node, 'shared_chunk', [data] * 16) == []
+    with open(os.path.join(node.storage_path, 'shared_chunk'), 'rb') as f:
+        assert f.read() == data
+    assert not [name for name in os.listdir(node.storage_path) if name.endswith(PART_SUFFIX)]
+    assert node.tier_of['shared_chunk'][2] == len(data)
+
+def test_startup_sweeps_unfinished_writes(workdir):
+    node = NodeServer('n1', 0, master_port=1, durability='none')
+    node._save_chunk('kept', b'done', 'foreground')
+    with open(os.path.join(node.storage_path, f"torn.0123abcd{PART_SUFFIX}"), 'wb') as f:
+        f.write(b'half')
+    restarted = NodeServer('n1', 0, master_port=1, durability='none')
+    assert sorted(os.listdir(restarted.storage_path)) == ['kept']
+    assert set(restarted.inventory) == {'kept'}
+
+def test_group_commit_batches_writers(tmp_path):
+    from node import GroupCommitter
+    committer = GroupCommitter(str(tmp_path), window=0.05)
+    def write(i):
+        part = tmp_path / f"c{i}.{i:08x}{PART_SUFFIX}"
+        part.write_bytes(b'x' * i)
+        committer.commit(str(part), str(tmp_path / f"c{i}"))
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"c{i}" for i in range(8))
+    stats = committer.get_stats()
+    assert stats['commit_batches'] < 8
+    assert stats['commit_batch_avg'] > 1
+
+def test_group_commit_reports_failure(tmp_path):
+    from node import GroupCommitter
+    committer = GroupCommitter(str(tmp_path), window=0)
+    with pytest.raises(OSError):
+        committer.commit(str(tmp_path / f"missing{PART_SUFFIX}"), str(tmp_path / 'missing'))
+    part = tmp_path / f"ok{PART_SUFFIX}"
+    part.write_bytes(b'data')
+    committer.commit(str(part), str(tmp_path / 'ok')) # The failed batch did not wedge the committer
+    assert (tmp_path / 'ok').read_bytes() == b'data'
@@ -0,0 +1,23 @@
+import time
+from master import MasterService
+
+def test_failed_move_does_not_end_the_pass(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    master = MasterService(port=0)
+    master.rebalance['bandwidth'] = 0
+    for node_id, stored in (('full', 10 << 20), ('empty', 0)):
+        master.nodes[node_id] = {'address': ('localhost', 0), 'last_heartbeat': time.time(), 'status': 'ONLINE',
+                                 'stats': {'stored_bytes': stored, 'disk_free': 10 << 20}, 'reported': True}
+    for i in range(10):
+        master.chunk_locations[f"f.bin_chunk_{i}_{i:08x}"] = ['full']
+
+    attempts = []
+    def move(chunk_id, index, src, dst):
+        attempts.append(chunk_id)
+        if len(attempts) == 1:
+            raise ConnectionError(f"could not copy {chunk_id} from {src} to {dst}")
+        return 1 << 20
+    master._move_chunk = move
+
+    assert master.rebalance_pass() > 0
+    assert len(attempts) > 1
@@ -0,0 +1,27 @@
+import os
+import socket
+import threading
+from utils import recv_all
+
+def test_recv_all_reassembles_large_message():
+    data = os.urandom(8 * 1024**2 + 123)
+    a, b = socket.socketpair()
+    with a, b:
+        sender = threading.Thread(target=a.sendall, args=(data,))
+        sender.start()
+        received = recv_all(b, len(data))
+        sender.join()
+    assert received == data
+    assert isinstance(received, bytes)
+
+def test_recv_all_short_read():
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(b'abc')
+        a.close()
+        assert recv_all(b, 4) is None
+
+def test_recv_all_zero_bytes():
+    a, b = socket.socketpair()
+    with a, b:
+        assert recv_all(b, 0) == b''
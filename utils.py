@@ -1,7 +1,24 @@
 import json
+import base64
 import hashlib
 import struct
 import socket
+import zlib
+import lzma
+import random
+import numpy as np
+
+# Optional codecs, used only when the packages are installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+CODECS = ('none', 'zlib', 'lzma', 'zstd', 'lz4')
 
 def send_json(sock, data):
     """
@@ -13,6 +30,24 @@ def send_json(sock, data):
     sock.sendall(struct.pack('>I', len(data_bytes)))
     sock.sendall(data_bytes)
 
+def pack_json(data):
+    """
+    A JSON object in send_json's wire format, for asyncio stream writers.
+    """
+    data_bytes = json.dumps(data).encode('utf-8')
+    return struct.pack('>I', len(data_bytes)) + data_bytes
+
+async def read_json(reader):
+    """
+    Receive a JSON object sent with send_json from an asyncio StreamReader (None on EOF).
+    """
+    try:
+        len_bytes = await reader.readexactly(4)
+        msg_bytes = await reader.readexactly(struct.unpack('>I', len_bytes)[0])
+    except EOFError: # asyncio.IncompleteReadError; asyncio itself stays unimported for plain clients
+        return None
+    return json.loads(msg_bytes.decode('utf-8'))
+
 def receive_json(sock):
     """
     Receive a JSON object from a socket.
@@ -32,13 +67,17 @@ def recv_all(sock, n):
     """
     Helper to receive exactly n bytes.
     """
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
+    # Fill one preallocated buffer: appending packet by packet copies the data
+    # received so far on every recv, quadratic in n for multi-MB chunks
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:])
+        if not got:
             return None
-        data += packet
-    return data
+        pos += got
+    return bytes(buf)
 
 def calculate_checksum(data):
     """
@@ -57,3 +96,133 @@ def calculate_file_checksum(filepath):
         for chunk in iter(lambda: f.read(4096), b''):
             sha256.update(chunk)
     return sha256.hexdigest()
+
+def pack_id_list(ids):
+    """
+    Encode a list of chunk IDs compactly for block reports (IDs share long prefixes).
+    """
+    return base64.b64encode(zlib.compress('\n'.join(ids).encode('utf-8'))).decode('ascii')
+
+def unpack_id_list(blob):
+    data = zlib.decompress(base64.b64decode(blob)).decode('utf-8')
+    return data.split('\n') if data else []
+
+def shard_of(filename, num_shards):
+    """Master shard owning filename in a federated namespace (crc32: stable across processes, unlike hash())."""
+    return zlib.crc32(filename.encode('utf-8')) % num_shards if num_shards > 1 else 0
+
+def block_size_for(filesize, policy, default):
+    """Block size for a new file: the last (min_size, block_size) policy entry filesize reaches, else default."""
+    block_size = default
+    for min_size, size in policy:
+        if filesize >= min_size:
+            block_size = size
+    return block_size
+
+def available_codecs():
+    """
+    Return the chunk codecs usable in this process.
+    """
+    codecs = ['none', 'zlib', 'lzma']
+    if zstandard is not None:
+        codecs.append('zstd')
+    if lz4_frame is not None:
+        codecs.append('lz4')
+    return codecs
+
+def compress_data(data, codec):
+    """
+    Compress chunk bytes with the named codec ('none' returns data unchanged).
+    """
+    if codec in (None, 'none'):
+        return data
+    if codec == 'zlib':
+        return zlib.compress(data, 6)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=1)
+    if codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == 'lz4' and lz4_frame is not None:
+        return lz4_frame.compress(data)
+    raise ValueError(f"Codec not available: {codec}")
+
+def decompress_data(data, codec):
+    """
+    Reverse compress_data for the named codec.
+    """
+    if codec in (None, 'none'):
+        return data
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    if codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'lz4' and lz4_frame is not None:
+        return lz4_frame.decompress(data)
+    raise ValueError(f"Codec not available: {codec}")
+
+# Gear table for content-defined chunking; fixed seed so every client agrees on boundaries
+_gear_rng = random.Random(0x5EED)
+_GEAR = np.array([_gear_rng.getrandbits(32) for _ in range(256)], dtype=np.uint32)
+_CDC_READ_SIZE = 8 * 1024 * 1024 # Bytes hashed per numpy pass
+
+def iter_fixed_chunks(f, block_size):
+    """
+    Yield consecutive block_size pieces of an open binary file.
+    """
+    for block in iter(lambda: f.read(block_size), b''):
+        yield block
+
+def _gear_hashes(data):
+    """
+    Gear hash after every byte of data: h[i] = sum(GEAR[data[i - j]] << j, j < 32)
+    mod 2**32, the state of the rolling hash once 32 bytes have gone through it.
+    Built by doubling the window five times instead of one Python step per byte.
+    """
+    h = _GEAR.take(np.frombuffer(data, dtype=np.uint8))
+    shifted = np.empty_like(h)
+    for shift in (1, 2, 4, 8, 16):
+        np.left_shift(h[:-shift], shift, out=shifted[:-shift])
+        h[shift:] += shifted[:-shift]
+    return h
+
+def iter_cdc_chunks(f, avg_size):
+    """
+    Yield content-defined chunks of an open binary file (gear rolling hash).
+    Boundaries depend only on nearby bytes, so an insertion only changes the
+    chunks around it. Chunk sizes stay within [avg_size / 4, avg_size * 4].
+    """
+    min_size = max(64, avg_size // 4)
+    max_size = avg_size * 4
+    bits = max(1, (avg_size - min_size).bit_length() - 1)
+    mask = np.uint32(((1 << bits) - 1) << (32 - bits))  # Top bits depend on the most bytes
+
+    buf = b''
+    hashes = np.empty(0, dtype=np.uint32)
+    eof = False
+    while not eof:
+        more = f.read(max(max_size, _CDC_READ_SIZE))
+        eof = not more
+        # The hash only looks 32 bytes back: new bytes need the last 31 old ones
+        history = buf[-31:]
+        hashes = np.concatenate((hashes, _gear_hashes(history + more)[len(history):]))
+        buf += more
+        # Every position that may end a chunk; none lies within min_size (>= 64)
+        # bytes of a chunk start, so the first 31 hashes of buf never matter
+        cuts = np.flatnonzero((hashes & mask) == 0) + 1
+        start = 0
+        while start < len(buf):
+            index = np.searchsorted(cuts, start + min_size + 1)
+            if index < len(cuts) and cuts[index] <= start + max_size:
+                cut = int(cuts[index])
+            elif len(buf) - start >= max_size:
+                cut = start + max_size
+            elif eof:
+                cut = len(buf)
+            else:
+                break # Need more bytes to place this boundary
+            yield buf[start:cut]
+            start = cut
+        buf = buf[start:]
+        hashes = hashes[start:]